@@ -0,0 +1,85 @@
+"""
+Size savings and export time of compact Anki media.
+
+Generates synthetic 720p webm clips with ffmpeg, then exports them as a
+deck with the original clips, with compact renditions (cold cache) and
+again with the renditions already cached.
+
+Usage (from apps/backend):
+    python -m benchmarks.anki_compact --clips 24 --seconds 6
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.bench_utils import append_history
+from utils.anki_utils import AnkiExporter, ClipCompactor
+
+
+def _make_clip(ffmpeg: str, out: Path, seconds: int, seed: int) -> None:
+    subprocess.run([
+        ffmpeg, "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:d={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency={220 + seed}:d={seconds}",
+        "-c:v", "libvpx", "-deadline", "realtime", "-b:v", "4M",
+        "-c:a", "libopus", "-shortest", str(out)], check=True)
+
+
+def _export(clips, media, out: Path) -> dict:
+    t0 = time.perf_counter()
+    anki = AnkiExporter()
+    for (clip_id, _), path in zip(clips, media):
+        anki.add_card(clip_path=path, word="単語", meanings="meaning",
+                      sentence="例文", explanation="", note_id=clip_id)
+    anki.export(out)
+    return {"export_s": round(time.perf_counter() - t0, 3),
+            "package_mb": round(out.stat().st_size / 1024 / 1024, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clips", type=int, default=24)
+    parser.add_argument("--seconds", type=int, default=6)
+    parser.add_argument("--codec", choices=["h264", "vp9"], default="h264")
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise SystemExit("ffmpeg not found")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        clips = []
+        for i in range(args.clips):
+            path = tmp / f"clip_{i}.webm"
+            _make_clip(ffmpeg, path, args.seconds, i)
+            clips.append((f"bench-{i}", str(path)))
+        originals = [p for _, p in clips]
+        result = {"args": vars(args),
+                  "original": _export(clips, originals, tmp / "full.apkg")}
+        compactor = ClipCompactor(tmp / "media", codec=args.codec,
+                                  max_height=args.height,
+                                  workers=args.workers)
+        for run in ("compact_cold", "compact_warm"):
+            t0 = time.perf_counter()
+            media = compactor.compact(clips)
+            transcode_s = time.perf_counter() - t0
+            res = _export(clips, media, tmp / f"{run}.apkg")
+            res["transcode_s"] = round(transcode_s, 3)
+            res["total_s"] = round(transcode_s + res["export_s"], 3)
+            result[run] = res
+        result["saved_ratio"] = round(
+            1 - result["compact_cold"]["package_mb"]
+            / result["original"]["package_mb"], 4)
+    out = append_history("anki_compact", result)
+    print(json.dumps(result, indent=2))
+    print(f"Saved to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare genanki's Package.write_to_file with the streaming
+AnkiExporter.iter_package on a synthetic deck: time to first byte,
+total time and peak Python memory (tracemalloc).
+
+Usage (from apps/backend):
+    python -m benchmarks.anki_export --clips 300 --clip-kb 800
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from pathlib import Path
+import genanki
+from benchmarks.bench_utils import append_history
+from utils.anki_utils import AnkiExporter
+
+
+def _exporter(clip_paths) -> AnkiExporter:
+    anki = AnkiExporter()
+    for i, path in enumerate(clip_paths):
+        anki.add_card(clip_path=str(path),
+                      word=f"単語{i}",
+                      meanings="meaning",
+                      sentence="これは例文です。",
+                      explanation="Synthetic card.",
+                      note_id=f"bench-{i}")
+    return anki
+
+
+def _measure(fn) -> dict:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    ttfb = fn(t0)
+    total = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ttfb_s": round(ttfb, 3),
+            "total_s": round(total, 3),
+            "peak_mem_mb": round(peak / 1024 / 1024, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clips", type=int, default=300)
+    parser.add_argument("--clip-kb", type=int, default=800)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        clip_paths = []
+        for i in range(args.clips):
+            path = tmp / f"clip_{i}.webm"
+            path.write_bytes(os.urandom(args.clip_kb * 1024))
+            clip_paths.append(path)
+
+        def write_to_file(t0: float) -> float:
+            anki = _exporter(clip_paths)
+            genanki.Package(anki.deck, anki.media_files).write_to_file(
+                str(tmp / "genanki.apkg"))
+            # Nothing can be sent before the file is complete
+            return time.perf_counter() - t0
+
+        def iter_package(t0: float) -> float:
+            ttfb = None
+            with open(tmp / "stream.apkg", "wb") as f:
+                for chunk in _exporter(clip_paths).iter_package():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - t0
+                    f.write(chunk)
+            return ttfb
+
+        result = {"clips": args.clips,
+                  "clip_kb": args.clip_kb,
+                  "write_to_file": _measure(write_to_file),
+                  "iter_package": _measure(iter_package)}
+        with zipfile.ZipFile(tmp / "stream.apkg") as zf:
+            if zf.testzip() is not None:
+                raise SystemExit("Streamed package is corrupt")
+            result["entries"] = len(zf.namelist())
+        result["size_mb"] = round(
+            (tmp / "stream.apkg").stat().st_size / 1024 / 1024, 1)
+    out = append_history("anki_export", result)
+    print(json.dumps(result, indent=2))
+    print(f"Saved to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import json
+import math
+import datetime
+import platform
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+# Reference runs, committed so regressions can be checked anywhere
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of `values` (0-100).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1,
+                   math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """
+    Latency summary in milliseconds for a list of seconds.
+    """
+    ms = [v * 1000 for v in latencies]
+    return {
+        "count": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(terse=True),
+        "cpu_cores": os.cpu_count(),
+    }
+
+
+def append_history(name: str, result: Dict[str, Any]) -> Path:
+    """
+    Append one run to `results/<name>.jsonl` so runs can be compared.
+    """
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = RESULTS_DIR / f"{name}.jsonl"
+    record = {"env": environment(), **result}
+    with open(out, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return out
+
+
+def baseline_path(name: str) -> Path:
+    return BASELINES_DIR / f"{name}.json"
+
+
+def save_baseline(name: str, metrics: Dict[str, float],
+                  params: Optional[Dict[str, Any]] = None) -> Path:
+    """
+    Store `metrics` as the reference run later runs are compared to,
+    along with the `params` (corpus size...) needed to repeat the run.
+    """
+    BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+    out = baseline_path(name)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"env": environment(), "params": params or {},
+                   "metrics": metrics}, f, ensure_ascii=False, indent=2)
+    return out
+
+
+def load_baseline(name: str) -> Dict[str, Any]:
+    with open(baseline_path(name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_baseline(name: str,
+                     metrics: Dict[str, float],
+                     tolerance: float = 0.1) -> Dict[str, Dict[str, Any]]:
+    """
+    Compare `metrics` with the saved baseline. Metrics ending in `_per_s`
+    are throughputs (higher is better), all others costs such as
+    latency or bytes (lower is better). A metric regresses when it is
+    worse than the baseline by more than `tolerance` (a fraction).
+    """
+    saved = load_baseline(name)
+    baseline = saved["metrics"]
+    here = environment()
+    for key in ("platform", "cpu_cores"):
+        if saved["env"].get(key) != here[key]:
+            print(f"Warning: baseline was recorded with {key}="
+                  f"{saved['env'].get(key)}, this machine has "
+                  f"{here[key]}", file=sys.stderr)
+    report = {}
+    for key, base in baseline.items():
+        if key not in metrics or not base:
+            continue
+        ratio = metrics[key] / base
+        worse = (1 - ratio) if key.endswith("_per_s") else (ratio - 1)
+        report[key] = {"baseline": base,
+                       "current": metrics[key],
+                       "ratio": round(ratio, 3),
+                       "regressed": worse > tolerance}
+    return report
@@ -0,0 +1,111 @@
+"""
+Hammer the database with concurrent inserts and listing reads.
+
+Usage (from apps/backend):
+    DATABASE_URL=sqlite:////tmp/stress.db python -m benchmarks.db_stress
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from typing import List
+from benchmarks.bench_utils import summarize, append_history
+from db.db import (connect_db,
+                   disconnect_db,
+                   execute_write,
+                   get_db,
+                   database)
+from db.Tables import profiles, profile_files, profile_transcripts
+
+
+async def _writer(profile_id: str, n: int, latencies: List[float],
+                  errors: List[str]) -> None:
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            transcript_id = str(uuid.uuid4())
+            await execute_write(profile_transcripts.insert().values(
+                id=transcript_id,
+                profile_id=profile_id,
+                transcript="今日はいい天気ですね",
+            ))
+            await execute_write(profile_files.insert().values(
+                id=str(uuid.uuid4()),
+                profile_id=profile_id,
+                file_name="stress.wav",
+                file_path=f"profiles/{profile_id}/audios/{uuid.uuid4()}.wav",
+                file_type="audio_source",
+                related_transcript_id=transcript_id,
+            ))
+        except Exception as e:
+            errors.append(str(e))
+        latencies.append(time.perf_counter() - t0)
+
+
+async def _reader(profile_id: str, n: int, latencies: List[float],
+                  errors: List[str]) -> None:
+    db = await get_db()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            await db.fetch_all(profile_files.select().where(
+                profile_files.c.profile_id == profile_id).order_by(
+                    profile_files.c.created_at.desc()))
+        except Exception as e:
+            errors.append(str(e))
+        latencies.append(time.perf_counter() - t0)
+
+
+async def run(writers: int, readers: int, ops: int) -> dict:
+    await connect_db()
+    profile_id = f"stress-{uuid.uuid4()}"
+    await execute_write(profiles.insert().values(id=profile_id,
+                                                 name=profile_id))
+    w_lat: List[float] = []
+    r_lat: List[float] = []
+    errors: List[str] = []
+    t0 = time.perf_counter()
+    await asyncio.gather(
+        *[_writer(profile_id, ops, w_lat, errors) for _ in range(writers)],
+        *[_reader(profile_id, ops, r_lat, errors) for _ in range(readers)],
+    )
+    wall = time.perf_counter() - t0
+    db = await get_db()
+    rows = await db.fetch_all(profile_files.select().where(
+        profile_files.c.profile_id == profile_id))
+    await disconnect_db()
+    return {
+        "database_url": database.url.obscure_password,
+        "writers": writers,
+        "readers": readers,
+        "ops_per_worker": ops,
+        "wall_s": round(wall, 3),
+        "writes_per_s": round(len(w_lat) / wall, 1),
+        "reads_per_s": round(len(r_lat) / wall, 1),
+        "write_latency": summarize(w_lat),
+        "read_latency": summarize(r_lat),
+        "rows_written": len(rows),
+        "rows_expected": writers * ops,
+        "errors": len(errors),
+        "first_errors": errors[:5],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=50)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.writers, args.readers, args.ops))
+    out = append_history("db_stress", result)
+    print(json.dumps(result))
+    print(f"Saved to {out}", file=sys.stderr)
+    if result["errors"] or result["rows_written"] != result["rows_expected"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Import-time budget for the API: fails when importing `main` eagerly
+loads a heavy module or takes longer than the budget.
+
+`main` is imported in a fresh interpreter under `python -X importtime`
+(with a throwaway SQLite database and a dummy OpenAI key), best of
+`--repeats`. Whisper, the dictionaries, openai, genanki and modal must
+only load on first use or in the background warm-up (see
+utils/readiness_utils.py), so any of HEAVY_MODULES showing up is an
+error regardless of timing. `--modal` sets dummy Modal tokens to check
+the Modal code path as well.
+
+Exits with status 1 if the budget is exceeded, e.g. in CI:
+    python -m benchmarks.import_budget --budget-ms 1000
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# Top-level packages that must never be imported by `import main`
+HEAVY_MODULES = ("faster_whisper", "jamdict", "fugashi", "unidic",
+                 "unidic_lite", "openai", "genanki", "modal", "torch",
+                 "onnxruntime", "av", "tokenizers", "huggingface_hub")
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(modal: bool) -> List[Dict]:
+    """
+    Per-module import times (us) of `import main` in a new interpreter.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ,
+               "PYTHONPATH": str(BACKEND_DIR),
+               "DATABASE_URL": f"sqlite:///{tmp}/budget.db",
+               "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "budget"),
+               "TRACING_EXPORTER": "none"}
+        if modal:
+            env.update(MODAL_TOKEN_ID="budget", MODAL_TOKEN_SECRET="budget")
+        else:
+            env.pop("MODAL_TOKEN_ID", None)
+            env.pop("MODAL_TOKEN_SECRET", None)
+        # Run from a scratch directory, main creates media_files/ in cwd
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import main"],
+            cwd=tmp, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"import main failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            rows.append({"self_us": int(match[1]),
+                         "cumulative_us": int(match[2]),
+                         "depth": len(match[3]) // 2,
+                         "module": match[4]})
+    return rows
+
+
+def analyze(rows: List[Dict], top: int) -> Dict:
+    main = next(r for r in rows if r["module"] == "main")
+    packages = {r["module"].split(".")[0] for r in rows}
+    heavy = sorted(packages & set(HEAVY_MODULES))
+    # Direct imports of main, the place to look when the total grows
+    children = sorted((r for r in rows if r["depth"] == 1),
+                      key=lambda r: -r["cumulative_us"])
+    return {"main_ms": round(main["cumulative_us"] / 1000, 1),
+            "modules": len(rows),
+            "heavy_modules": heavy,
+            "top_imports": [{"module": r["module"],
+                             "ms": round(r["cumulative_us"] / 1000, 1)}
+                            for r in children[:top]]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=1000,
+                        help="Maximum cumulative import time of main")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--modal", action="store_true",
+                        help="Import with (dummy) Modal tokens set")
+    args = parser.parse_args()
+    from benchmarks.bench_utils import append_history
+    runs = [analyze(import_times(args.modal), args.top)
+            for _ in range(args.repeats)]
+    # The first run may also be compiling bytecode
+    best = min(runs, key=lambda r: r["main_ms"])
+    heavy = sorted({m for r in runs for m in r["heavy_modules"]})
+    failures = []
+    if heavy:
+        failures.append(f"heavy modules imported eagerly: "
+                        f"{', '.join(heavy)}")
+    if best["main_ms"] > args.budget_ms:
+        failures.append(f"import main took {best['main_ms']}ms, "
+                        f"budget {args.budget_ms}ms")
+    result = {"config": vars(args),
+              **best,
+              "runs_ms": [r["main_ms"] for r in runs],
+              "heavy_modules": heavy,
+              "passed": not failures}
+    out = append_history("import_budget", result)
+    print(json.dumps(result, indent=2))
+    print(f"Saved to {out}", file=sys.stderr)
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+End-to-end load test of the backend at controlled concurrency.
+
+Boots the app in-process (uvicorn in a thread, scratch SQLite database
+and media directory) next to a mock OpenAI-compatible server with a
+configurable latency and token usage, then drives each scenario at
+each concurrency level and reports throughput, error rate and latency
+percentiles.
+
+Scenarios:
+    breakdown   POST /gpt/breakdown
+    lookup      GET  /dict/sentence_lookup
+    audio       POST /audio/transcribe_from_audio
+    video       POST /video/generate_srt
+
+Media is synthesized with ffmpeg (a tone over noise, plus a test
+pattern for video). Each request uploads a remuxed copy with unique
+metadata, so the content-addressed transcript/SRT reuse is bypassed
+unless `--reuse-media` is given. Whisper runs locally with
+WHISPER_MODEL / WHISPER_DEVICE / WHISPER_COMPUTE_TYPE (tiny, cpu, int8
+by default), which the first media request downloads if missing.
+
+Usage (from apps/backend, with the backend requirements installed):
+    python -m benchmarks.load_test --concurrency 1,4,16
+    python -m benchmarks.load_test --scenarios audio,video \\
+        --media-requests 16 --media-seconds 30 --whisper-model small
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ("breakdown", "lookup", "audio", "video")
+MEDIA_SCENARIOS = ("audio", "video")
+# A valid SRT cue, so the mock's reply also works as a "fixed" SRT
+MOCK_REPLY = "1\n00:00:00,000 --> 00:00:02,000\nこれはテストです。\n"
+
+
+def mock_openai_app(latency: float, prompt_tokens: int,
+                    completion_tokens: int):
+    """
+    Minimal OpenAI-compatible chat completions API, streaming included.
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI()
+    app.state.requests = 0
+
+    def usage() -> Dict:
+        return {"prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0}}
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}",
+                "created": int(time.time()),
+                "model": body["model"]}
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return {**base, "object": "chat.completion",
+                    "choices": [{"index": 0,
+                                 "message": {"role": "assistant",
+                                             "content": MOCK_REPLY},
+                                 "finish_reason": "stop"}],
+                    "usage": usage()}
+
+        async def chunks():
+            words = MOCK_REPLY.split(" ")
+            for i, word in enumerate(words):
+                await asyncio.sleep(latency / len(words))
+                delta = {"content": word if i == 0 else " " + word}
+                yield "data: " + json.dumps({
+                    **base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta,
+                                 "finish_reason": None}]}) + "\n\n"
+            yield "data: " + json.dumps({
+                **base, "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {},
+                             "finish_reason": "stop"}]}) + "\n\n"
+            if body.get("stream_options", {}).get("include_usage"):
+                yield "data: " + json.dumps({
+                    **base, "object": "chat.completion.chunk",
+                    "choices": [], "usage": usage()}) + "\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+def serve_in_thread(app, port: int = 0):
+    """
+    Start uvicorn for `app` on its own thread and event loop.
+    Returns the server and the port it bound.
+    """
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1",
+                                           port=port, log_level="warning",
+                                           lifespan="on"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Server failed to start")
+        time.sleep(0.05)
+    bound = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, bound
+
+
+def make_media(work: Path, seconds: float) -> Dict[str, Path]:
+    """
+    Base audio and video inputs, synthesized with ffmpeg.
+    """
+    tone = (f"sine=frequency=440:duration={seconds}[s];"
+            f"anoisesrc=amplitude=0.05:duration={seconds}[n];"
+            "[s][n]amix=inputs=2")
+    audio, video = work / "base.wav", work / "base.mp4"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error",
+                    "-filter_complex", tone, "-ar", "16000", "-ac", "1",
+                    str(audio)], check=True)
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error",
+                    "-f", "lavfi", "-i",
+                    f"testsrc=size=640x360:rate=24:duration={seconds}",
+                    "-i", str(audio), "-c:v", "libx264", "-preset",
+                    "ultrafast", "-c:a", "aac", "-shortest", str(video)],
+                   check=True)
+    return {"audio": audio, "video": video}
+
+
+def unique_copies(base: Path, n: int, work: Path) -> List[Path]:
+    """
+    `n` stream copies of `base` differing only in a metadata tag, so
+    each has its own content hash.
+    """
+    out = []
+    for i in range(n):
+        copy = work / f"{base.stem}-{i}{base.suffix}"
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error",
+                        "-i", str(base), "-c", "copy",
+                        "-metadata", f"comment={uuid.uuid4()}",
+                        str(copy)], check=True)
+        out.append(copy)
+    return out
+
+
+def request_factory(scenario: str, sentences: List[str],
+                    media: List[Path]) -> Callable:
+    """
+    Coroutine function issuing request `i` of a scenario.
+    """
+    headers = {"X-Profile-ID": "load-test"}
+
+    async def send(client, i: int):
+        if scenario == "breakdown":
+            return await client.post(
+                "/gpt/breakdown", headers=headers,
+                json={"sentence": sentences[i % len(sentences)]})
+        if scenario == "lookup":
+            return await client.get(
+                "/dict/sentence_lookup",
+                params={"sentence": sentences[i % len(sentences)]})
+        path = media[i % len(media)]
+        content = path.read_bytes()
+        if scenario == "audio":
+            return await client.post(
+                "/audio/transcribe_from_audio", headers=headers,
+                files={"file": (path.name, content, "audio/wav")},
+                data={"clean_audio": "false", "gpt_explain": "false"})
+        return await client.post(
+            "/video/generate_srt", headers=headers,
+            files={"video_file": (path.name, content, "video/mp4")})
+    return send
+
+
+async def drive(base_url: str, send: Callable, requests: int,
+                concurrency: int) -> Dict:
+    import httpx
+    from benchmarks.bench_utils import summarize
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    gate = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=900,
+                                 limits=limits) as client:
+        async def one(i: int):
+            async with gate:
+                t0 = time.perf_counter()
+                try:
+                    r = await send(client, i)
+                    statuses[str(r.status_code)] += 1
+                    ok = r.status_code < 400
+                except Exception as e:
+                    statuses[type(e).__name__] += 1
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - t0
+    errors = requests - len(latencies)
+    return {"concurrency": concurrency,
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4),
+            "wall_s": round(wall, 3),
+            "throughput_rps": round(len(latencies) / wall, 3),
+            "statuses": dict(statuses),
+            "latency": summarize(latencies)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100,
+                        help="Requests per level for text scenarios")
+    parser.add_argument("--media-requests", type=int, default=8,
+                        help="Requests per level for media scenarios")
+    parser.add_argument("--media-seconds", type=float, default=10)
+    parser.add_argument("--reuse-media", action="store_true",
+                        help="Upload identical media (measures reuse)")
+    parser.add_argument("--gpt-latency-ms", type=float, default=500)
+    parser.add_argument("--prompt-tokens", type=int, default=800)
+    parser.add_argument("--completion-tokens", type=int, default=300)
+    parser.add_argument("--whisper-model", default="tiny")
+    parser.add_argument("--whisper-device", default="cpu")
+    parser.add_argument("--whisper-compute-type", default="int8")
+    args = parser.parse_args()
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    from benchmarks.bench_utils import append_history
+    from benchmarks.text_processing import corpus
+
+    mock = mock_openai_app(args.gpt_latency_ms / 1000, args.prompt_tokens,
+                           args.completion_tokens)
+    mock_server, _, mock_port = serve_in_thread(mock)
+
+    work = Path(tempfile.mkdtemp(prefix="mirumoji-load-"))
+    # Must be set before the app (and its routers) are imported
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{work / 'load.db'}",
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        "WHISPER_MODEL": args.whisper_model,
+        "WHISPER_DEVICE": args.whisper_device,
+        "WHISPER_COMPUTE_TYPE": args.whisper_compute_type,
+    })
+    for key in ("MODAL_TOKEN_ID", "MODAL_TOKEN_SECRET"):
+        os.environ.pop(key, None)
+    os.chdir(work)
+    (work / "media_files" / "temp").mkdir(parents=True)
+
+    media: Dict[str, List[Path]] = {}
+    if set(scenarios) & set(MEDIA_SCENARIOS):
+        base = make_media(work, args.media_seconds)
+        for kind in MEDIA_SCENARIOS:
+            if kind in scenarios:
+                media[kind] = ([base[kind]] if args.reuse_media else
+                               unique_copies(base[kind],
+                                             args.media_requests
+                                             * len(levels), work))
+
+    from main import app
+    app_server, app_thread, app_port = serve_in_thread(app)
+    base_url = f"http://127.0.0.1:{app_port}"
+    sentences = corpus(500)
+
+    results: Dict[str, List[Dict]] = {}
+    for scenario in scenarios:
+        results[scenario] = []
+        used = 0
+        for level in levels:
+            n = (args.media_requests if scenario in MEDIA_SCENARIOS
+                 else args.requests)
+            files = media.get(scenario, [])
+            if files and not args.reuse_media:
+                files = files[used:used + n]
+                used += n
+            send = request_factory(scenario, sentences, files)
+            run = asyncio.run(drive(base_url, send, n, level))
+            results[scenario].append(run)
+            print(f"{scenario:>9} c={level:<3} "
+                  f"{run['throughput_rps']:8.2f} req/s  "
+                  f"p50 {run['latency']['p50_ms']:9.1f} ms  "
+                  f"p95 {run['latency']['p95_ms']:9.1f} ms  "
+                  f"errors {run['error_rate']:.1%}", file=sys.stderr)
+
+    app_server.should_exit = True
+    app_thread.join(timeout=30)
+    mock_server.should_exit = True
+    result = {"config": {k: v for k, v in vars(args).items()},
+              "mock_gpt_requests": mock.state.requests,
+              "results": results}
+    out = append_history("load_test", result)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"Saved to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Wall time and real-time factor (RTF = processing time / media duration)
+of the media pipeline on generated test media.
+
+For every duration and resolution an H.264/AAC .mkv is synthesized
+with ffmpeg (a tone over noise with a moving test pattern), then
+AudioTools.extract_audio, filter_audio, to_wav and to_mp4 (libx264)
+are timed on it, best of `--repeats`. Audio-only steps depend on the
+duration alone and run on the first resolution.
+
+FWhisperWrapper.transcribe is then timed on one clip for every
+compute_type x beam_size combination. Generated audio has no speech,
+which makes decoding cheaper than on real dialogue; pass `--speech` a
+recording to measure realistic Whisper RTFs.
+
+Usage (from apps/backend, with the backend requirements installed):
+    python -m benchmarks.media_pipeline --durations 10,60 \\
+        --resolutions 640x360,1280x720
+    python -m benchmarks.media_pipeline --skip-ffmpeg \\
+        --speech episode.wav --compute-types int8,float32 --beam-sizes 1,5
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+
+def make_video(ffmpeg: str, out: Path, seconds: float,
+               resolution: str) -> None:
+    subprocess.run([
+        ffmpeg, "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i",
+        f"testsrc2=size={resolution}:rate=24:duration={seconds}",
+        "-filter_complex",
+        f"sine=frequency=440:duration={seconds}[s];"
+        f"anoisesrc=amplitude=0.05:duration={seconds}[n];"
+        "[s][n]amix=inputs=2[a]",
+        "-map", "0:v", "-map", "[a]",
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23",
+        "-c:a", "aac", "-b:a", "128k", "-shortest", str(out)], check=True)
+
+
+def timed(fn: Callable[[], object], repeats: int,
+          duration: float) -> Dict:
+    """
+    Best and median wall time of `fn` over `repeats` runs, with RTFs.
+    """
+    walls = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        walls.append(time.perf_counter() - t0)
+        if result is None:
+            return {"error": "step returned None"}
+    best = min(walls)
+    return {"best_s": round(best, 3),
+            "median_s": round(statistics.median(walls), 3),
+            "rtf": round(best / duration, 4),
+            "x_realtime": round(duration / best, 1)}
+
+
+def bench_ffmpeg(tools, work: Path, durations: List[float],
+                 resolutions: List[str], repeats: int,
+                 mp4_resolution: str) -> List[Dict]:
+    ffmpeg = shutil.which("ffmpeg")
+    rows = []
+    for duration in durations:
+        for i, resolution in enumerate(resolutions):
+            src = work / f"src_{int(duration)}s_{resolution}.mkv"
+            make_video(ffmpeg, src, duration, resolution)
+            row = {"duration_s": round(duration, 2),
+                   "resolution": resolution,
+                   "source_mb": round(src.stat().st_size / 2**20, 2)}
+            # extract_audio writes next to its input
+            row["extract_audio"] = timed(
+                lambda: tools.extract_audio(str(src)), repeats, duration)
+            if i == 0:
+                row["filter_audio"] = timed(
+                    lambda: tools.filter_audio(str(src),
+                                               str(work / "filtered.wav")),
+                    repeats, duration)
+                row["to_wav"] = timed(
+                    lambda: tools.to_wav(str(src), str(work / "full.wav")),
+                    repeats, duration)
+            row["to_mp4"] = timed(
+                lambda: tools.to_mp4(str(src), str(work / "out.mp4"),
+                                     resolution=mp4_resolution),
+                repeats, duration)
+            rows.append(row)
+            print(f"{duration:7.1f}s {resolution:>9}  "
+                  f"extract x{row['extract_audio'].get('x_realtime')}  "
+                  f"to_mp4 x{row['to_mp4'].get('x_realtime')}",
+                  file=sys.stderr)
+    return rows
+
+
+def bench_whisper(audio: Path, model: str,
+                  compute_types: List[str], beam_sizes: List[int],
+                  repeats: int) -> List[Dict]:
+    from processing.whisper_wrapper import FWhisperWrapper
+    rows = []
+    for compute_type in compute_types:
+        t0 = time.perf_counter()
+        try:
+            wrapper = FWhisperWrapper(model_name=model, device="cpu",
+                                      compute_type=compute_type)
+            wrapper.load()
+        except Exception as e:
+            rows.append({"compute_type": compute_type, "error": str(e)})
+            continue
+        load_s = time.perf_counter() - t0
+        for beam_size in beam_sizes:
+            walls, decodes, segments = [], [], 0
+            for _ in range(repeats):
+                t1 = time.perf_counter()
+                result = wrapper.transcribe(
+                    str(audio), add_kargs={"beam_size": beam_size})
+                walls.append(time.perf_counter() - t1)
+                if result is None:
+                    break
+                decodes.append(result["elapsed"])
+                segments = len(result["obj"])
+                duration = result["info"].duration
+            if not decodes:
+                rows.append({"compute_type": compute_type,
+                             "beam_size": beam_size,
+                             "error": "transcription failed"})
+                continue
+            best = min(walls)
+            rows.append({"compute_type": compute_type,
+                         "beam_size": beam_size,
+                         "audio_s": round(duration, 2),
+                         "load_s": round(load_s, 2),
+                         "best_s": round(best, 3),
+                         "decode_s": round(min(decodes), 3),
+                         "rtf": round(best / duration, 4),
+                         "x_realtime": round(duration / best, 1),
+                         "segments": segments})
+            print(f"whisper {model} {compute_type:>8} beam={beam_size}  "
+                  f"x{rows[-1]['x_realtime']} realtime", file=sys.stderr)
+        del wrapper
+    return rows
+
+
+def _csv(value: str, cast=str) -> List:
+    return [cast(v) for v in value.split(",") if v]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--durations", default="10,60,300",
+                        help="Comma-separated media durations (s)")
+    parser.add_argument("--resolutions", default="640x360,1280x720,"
+                                                 "1920x1080")
+    parser.add_argument("--mp4-resolution", default="1280x720",
+                        help="to_mp4 target canvas, as used by the API")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--skip-ffmpeg", action="store_true")
+    parser.add_argument("--skip-whisper", action="store_true")
+    parser.add_argument("--whisper-model", default="tiny")
+    parser.add_argument("--compute-types", default="int8,float32")
+    parser.add_argument("--beam-sizes", default="1,5")
+    parser.add_argument("--whisper-seconds", type=float, default=60,
+                        help="Length of the generated Whisper input")
+    parser.add_argument("--speech", default=None,
+                        help="Audio/video with speech for the Whisper runs")
+    args = parser.parse_args()
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise SystemExit("ffmpeg not found")
+    from benchmarks.bench_utils import append_history
+    from processing.audio_processing import AudioTools
+    version = subprocess.run([ffmpeg, "-version"], capture_output=True,
+                             text=True).stdout.splitlines()[0]
+    result = {"config": vars(args), "ffmpeg": version}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        tools = AudioTools(working_dir=work)
+        if not args.skip_ffmpeg:
+            result["ffmpeg_steps"] = bench_ffmpeg(
+                tools, work, _csv(args.durations, float),
+                _csv(args.resolutions), args.repeats, args.mp4_resolution)
+        if not args.skip_whisper:
+            if args.speech:
+                # A copy, not a symlink: extract_audio resolves links and
+                # would write its WAV next to the recording
+                source = work / f"speech{Path(args.speech).suffix}"
+                shutil.copyfile(args.speech, source)
+            else:
+                source = work / "whisper_src.mkv"
+                make_video(ffmpeg, source, args.whisper_seconds, "320x180")
+            # As in the API: video is reduced to 16 kHz mono WAV, audio
+            # files are transcribed as uploaded
+            audio = tools.extract_audio(str(source.resolve()))
+            if not audio or not Path(audio).exists():
+                raise SystemExit(f"Could not extract audio from {source}")
+            audio = Path(audio)
+            result["whisper"] = bench_whisper(
+                audio, args.whisper_model,
+                _csv(args.compute_types), _csv(args.beam_sizes, int),
+                args.repeats)
+
+    out = append_history("media_pipeline", result)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"Saved to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Throughput and time-to-first-byte of concurrent range requests on /media.
+
+Serves a synthetic file from a temporary media directory with uvicorn,
+once with Starlette's StaticFiles and once with utils.media_utils
+MediaFiles, and fires concurrent random `Range` requests at each.
+Pass --url to measure an already running server instead
+(e.g. http://localhost/media/profiles/<id>/converted/<file>.mp4).
+
+Usage (from apps/backend):
+    python -m benchmarks.media_range --size-mb 256 --concurrency 16
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+from benchmarks.bench_utils import summarize, append_history
+
+READ_SIZE = 256 * 1024
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                           log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def _fetch(url: str, start: int, length: int) -> Tuple[float, float, int]:
+    """
+    One range request. Returns (ttfb seconds, total seconds, bytes).
+    """
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80,
+                                      timeout=60)
+    t0 = time.perf_counter()
+    conn.request("GET", parts.path,
+                 headers={"Range": f"bytes={start}-{start + length - 1}"})
+    resp = conn.getresponse()
+    if resp.status not in (200, 206):
+        raise RuntimeError(f"HTTP {resp.status}")
+    first = resp.read1(READ_SIZE)
+    ttfb = time.perf_counter() - t0
+    received = len(first)
+    while True:
+        chunk = resp.read(READ_SIZE)
+        if not chunk:
+            break
+        received += len(chunk)
+    conn.close()
+    return ttfb, time.perf_counter() - t0, received
+
+
+def measure(url: str, file_size: int, requests_n: int, concurrency: int,
+            range_mb: float) -> Dict:
+    rng = random.Random(7)
+    length = min(file_size, int(range_mb * 1024 * 1024))
+    starts = [rng.randrange(0, file_size - length + 1)
+              for _ in range(requests_n)]
+    ttfbs: List[float] = []
+    totals: List[float] = []
+    received = 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ttfb, total, n in pool.map(lambda s: _fetch(url, s, length),
+                                       starts):
+            ttfbs.append(ttfb)
+            totals.append(total)
+            received += n
+    wall = time.perf_counter() - t0
+    return {"requests": requests_n,
+            "concurrency": concurrency,
+            "range_bytes": length,
+            "throughput_mb_s": round(received / wall / 1024 / 1024, 1),
+            "ttfb": summarize(ttfbs),
+            "request_latency": summarize(totals)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--range-mb", type=float, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    results: Dict[str, Dict] = {}
+    if args.url:
+        conn = http.client.HTTPConnection(urlsplit(args.url).netloc)
+        conn.request("HEAD", urlsplit(args.url).path)
+        size = int(conn.getresponse().getheader("content-length"))
+        results["url"] = measure(args.url, size, args.requests,
+                                 args.concurrency, args.range_mb)
+    else:
+        from fastapi import FastAPI
+        from starlette.staticfiles import StaticFiles
+        from utils.media_utils import MediaFiles
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "profiles" / "bench" / "video.mp4"
+            path.parent.mkdir(parents=True)
+            size = args.size_mb * 1024 * 1024
+            with open(path, "wb") as f:
+                for _ in range(args.size_mb):
+                    f.write(os.urandom(1024 * 1024))
+            for name, cls in (("StaticFiles", StaticFiles),
+                              ("MediaFiles", MediaFiles)):
+                app = FastAPI()
+                app.mount("/media", cls(directory=tmp), name="media")
+                port = _free_port()
+                server, thread = _serve(app, port)
+                url = f"http://127.0.0.1:{port}/media/profiles/bench/video.mp4"
+                try:
+                    results[name] = measure(url, size, args.requests,
+                                            args.concurrency, args.range_mb)
+                finally:
+                    server.should_exit = True
+                    thread.join()
+    out = append_history("media_range", {"args": vars(args), **results})
+    print(json.dumps(results, indent=2))
+    print(f"Saved to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
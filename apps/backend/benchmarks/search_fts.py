@@ -0,0 +1,120 @@
+"""
+Benchmark the full-text search index on synthetic transcripts and clips.
+
+Builds a throwaway SQLite database, inserts N synthetic rows (the FTS index
+is maintained by triggers as in production), then measures query latency.
+
+Usage (from apps/backend):
+    python -m benchmarks.search_fts --rows 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+QUERIES = ["てしまう", "食べる", "ことがある", "regret", "なければならない",
+           "ようにする", "天気", "nuance", "わけではない", "〜ばかり"]
+SUBJECTS = ["私は", "彼女は", "先生が", "友達と", "猫が", "子供たちは"]
+OBJECTS = ["ケーキを", "本を", "映画を", "日本語を", "宿題を", "音楽を"]
+VERBS = ["食べてしまった", "読んだことがある", "見なければならない",
+         "勉強するようにする", "忘れてしまう", "聞くばかりだ",
+         "やるわけではない", "書いている"]
+ENDINGS = ["。", "ね。", "よ。", "か？", "けど…"]
+EXPLANATIONS = ["Expresses regret or completion.",
+                "Describes past experience.",
+                "Indicates obligation.",
+                "Shows an effort to make a habit.",
+                "Partial negation, softens the statement."]
+
+
+def sentence(rng: random.Random) -> str:
+    return (rng.choice(SUBJECTS) + rng.choice(OBJECTS) + rng.choice(VERBS)
+            + rng.choice(ENDINGS))
+
+
+async def run(rows: int, profiles_n: int, repeats: int) -> dict:
+    # Import after DATABASE_URL points at the scratch database
+    from benchmarks.bench_utils import summarize
+    from db.db import (connect_db, disconnect_db, database,
+                       execute_write)
+    from db.Tables import profiles, profile_transcripts, clips
+    from db.search import search_profile
+
+    rng = random.Random(42)
+    await connect_db()
+    profile_ids = [f"bench-{i}" for i in range(profiles_n)]
+    for pid in profile_ids:
+        await execute_write(profiles.insert().values(id=pid, name=pid))
+
+    t0 = time.perf_counter()
+    batch = 1000
+    for start in range(0, rows, batch):
+        t_rows, c_rows = [], []
+        for _ in range(min(batch, rows - start)):
+            pid = rng.choice(profile_ids)
+            if rng.random() < 0.5:
+                t_rows.append({
+                    "id": str(uuid.uuid4()), "profile_id": pid,
+                    "transcript": "".join(sentence(rng) for _ in range(3)),
+                    "gpt_explanation": rng.choice(EXPLANATIONS)})
+            else:
+                c_rows.append({
+                    "id": str(uuid.uuid4()), "profile_id": pid,
+                    "clip_start_time": 0.0, "clip_end_time": 3.0,
+                    "video_clip_path": f"profiles/{pid}/clips/"
+                                       f"{uuid.uuid4()}.webm",
+                    "gpt_breakdown_response": {
+                        "sentence": sentence(rng),
+                        "focus": {"word": rng.choice(VERBS),
+                                  "meanings": ["to eat", "to forget"]},
+                        "gpt_explanation": rng.choice(EXPLANATIONS)}})
+        async with database.transaction():
+            if t_rows:
+                await database.execute_many(profile_transcripts.insert(),
+                                            t_rows)
+            if c_rows:
+                await database.execute_many(clips.insert(), c_rows)
+    insert_s = time.perf_counter() - t0
+
+    latencies, per_query = [], {}
+    for q in QUERIES:
+        q_lat = []
+        for _ in range(repeats):
+            pid = rng.choice(profile_ids)
+            t1 = time.perf_counter()
+            total, _ = await search_profile(database, pid, q, 20, 0)
+            q_lat.append(time.perf_counter() - t1)
+        latencies.extend(q_lat)
+        per_query[q] = {"hits": total, **summarize(q_lat)}
+    await disconnect_db()
+    return {"rows": rows,
+            "profiles": profiles_n,
+            "insert_s": round(insert_s, 2),
+            "insert_rows_per_s": round(rows / insert_s, 1),
+            "query_latency": summarize(latencies),
+            "per_query": per_query}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--profiles", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        result = asyncio.run(run(args.rows, args.profiles, args.repeats))
+    from benchmarks.bench_utils import append_history
+    out = append_history("search_fts", result)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"Saved to {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Benchmark the text-processing hot path on a fixed subtitle corpus.
+
+Measures TokenizerService.tokenize, WordInfoService.lookup with a cold
+and a warm cache, and SentenceBreakdownService.word_lookup (GPT is
+never called). Each case runs `--repeats` rounds and reports the best
+round, pytest-benchmark style; a separate pass under tracemalloc records
+peak and retained memory, so the timings are not skewed by tracing.
+
+The corpus is generated from a fixed seed, so runs on the same machine
+are comparable. `--save-baseline` stores the headline metrics in
+baselines/text_processing.json (commit it to share the reference);
+`--compare` checks a run against it and exits with status 1 if any
+metric regressed beyond `--tolerance`. The same comparison runs under
+pytest when RUN_BENCHMARKS is set (tests/test_text_processing_bench.py),
+on the corpus size the baseline was recorded with.
+
+Usage (from apps/backend, with the backend requirements installed):
+    python -m benchmarks.text_processing --lines 3000 --save-baseline
+    python -m benchmarks.text_processing --lines 3000 --compare
+    RUN_BENCHMARKS=1 python -m pytest tests/test_text_processing_bench.py
+"""
+import argparse
+import gc
+import json
+import random
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+SUBJECTS = ["私は", "彼女は", "先生が", "友達と", "猫が", "子供たちは",
+            "お父さんは", "社長が", "あいつは", "みんなで", "警察が",
+            "隣の人は", "兄貴が", "店長は", "誰かが", "王様は", "お前が",
+            "俺たちは", "隊長が", "姉さんは", "医者が", "犯人は"]
+NOUNS = ["ケーキ", "本", "映画", "日本語", "宿題", "音楽", "手紙", "約束",
+         "秘密", "電車", "海", "病院", "剣", "未来", "名前", "部屋",
+         "魔法", "真実", "学校", "会社", "仕事", "家族", "写真", "天気",
+         "料理", "窓", "鍵", "地図", "弁当", "財布", "武器", "命令",
+         "事件", "証拠", "記憶", "運命", "世界", "戦争", "平和", "夢",
+         "心", "声", "顔", "涙", "血", "空", "星", "月", "雨", "雪",
+         "桜", "祭り", "試合", "練習", "試験", "答え", "質問", "問題",
+         "計画", "作戦", "任務", "報告", "情報", "連絡", "電話", "番号",
+         "住所", "切符", "荷物", "土産", "薬", "傷", "病気", "怪我",
+         "給料", "借金", "宝石", "城", "村", "森", "山", "川", "島",
+         "船", "飛行機", "車", "自転車", "駅", "空港", "図書館",
+         "教室", "廊下", "屋上", "台所", "お風呂", "庭", "神社", "お寺"]
+PARTICLES = ["を", "を", "に", "へ", "で", "と", "から", "まで", "の話を"]
+ADVERBS = ["", "", "もう", "まだ", "ちょっと", "絶対に", "やっぱり",
+           "たぶん", "急に", "ずっと", "本当に", "全然", "すぐに",
+           "いつも", "なかなか", "さっき", "必ず", "きっと"]
+VERBS = ["食べてしまった", "読んだことがある", "見なければならない",
+         "勉強するようにする", "忘れてしまう", "聞くばかりだ",
+         "やるわけではない", "書いている", "守れなかった", "探している",
+         "行きたくない", "帰らせてください", "信じられない",
+         "教えてもらった", "戦うしかない", "知っているはずだ",
+         "呼んでくれ", "変わってしまった", "待っていろ", "見せてあげる",
+         "捨てられた", "助けに来た", "壊してしまった", "届けなきゃ",
+         "隠していた", "選ばなかった", "払わされた", "盗まれたらしい",
+         "開けるな", "閉めておいて", "覚えていない", "話し合おう",
+         "片付けさせる", "取り戻す", "見つけ出せ", "預かっておく",
+         "諦めるものか", "燃やしてしまえ", "頼んだぞ", "逃げ出した"]
+ENDINGS = ["。", "ね。", "よ。", "か？", "けど…", "！", "んだ。", "のか？",
+           "かもしれない。", "らしい。", "そうだ。", "でしょう？"]
+INTERJECTIONS = ["え？", "まさか…", "くそっ！", "ありがとう。",
+                 "ちょっと待って！", "うそでしょ？", "大丈夫か？",
+                 "いただきます。", "おはようございます。", "ごめんなさい。"]
+
+
+def corpus(lines: int, seed: int = 42) -> List[str]:
+    """
+    Deterministic synthetic subtitle lines: mostly short sentences,
+    some interjections and two-sentence lines, as in real subtitles.
+    """
+    rng = random.Random(seed)
+    out = []
+    for _ in range(lines):
+        roll = rng.random()
+        if roll < 0.15:
+            out.append(rng.choice(INTERJECTIONS))
+            continue
+        line = (rng.choice(SUBJECTS) + rng.choice(ADVERBS)
+                + rng.choice(NOUNS) + rng.choice(PARTICLES)
+                + rng.choice(VERBS) + rng.choice(ENDINGS))
+        if roll > 0.85:
+            line += (rng.choice(NOUNS) + "は" + rng.choice(VERBS)
+                     + rng.choice(ENDINGS))
+        out.append(line)
+    return out
+
+
+def load_corpus(path: str) -> List[str]:
+    """
+    Subtitle text of an .srt file (cue numbers and timings dropped) or
+    a plain text file with one line per entry.
+    """
+    with open(path, encoding="utf-8-sig") as f:
+        raw = [line.strip() for line in f]
+    return [line for line in raw
+            if line and not line.isdigit() and "-->" not in line]
+
+
+def best_round(fn: Callable[[], List[float]], repeats: int) -> Dict:
+    """
+    Run `fn` (returning per-call latencies) `repeats` times and summarize
+    the fastest round, along with the spread across rounds.
+    """
+    from benchmarks.bench_utils import summarize
+    rounds = []
+    for _ in range(repeats):
+        gc.collect()
+        t0 = time.perf_counter()
+        latencies = fn()
+        rounds.append((time.perf_counter() - t0, latencies))
+    totals = [r[0] for r in rounds]
+    best_total, best_latencies = min(rounds, key=lambda r: r[0])
+    return {"calls": len(best_latencies),
+            "best_s": round(best_total, 4),
+            "median_s": round(statistics.median(totals), 4),
+            "stdev_s": round(statistics.stdev(totals), 4)
+            if len(totals) > 1 else 0.0,
+            "calls_per_s": round(len(best_latencies) / best_total, 1),
+            "latency": summarize(best_latencies)}
+
+
+def timed_calls(fn: Callable, args: List) -> List[float]:
+    latencies = []
+    for a in args:
+        t0 = time.perf_counter()
+        fn(a)
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def run(text: List[str], repeats: int) -> Dict:
+    from processing.text_processing import (SentenceBreakdownService,
+                                            WordInfoService)
+    # A dummy key: the GPT client is created but never called
+    service = SentenceBreakdownService(gpt_kwargs={"from_dotenv": False,
+                                                   "ApiKey": "bench"})
+    tokenizer, word_info = service.tokenizer, service.word_info
+    lemmas = list(dict.fromkeys(
+        t["lemma"] or "" for line in text
+        for t in tokenizer.tokenize(line)))
+    lookup_cache = WordInfoService.lookup
+
+    tokenize = best_round(lambda: timed_calls(tokenizer.tokenize, text),
+                          repeats)
+
+    def cold_lookups() -> List[float]:
+        lookup_cache.cache_clear()
+        return timed_calls(word_info.lookup, lemmas)
+    lookup_cold = best_round(cold_lookups, repeats)
+
+    lookup_cache.cache_clear()
+    timed_calls(word_info.lookup, lemmas)
+    # Hits take well under a microsecond, so time enough of them
+    warm_keys = lemmas * max(1, 20000 // max(1, len(lemmas)))
+    lookup_warm = best_round(
+        lambda: timed_calls(word_info.lookup, warm_keys), repeats)
+    warm_info = lookup_cache.cache_info()
+
+    def cold_word_lookup() -> List[float]:
+        lookup_cache.cache_clear()
+        return timed_calls(service.word_lookup, text)
+    word_lookup = best_round(cold_word_lookup, repeats)
+    steady_info = lookup_cache.cache_info()
+
+    # Memory in a separate pass, tracemalloc slows every allocation
+    lookup_cache.cache_clear()
+    gc.collect()
+    tracemalloc.start()
+    kept = [service.word_lookup(line) for line in text]
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    memory = {"word_lookup_peak_bytes": peak,
+              "word_lookup_retained_bytes": retained,
+              "max_rss_mb": round(resource.getrusage(
+                  resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+    tokens = sum(len(tokenizer.tokenize(line)) for line in text)
+    return {"lines": len(text),
+            "tokens": tokens,
+            "unique_lemmas": len(lemmas),
+            "lookup_cache_maxsize": warm_info.maxsize,
+            "tokenize": tokenize,
+            "lookup_cold": lookup_cold,
+            "lookup_warm": {**lookup_warm,
+                            "hits": warm_info.hits,
+                            "misses": warm_info.misses},
+            "word_lookup": {**word_lookup,
+                            "cache_hits": steady_info.hits,
+                            "cache_misses": steady_info.misses},
+            "memory": memory}
+
+
+def headline(result: Dict) -> Dict[str, float]:
+    """
+    Flat metrics stored in the baseline (`_per_s`: higher is better).
+    """
+    return {
+        "tokenize_lines_per_s": result["tokenize"]["calls_per_s"],
+        "tokenize_p95_ms": result["tokenize"]["latency"]["p95_ms"],
+        "lookup_cold_per_s": result["lookup_cold"]["calls_per_s"],
+        "lookup_warm_per_s": result["lookup_warm"]["calls_per_s"],
+        "word_lookup_lines_per_s": result["word_lookup"]["calls_per_s"],
+        "word_lookup_p95_ms": result["word_lookup"]["latency"]["p95_ms"],
+        "word_lookup_peak_bytes": result["memory"]["word_lookup_peak_bytes"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=3000)
+    parser.add_argument("--corpus", default=None,
+                        help="Benchmark an .srt or text file instead of "
+                             "the synthetic corpus (not comparable with "
+                             "a synthetic baseline)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+    from benchmarks.bench_utils import (append_history,
+                                        baseline_path,
+                                        compare_baseline,
+                                        save_baseline)
+    if args.compare and not baseline_path("text_processing").exists():
+        parser.error(f"no baseline at {baseline_path('text_processing')}, "
+                     "record one with --save-baseline first")
+    text = load_corpus(args.corpus) if args.corpus else corpus(args.lines)
+    result = run(text, args.repeats)
+    metrics = headline(result)
+    params = {"lines": len(text), "corpus": args.corpus}
+    regressed = []
+    if args.compare:
+        report = compare_baseline("text_processing", metrics,
+                                  args.tolerance)
+        result["baseline_comparison"] = report
+        regressed = [k for k, v in report.items() if v["regressed"]]
+    out = append_history("text_processing", result)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"Saved to {out}", file=sys.stderr)
+    if args.save_baseline:
+        print(f"Baseline saved to "
+              f"{save_baseline('text_processing', metrics, params)}",
+              file=sys.stderr)
+    if regressed:
+        print(f"Regressed: {', '.join(regressed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,31 @@ from sqlalchemy import (MetaData,
                         UniqueConstraint,
                         JSON,
                         Float,
+                        Integer,
+                        Index,
                         DateTime)
+from sqlalchemy.dialects.postgresql import JSONB
 import datetime
 
 METADATA = MetaData()
+# JSON documents are stored as JSONB on PostgreSQL
+JSON_DOCUMENT = JSON().with_variant(JSONB(), "postgresql")
+# ----------------------------
+# --- Schema Version Table ---
+schema_migrations = Table(
+    "schema_migrations",
+    METADATA,
+    Column("version",
+           Integer,
+           primary_key=True,
+           autoincrement=False),
+    Column("description",
+           String,
+           nullable=False),
+    Column("applied_at",
+           DateTime,
+           default=datetime.datetime.now),
+)
 # ---------------------
 # ---Profiles Table---
 profiles = Table(
@@ -109,6 +130,11 @@ profile_files = Table(
            String,
            ForeignKey("profile_transcripts.id"),
            nullable=True),
+    # SHA-256 of the content, file_path is a hard link into the blob store
+    Column("content_hash",
+           String,
+           nullable=True),
+    Index("ix_profile_files_content_hash", "content_hash"),
 )
 # -------------------
 # --- Clips Table ---
@@ -132,7 +158,7 @@ clips = Table(
            nullable=False),
     # Store the full JSON string or dict
     Column("gpt_breakdown_response",
-           JSON,
+           JSON_DOCUMENT,
            nullable=False),
     Column("video_clip_path",
            String,
@@ -148,4 +174,104 @@ clips = Table(
            DateTime,
            default=datetime.datetime.now),
 )
+# ----------------------------------
+# --- Lemma Inverted Index Table ---
+lemma_occurrences = Table(
+    "lemma_occurrences",
+    METADATA,
+    Column("id",
+           String,
+           primary_key=True,
+           default=lambda: str(uuid.uuid4())),
+    Column("profile_id",
+           String,
+           ForeignKey("profiles.id", ondelete="CASCADE"),
+           nullable=False),
+    Column("lemma",
+           String,
+           nullable=False),
+    # One of 'clip', 'transcript', 'srt'
+    Column("source_type",
+           String,
+           nullable=False),
+    # clips.id, profile_transcripts.id or profile_files.id (srt)
+    Column("source_id",
+           String,
+           nullable=False),
+    Column("occurrences",
+           Integer,
+           nullable=False),
+    Column("created_at",
+           DateTime,
+           default=datetime.datetime.now),
+    Index("ix_lemma_occurrences_profile_lemma", "profile_id", "lemma"),
+    Index("ix_lemma_occurrences_source", "source_type", "source_id"),
+)
+# ------------------------------
+# --- GPT Usage Ledger Table ---
+gpt_usage = Table(
+    "gpt_usage",
+    METADATA,
+    Column("id",
+           String,
+           primary_key=True,
+           default=lambda: str(uuid.uuid4())),
+    # Kept when a profile is gone, NULL for requests without a profile
+    Column("profile_id",
+           String,
+           nullable=True),
+    Column("route",
+           String,
+           nullable=False),
+    Column("model",
+           String,
+           nullable=False),
+    Column("prompt_tokens",
+           Integer,
+           nullable=False,
+           default=0),
+    Column("completion_tokens",
+           Integer,
+           nullable=False,
+           default=0),
+    # Prompt tokens served from OpenAI's prompt cache (billed lower)
+    Column("cached_tokens",
+           Integer,
+           nullable=False,
+           default=0),
+    Column("cost_usd",
+           Float,
+           nullable=False,
+           default=0.0),
+    Column("latency_ms",
+           Float,
+           nullable=False),
+    # OpenAI finish reason, or 'error' for failed requests
+    Column("finish_reason",
+           String,
+           nullable=True),
+    Column("created_at",
+           DateTime,
+           default=datetime.datetime.now),
+    Index("ix_gpt_usage_profile_created", "profile_id", "created_at"),
+)
+# ------------------------------
+# --- GPT Budgets Table ---
+gpt_budgets = Table(
+    "gpt_budgets",
+    METADATA,
+    Column("profile_id",
+           String,
+           ForeignKey("profiles.id", ondelete="CASCADE"),
+           primary_key=True),
+    Column("budget_usd",
+           Float,
+           nullable=False),
+    Column("window_seconds",
+           Integer,
+           nullable=False),
+    Column("updated_at",
+           DateTime,
+           default=datetime.datetime.now),
+)
 # ------------------------------
@@ -1,8 +1,16 @@
 import os
+import sqlite3
+from typing import Any
 from databases import Database
-from sqlalchemy import create_engine
+from sqlalchemy import Table
+from sqlalchemy.sql import ClauseElement
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
 from db.Tables import METADATA
 from db.Tables import (gpt_templates)
+from db.write_queue import WriteQueue
+from db.migrations import run_migrations
+from utils.metrics_utils import observe_db, register_queue
 from pathlib import Path
 
 # Check if Data Folder exists
@@ -10,10 +18,80 @@ project_root = Path(__file__).resolve().parent.parent
 path_data = project_root / "data"
 path_data.mkdir(parents=True, exist_ok=True)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/mirumoji.db")
-database = Database(DATABASE_URL)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_POSTGRES = DATABASE_URL.startswith("postgres")
+# PostgreSQL connection pool
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# SQLite tuning
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+
+def apply_sqlite_pragmas(connection: sqlite3.Connection) -> None:
+    """
+    WAL lets readers proceed while a write is in progress, NORMAL sync is
+    safe under WAL and avoids an fsync per commit, the busy timeout makes
+    contending connections wait instead of failing with
+    `database is locked`, and mmap serves reads from the page cache.
+    """
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
+class SQLitePragmaConnection(sqlite3.Connection):
+    """
+    sqlite3 connection factory applying the tuning PRAGMAs on open.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        apply_sqlite_pragmas(self)
+
+
+class InstrumentedDatabase(Database):
+    """
+    `Database` recording the latency of every call, by operation and
+    route, in the `/metrics` histograms.
+    """
+    async def fetch_all(self, query, values=None):
+        with observe_db("fetch_all"):
+            return await super().fetch_all(query, values)
+
+    async def fetch_one(self, query, values=None):
+        with observe_db("fetch_one"):
+            return await super().fetch_one(query, values)
+
+    async def fetch_val(self, query, values=None, column=0):
+        with observe_db("fetch_val"):
+            return await super().fetch_val(query, values, column)
+
+    async def execute(self, query, values=None):
+        with observe_db("execute"):
+            return await super().execute(query, values)
+
+    async def execute_many(self, query, values):
+        with observe_db("execute_many"):
+            return await super().execute_many(query, values)
+
+
+if IS_SQLITE:
+    timeout = SQLITE_BUSY_TIMEOUT_MS / 1000
+    database = InstrumentedDatabase(DATABASE_URL,
+                                    factory=SQLitePragmaConnection,
+                                    timeout=timeout)
+elif IS_POSTGRES:
+    database = InstrumentedDatabase(DATABASE_URL,
+                                    min_size=DB_POOL_MIN_SIZE,
+                                    max_size=DB_POOL_MAX_SIZE)
+else:
+    database = InstrumentedDatabase(DATABASE_URL)
 METADATA = METADATA
-engine = create_engine(DATABASE_URL)
-METADATA.create_all(engine)
+write_queue = WriteQueue(database)
+register_queue("db_write", write_queue.qsize)
 
 
 async def get_db() -> Database:
@@ -22,12 +100,34 @@ async def get_db() -> Database:
 
 async def connect_db() -> None:
     await database.connect()
+    await run_migrations(database)
+    # Serialize writes only where the backend has a single writer
+    if IS_SQLITE:
+        await write_queue.start()
 
 
 async def disconnect_db() -> None:
+    await write_queue.stop()
     await database.disconnect()
 
 
+async def execute_write(query: ClauseElement) -> Any:
+    """
+    Execute an INSERT / UPDATE / DELETE through the write queue.
+    """
+    with observe_db("queued_write"):
+        return await write_queue.execute(query)
+
+
+def insert_or_ignore(table: Table, **values) -> ClauseElement:
+    """
+    Build an atomic `INSERT ... ON CONFLICT DO NOTHING` for the backend.
+    """
+    if IS_POSTGRES:
+        return postgres_insert(table).values(**values).on_conflict_do_nothing()
+    return sqlite_insert(table).values(**values).on_conflict_do_nothing()
+
+
 async def get_gpt_template_db(profile_id: str):
     q = gpt_templates.select().where(gpt_templates.c.profile_id == profile_id)
     return await database.fetch_one(q)
@@ -0,0 +1,181 @@
+import logging
+from typing import Awaitable, Callable, List, Tuple
+from databases import Database
+from sqlalchemy import (MetaData,
+                        Table,
+                        Column,
+                        String,
+                        Text,
+                        ForeignKey,
+                        UniqueConstraint,
+                        JSON,
+                        Float,
+                        DateTime)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.schema import CreateTable, CreateIndex
+from db.Tables import (schema_migrations,
+                       lemma_occurrences,
+                       gpt_usage,
+                       gpt_budgets)
+from db.search import SEARCH_SCHEMA_SQLITE
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock key so concurrent replicas don't migrate at the same time
+PG_MIGRATION_LOCK_ID = 7_402_311
+
+MigrationFn = Callable[[Database, str], Awaitable[None]]
+MIGRATIONS: List[Tuple[int, str, MigrationFn]] = []
+
+
+def migration(version: int, description: str):
+    """
+    Register an ordered schema migration. The decorated coroutine
+    receives the database and its dialect name ('sqlite' / 'postgresql').
+    """
+    def register(fn: MigrationFn) -> MigrationFn:
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+async def create_tables(database: Database, *tables: Table) -> None:
+    """
+    Idempotently create tables and their indexes.
+    """
+    for table in tables:
+        await database.execute(CreateTable(table, if_not_exists=True))
+        for index in table.indexes:
+            await database.execute(CreateIndex(index, if_not_exists=True))
+
+
+# --- Baseline schema ---
+# The tables as created by `METADATA.create_all` before migrations
+# existed, frozen here so migration 1 always builds the same schema and
+# later migrations know exactly what they start from. Never edit these,
+# change the schema with a new migration instead.
+_BASELINE = MetaData()
+_baseline_tables = (
+    Table("profiles", _BASELINE,
+          Column("id", String, primary_key=True, index=True),
+          Column("name", String, unique=True, index=True)),
+    Table("gpt_templates", _BASELINE,
+          Column("id", String, primary_key=True, index=True),
+          Column("profile_id", String,
+                 ForeignKey("profiles.id", ondelete="CASCADE"),
+                 nullable=False, unique=True),
+          Column("sys_msg", Text, nullable=False),
+          Column("prompt", Text, nullable=False),
+          UniqueConstraint("profile_id", name="uq_profile_template")),
+    Table("profile_transcripts", _BASELINE,
+          Column("id", String, primary_key=True, index=True),
+          Column("profile_id", String,
+                 ForeignKey("profiles.id", ondelete="CASCADE"),
+                 nullable=False),
+          Column("original_file_name", String, nullable=True),
+          Column("transcript", Text, nullable=False),
+          Column("gpt_explanation", Text, nullable=True),
+          Column("audio_file_path", String, nullable=True),
+          Column("created_at", DateTime)),
+    Table("profile_files", _BASELINE,
+          Column("id", String, primary_key=True, index=True),
+          Column("profile_id", String,
+                 ForeignKey("profiles.id", ondelete="CASCADE"),
+                 nullable=False),
+          Column("file_name", String, nullable=False),
+          Column("file_path", String, nullable=False, unique=True),
+          Column("file_type", String, nullable=True),
+          Column("created_at", DateTime),
+          Column("related_transcript_id", String,
+                 ForeignKey("profile_transcripts.id"), nullable=True)),
+    Table("clips", _BASELINE,
+          Column("id", String, primary_key=True, index=True),
+          Column("profile_id", String,
+                 ForeignKey("profiles.id", ondelete="CASCADE"),
+                 nullable=False),
+          Column("clip_start_time", Float, nullable=False),
+          Column("clip_end_time", Float, nullable=False),
+          Column("gpt_breakdown_response",
+                 JSON().with_variant(JSONB(), "postgresql"),
+                 nullable=False),
+          Column("video_clip_path", String, nullable=False, unique=True),
+          Column("original_video_file_name", String, nullable=True),
+          Column("original_video_url", String, nullable=True),
+          Column("created_at", DateTime)),
+)
+
+
+@migration(1, "initial schema")
+async def _initial_schema(database: Database, dialect: str) -> None:
+    # IF NOT EXISTS keeps this safe on databases created by create_all
+    await create_tables(database, *_baseline_tables)
+
+
+@migration(2, "full-text search index")
+async def _search_index(database: Database, dialect: str) -> None:
+    # PostgreSQL searches the base tables directly, see db/search.py
+    if dialect != "sqlite":
+        return
+    for statement in SEARCH_SCHEMA_SQLITE:
+        await database.execute(statement)
+
+
+@migration(3, "lemma inverted index")
+async def _lemma_index(database: Database, dialect: str) -> None:
+    await create_tables(database, lemma_occurrences)
+
+
+@migration(4, "content hash of profile files")
+async def _profile_files_content_hash(database: Database,
+                                      dialect: str) -> None:
+    # Existing files are hashed later, in the background, by
+    # StorageJanitor.backfill_hashes rather than while holding the
+    # migration transaction
+    await database.execute(
+        "ALTER TABLE profile_files ADD COLUMN content_hash VARCHAR")
+    await database.execute(
+        """CREATE INDEX IF NOT EXISTS ix_profile_files_content_hash
+           ON profile_files (content_hash)""")
+
+
+@migration(5, "gpt usage ledger and budgets")
+async def _gpt_usage(database: Database, dialect: str) -> None:
+    await create_tables(database, gpt_usage, gpt_budgets)
+
+
+def dialect_name(database: Database) -> str:
+    """
+    'sqlite' or 'postgresql': `databases` reports postgres://... URLs,
+    which db.IS_POSTGRES accepts too, as 'postgres'.
+    """
+    dialect = database.url.dialect
+    return "postgresql" if dialect.startswith("postgres") else dialect
+
+
+async def run_migrations(database: Database) -> List[int]:
+    """
+    Apply pending migrations in order inside a single transaction.
+    Returns the versions that were applied.
+    """
+    dialect = dialect_name(database)
+    applied: List[int] = []
+    async with database.transaction():
+        if dialect == "postgresql":
+            await database.execute(
+                f"SELECT pg_advisory_xact_lock({PG_MIGRATION_LOCK_ID})")
+        await create_tables(database, schema_migrations)
+        rows = await database.fetch_all(schema_migrations.select())
+        done = {r.version for r in rows}
+        for version, description, fn in sorted(MIGRATIONS,
+                                               key=lambda m: m[0]):
+            if version in done:
+                continue
+            logger.info(f"Applying migration {version:04d}: {description}")
+            await fn(database, dialect)
+            await database.execute(schema_migrations.insert().values(
+                version=version,
+                description=description))
+            applied.append(version)
+    if not applied:
+        logger.info("Database schema up to date")
+    return applied
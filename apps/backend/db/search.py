@@ -0,0 +1,201 @@
+from typing import Dict, List, Tuple
+from databases import Database
+from sqlalchemy import select, func, literal, union_all, cast, String
+from db.Tables import profile_transcripts, clips
+
+# ---------------------------------------------------------------------------
+# SQLite: FTS5 index kept up to date by triggers.
+# `search_documents` maps each indexed item to a stable FTS rowid so that
+# deletes are a primary-key lookup instead of a scan of the FTS table.
+# The trigram tokenizer matches any substring of 3+ characters, which
+# works for Japanese text without a word segmenter.
+# ---------------------------------------------------------------------------
+_CLIP_PRIMARY = """
+    coalesce(json_extract({0}.gpt_breakdown_response, '$.sentence'), '')
+    || ' ' ||
+    coalesce(json_extract({0}.gpt_breakdown_response, '$.focus.word'), '')
+"""
+_CLIP_SECONDARY = """
+    coalesce(json_extract({0}.gpt_breakdown_response, '$.gpt_explanation'),
+             '')
+    || ' ' ||
+    coalesce(json_extract({0}.gpt_breakdown_response, '$.focus.meanings'),
+             '')
+"""
+
+
+def _index_trigger(table: str, kind: str, columns: str, primary: str,
+                   secondary: str) -> List[str]:
+    insert = f"""
+        INSERT INTO search_documents (kind, item_id, profile_id)
+        VALUES ('{kind}', new.id, new.profile_id);
+        INSERT INTO search_index (rowid, primary_text, secondary_text)
+        VALUES (last_insert_rowid(), {primary.format('new')},
+                {secondary.format('new')});
+    """
+    delete = f"""
+        DELETE FROM search_index WHERE rowid = (
+            SELECT id FROM search_documents
+            WHERE kind = '{kind}' AND item_id = old.id);
+        DELETE FROM search_documents
+        WHERE kind = '{kind}' AND item_id = old.id;
+    """
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS search_{table}_ai
+            AFTER INSERT ON {table} BEGIN {insert} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS search_{table}_ad
+            AFTER DELETE ON {table} BEGIN {delete} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS search_{table}_au
+            AFTER UPDATE OF {columns} ON {table}
+            BEGIN {delete} {insert} END""",
+        # Backfill rows that existed before the index
+        f"""INSERT INTO search_documents (kind, item_id, profile_id)
+            SELECT '{kind}', id, profile_id FROM {table}""",
+        f"""INSERT INTO search_index (rowid, primary_text, secondary_text)
+            SELECT d.id, {primary.format('t')}, {secondary.format('t')}
+            FROM search_documents d JOIN {table} t
+            ON d.kind = '{kind}' AND d.item_id = t.id""",
+    ]
+
+
+SEARCH_SCHEMA_SQLITE = [
+    """CREATE TABLE IF NOT EXISTS search_documents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        item_id TEXT NOT NULL,
+        profile_id TEXT NOT NULL,
+        UNIQUE (kind, item_id))""",
+    """CREATE INDEX IF NOT EXISTS ix_search_documents_profile
+        ON search_documents (profile_id)""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        primary_text, secondary_text, tokenize = 'trigram')""",
+    *_index_trigger("profile_transcripts", "transcript",
+                    "transcript, gpt_explanation",
+                    "{0}.transcript",
+                    "coalesce({0}.gpt_explanation, '')"),
+    *_index_trigger("clips", "clip", "gpt_breakdown_response",
+                    _CLIP_PRIMARY, _CLIP_SECONDARY),
+]
+
+# Relative weight of the (primary_text, secondary_text) columns in bm25
+BM25_WEIGHTS = (2.0, 1.0)
+# Trigram MATCH needs at least 3 characters per term
+MIN_MATCH_LENGTH = 3
+
+
+def _clean_terms(query: str) -> List[str]:
+    """
+    Split a user query into literal terms. Leading / trailing '〜' and '~'
+    are dropped since they are commonly typed to denote grammar patterns
+    (e.g. 〜てしまう).
+    """
+    return [t.strip("〜~") for t in query.split() if t.strip("〜~")]
+
+
+async def _search_sqlite(db: Database,
+                         profile_id: str,
+                         terms: List[str],
+                         limit: int,
+                         offset: int) -> Tuple[int, List[Dict]]:
+    params = {"profile_id": profile_id, "limit": limit, "offset": offset}
+    if all(len(t) >= MIN_MATCH_LENGTH for t in terms):
+        # Every term as a quoted phrase, implicitly AND-ed
+        params["match"] = " ".join('"' + t.replace('"', '""') + '"'
+                                   for t in terms)
+        where = "search_index MATCH :match"
+        score = "bm25(search_index, {0}, {1})".format(*BM25_WEIGHTS)
+        order = "score"
+        # Pin the FTS table as the outer loop; otherwise SQLite may walk
+        # the profile index and re-run MATCH once per document
+        source = """search_index CROSS JOIN search_documents d
+                    ON d.id = search_index.rowid"""
+    else:
+        # Too short for the trigram index, fall back to a LIKE scan
+        likes = []
+        for i, t in enumerate(terms):
+            escaped = (t.replace("\\", "\\\\").replace("%", "\\%")
+                       .replace("_", "\\_"))
+            params[f"like_{i}"] = f"%{escaped}%"
+            likes.append(f"(primary_text LIKE :like_{i} ESCAPE '\\' OR "
+                         f"secondary_text LIKE :like_{i} ESCAPE '\\')")
+        where = " AND ".join(likes)
+        score = "0.0"
+        order = "d.id DESC"
+        # Only scan this profile's documents
+        source = """search_documents d CROSS JOIN search_index
+                    ON search_index.rowid = d.id"""
+    base = f"""
+        FROM {source}
+        WHERE {where} AND d.profile_id = :profile_id
+    """
+    count_params = {k: v for k, v in params.items()
+                    if k not in ("limit", "offset")}
+    total = await db.fetch_val(f"SELECT count(*) {base}", count_params)
+    rows = await db.fetch_all(f"""
+        SELECT d.kind AS kind, d.item_id AS item_id,
+               snippet(search_index, -1, '<b>', '</b>', '…', 24)
+               AS snippet,
+               {score} AS score
+        {base}
+        ORDER BY {order}
+        LIMIT :limit OFFSET :offset
+    """, params)
+    return total or 0, [{"kind": r.kind,
+                         "id": r.item_id,
+                         "snippet": r.snippet,
+                         "score": float(r.score)} for r in rows]
+
+
+async def _search_generic(db: Database,
+                          profile_id: str,
+                          terms: List[str],
+                          limit: int,
+                          offset: int) -> Tuple[int, List[Dict]]:
+    """
+    Backends without the FTS index (PostgreSQL) match the base tables
+    with case-insensitive substring filters.
+    """
+    breakdown = clips.c.gpt_breakdown_response
+    t_text = (profile_transcripts.c.transcript + " " +
+              func.coalesce(profile_transcripts.c.gpt_explanation, ""))
+    c_text = cast(breakdown, String)
+    t_sel = select(literal("transcript").label("kind"),
+                   profile_transcripts.c.id.label("item_id"),
+                   t_text.label("snippet"),
+                   profile_transcripts.c.created_at.label("created_at")
+                   ).where(profile_transcripts.c.profile_id == profile_id)
+    c_sel = select(literal("clip").label("kind"),
+                   clips.c.id.label("item_id"),
+                   c_text.label("snippet"),
+                   clips.c.created_at.label("created_at")
+                   ).where(clips.c.profile_id == profile_id)
+    for t in terms:
+        # autoescape: '%' and '_' in a term match literally
+        t_sel = t_sel.where(t_text.icontains(t, autoescape=True))
+        c_sel = c_sel.where(c_text.icontains(t, autoescape=True))
+    union = union_all(t_sel, c_sel).subquery()
+    total = await db.fetch_val(select(func.count()).select_from(union))
+    rows = await db.fetch_all(
+        select(union).order_by(union.c.created_at.desc())
+        .limit(limit).offset(offset))
+    return total or 0, [{"kind": r.kind,
+                         "id": r.item_id,
+                         "snippet": (r.snippet or "")[:200],
+                         "score": 0.0} for r in rows]
+
+
+async def search_profile(db: Database,
+                         profile_id: str,
+                         query: str,
+                         limit: int = 20,
+                         offset: int = 0) -> Tuple[int, List[Dict]]:
+    """
+    Search a profile's transcripts and clips. Returns the total number
+    of matches and one ranked page of results.
+    """
+    terms = _clean_terms(query)
+    if not terms:
+        return 0, []
+    if db.url.dialect == "sqlite":
+        return await _search_sqlite(db, profile_id, terms, limit, offset)
+    return await _search_generic(db, profile_id, terms, limit, offset)
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from typing import Any, List, Optional, Tuple
+from databases import Database
+from sqlalchemy.sql import ClauseElement
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    """
+    Single-writer queue which serializes all database writes through one
+    task and commits them in batched transactions.
+
+    SQLite only allows one writer at a time, so funnelling every write
+    through a single connection avoids `database is locked` errors when
+    several requests insert concurrently, while readers keep working
+    against the WAL snapshot.
+    """
+
+    def __init__(self,
+                 database: Database,
+                 max_batch_size: int = 64,
+                 max_batch_delay: float = 0.005):
+        self.database = database
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run(),
+                                           name="db-write-queue")
+        logger.info("Database write queue started")
+
+    async def stop(self) -> None:
+        """
+        Flush pending writes and stop the worker task.
+        """
+        if not self.running:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        logger.info("Database write queue stopped")
+
+    async def execute(self, query: ClauseElement) -> Any:
+        """
+        Enqueue a write and wait until the transaction containing it
+        has been committed. Returns the same value as `Database.execute`.
+        """
+        if not self.running:
+            return await self.database.execute(query)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[ClauseElement,
+                                                 asyncio.Future]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_batch_delay
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(),
+                                                    timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            try:
+                await self._commit_batch(batch)
+            except Exception as e:
+                logger.error(f"Write batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit_batch(self,
+                            batch: List[Tuple[ClauseElement,
+                                              asyncio.Future]]) -> None:
+        """
+        Run a batch in one transaction. Each statement gets its own
+        savepoint so a failing write only rolls back itself.
+        """
+        results = []
+        async with self.database.transaction():
+            for query, future in batch:
+                if future.cancelled():
+                    continue
+                try:
+                    async with self.database.transaction():
+                        result = await self.database.execute(query)
+                    results.append((future, result, None))
+                except Exception as e:
+                    results.append((future, None, e))
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
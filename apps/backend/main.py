@@ -2,7 +2,6 @@
 import logging
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from pathlib import Path
 from routers.gpt_router import gpt_router
@@ -12,7 +11,16 @@ from routers.dict_router import dict_router
 from routers.video_router import video_router
 from routers.profile_router import profile_router
 from contextlib import asynccontextmanager
-from db.db import connect_db, disconnect_db, DATABASE_URL
+from db.db import connect_db, disconnect_db, database
+from routers.media_router import media_router
+from routers.metrics_router import metrics_router
+from routers.admin_router import admin_router
+from utils.media_utils import MediaFiles, MEDIA_ACCEL_REDIRECT
+from utils.storage_utils import storage_janitor
+from utils.metrics_utils import MetricsMiddleware
+from utils.gpt_usage_utils import gpt_usage_ledger
+from utils.readiness_utils import readiness
+from utils.tracing_utils import TracingMiddleware, tracer
 
 logging.basicConfig(level=logging.INFO,
                     format="%(levelname)8s %(name)s | %(message)s",
@@ -32,8 +40,16 @@ async def lifespan(app: FastAPI):
     media_files_tmp = Path("media_files/temp").resolve()
     media_files_tmp.mkdir(exist_ok=True)
     logger.info(f"Storage ensured at: '{media_files.parent}'")
+    storage_janitor.start()
+    gpt_usage_ledger.start()
+    # Models load in the background; /health/ready reports progress
+    readiness.start()
     yield
+    await readiness.stop()
+    await gpt_usage_ledger.stop()
+    await storage_janitor.stop()
     await disconnect_db()
+    tracer.flush()
 
 
 app = FastAPI(
@@ -42,9 +58,13 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-app.mount("/media",
-          StaticFiles(directory=Path("media_files").resolve()),
-          name="media")
+if MEDIA_ACCEL_REDIRECT:
+    # nginx streams the files, the backend only authorizes
+    app.include_router(media_router)
+else:
+    app.mount("/media",
+              MediaFiles(directory=Path("media_files").resolve()),
+              name="media")
 
 origins = ["*"]
 
@@ -55,6 +75,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
+# Outermost, so the measured time covers the whole middleware stack
+app.add_middleware(MetricsMiddleware)
 
 
 @app.exception_handler(HTTPException)
@@ -63,6 +86,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         status_code=exc.status_code,
         content={"success": False,
                  "message": exc.detail},
+        headers=exc.headers,
     )
 
 app.include_router(gpt_router)
@@ -71,8 +95,13 @@ app.include_router(health_router)
 app.include_router(dict_router)
 app.include_router(video_router)
 app.include_router(profile_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
 
 
-logger.info(f"Database URL: {DATABASE_URL}")
+logger.info(f"Database URL: {database.url.obscure_password}")
 logger.info("Setup Complete")
-logger.info(f"Serving {Path('media_files').resolve()} at '/media'.")
+if MEDIA_ACCEL_REDIRECT:
+    logger.info("Delegating '/media' delivery to nginx (X-Accel-Redirect).")
+else:
+    logger.info(f"Serving {Path('media_files').resolve()} at '/media'.")
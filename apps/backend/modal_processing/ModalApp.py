@@ -1,151 +1,127 @@
-from typing import Union, Generator
+from typing import Generator, Optional
+from pathlib import Path
 import modal
 import logging
-from processing.whisper_wrapper import FWhisperWrapper
-from processing.audio_processing import AudioTools
-from pathlib import Path
+import os
+import time
+from modal_processing.executors import INPUT_MOUNT, MODAL_INPUT_VOLUME
+from modal_processing.jobs import WorkerJobs
 from dotenv import load_dotenv
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 # --- Modal Setup ---
-script_dir = Path(__file__).resolve().parent
-project_root_dir = script_dir.parent
-media_files_path = project_root_dir / "media_files"
-media_files_path.mkdir(parents=True,
-                       exist_ok=True)
-
-logger.info(f"Config Image + Mount {media_files_path} at /root/media_files")
-# Build media_files on modal container startup
+# Only the worker's source is added: inputs are read from the input
+# volume, so the image carries no media and its size does not grow with
+# the library
 mirumoji_image = modal.Image.from_registry(
     "docker.io/svdc1/mirumoji-modal-gpu:latest"
-).add_local_dir(media_files_path,
-                remote_path="/root/media_files")
-
-logger.info("Configured.")
+).add_local_python_source("modal_processing", "processing", "utils")
+
+MODAL_APP_NAME = os.getenv("MODAL_APP_NAME", "mirumoji-gpu")
+MODAL_GPU = os.getenv("MODAL_GPU", "A10G")
+# WhisperWorker autoscaling, applied by `modal deploy`
+MODAL_MIN_CONTAINERS = int(os.getenv("MODAL_MIN_CONTAINERS") or 0)
+MODAL_SCALEDOWN_WINDOW = int(os.getenv("MODAL_SCALEDOWN_WINDOW", "300"))
+# Inputs not sent for this long are removed from the input volume, every
+# MODAL_INPUT_PRUNE_INTERVAL (deployed app) and when a container starts
+MODAL_INPUT_RETENTION = int(os.getenv("MODAL_INPUT_RETENTION_SECONDS",
+                                      "86400"))
+MODAL_INPUT_PRUNE_INTERVAL = int(os.getenv(
+    "MODAL_INPUT_PRUNE_INTERVAL_SECONDS", "3600"))
+
+input_volume = modal.Volume.from_name(MODAL_INPUT_VOLUME,
+                                      create_if_missing=True)
 
 app = modal.App(
-    "mirumoji-gpu",
+    MODAL_APP_NAME,
     image=mirumoji_image
 )
 # --- End Modal Setup ---
 
 
-@app.function(
-    gpu="A10G",
-    timeout=600,
-    include_source=True
-)
-def transcribe_srt_job(OPENAI_API_KEY: str,
-                       media_fp: Union[str, Path]
-                       ) -> Union[str, None]:
+def _prune_inputs() -> int:
     """
-    Runs Whisper transcription on media_fp, fixes with GPT,
-    and returns SRT string.
+    Remove inputs not uploaded within MODAL_INPUT_RETENTION; every
+    upload renews the mtime (see executors._upload_input). Returns the
+    number removed.
     """
+    cutoff = time.time() - MODAL_INPUT_RETENTION
+    removed = 0
+    for entry in input_volume.listdir("/"):
+        if entry.mtime < cutoff:
+            input_volume.remove_file(entry.path)
+            removed += 1
+    if removed:
+        logger.info(f"Pruned {removed} inputs from {MODAL_INPUT_VOLUME}")
+    return removed
+
+
+@app.function(schedule=modal.Period(seconds=MODAL_INPUT_PRUNE_INTERVAL),
+              timeout=300)
+def prune_inputs() -> int:
+    """
+    Scheduled pruning, so the volume stays bounded while a keep-warm
+    pool (MODAL_MIN_CONTAINERS) means containers rarely start.
+    """
+    return _prune_inputs()
+
 
-    logging.basicConfig(level=logging.INFO,
-                        style="{",
-                        format="{levelname}-{name}-{message}"
-                        )
-
-    logger.info(f"transcribe_srt_job started for media: {media_fp}")
-    try:
-        fwhisper = FWhisperWrapper()
-
-        gpt_model_kwargs = {
-            "ApiKey": OPENAI_API_KEY,
-            "from_dotenv": False
-        }
-        srt_result_string = fwhisper.transcribe_to_srt(
-            audio_path=str(media_fp),
-            output_path=" ",
-            string_result=True,
-            fix_with_chat_gpt=True,
-            gpt_model_kwargs=gpt_model_kwargs
-            )
-
-        if srt_result_string:
-            logger.info(f"Generated SRT For: {media_fp}")
-            return srt_result_string
-        else:
-            logger.warning(f"SRT Transcription Failed For: {media_fp}")
-            return None
-    except Exception as e:
-        logger.error(f"Error in transcribe_srt_job for {media_fp}: {e}",
-                     exc_info=True)
-        return None
-
-
-@app.function(
-    gpu="A10G",
+@app.cls(
+    gpu=MODAL_GPU,
     timeout=600,
     include_source=True,
-    is_generator=True
+    min_containers=MODAL_MIN_CONTAINERS,
+    scaledown_window=MODAL_SCALEDOWN_WINDOW,
+    volumes={INPUT_MOUNT: input_volume}
 )
-def video_conversion_job(video_fp: Union[str, Path],
-                         ) -> Generator[bytes, None, None]:
+class WhisperWorker:
     """
-    Converts video_fp to MP4 using NVENC and returns the
-    video content as bytes.
+    Runs WorkerJobs on a GPU container. Deployed
+    (`modal deploy -m modal_processing.ModalApp`) it is looked up by
+    name and its containers serve requests until they scale down;
+    without a deployment it runs inside an ephemeral `app.run()`. Each
+    container loads and warms Whisper once, in `load`, and prunes the
+    input volume.
     """
-    logging.basicConfig(level=logging.INFO,
-                        style="{",
-                        format="{levelname}-{name}-{message}"
-                        )
-
-    logger.info(f"video_conversion_job started for video: {video_fp}")
-    tmp_p = Path.cwd() / "tmp"
-    logger.info(f"Using temporary directory for video conversion: {tmp_p}")
-
-    audio_tools = AudioTools(working_dir=tmp_p)
-
-    input_p = Path(video_fp)
-    outp_local = tmp_p / f"{input_p.stem}_converted.mp4"
-
-    try:
-        logger.info(f"Converting {video_fp} to {outp_local} using NVENC.")
-        result_p = audio_tools.to_mp4(
-            input_path=str(video_fp),
-            output_path=str(outp_local),
-            use_nvenc=True
-        )
-
-        if result_p and result_p.exists() and result_p.stat().st_size > 0:
-            logger.info(f"Converted video to: {result_p}")
-            video_bytes = result_p.read_bytes()
-            logger.info(
-                f"Returning {len(video_bytes)} bytes for converted video.")
-            # Stream the converted file in chunks
-            with open(result_p, "rb") as f:
-                while True:
-                    chunk = f.read(8192)
-                    if not chunk:
-                        break
-                    yield chunk
-            logger.info(f"Finished streaming video bytes for: {result_p}")
-        else:
-            e = f"Video conversion failed or produced an \
-                empty file for: {video_fp}"
-            logger.error(e)
-            raise Exception(e)
-    except Exception as e:
-        logger.error(f"Error in video_conversion_job for {video_fp}: {e}",
-                     exc_info=True)
-        raise e
-
-
-@app.function(
-    gpu="A10G",
-    timeout=600,
-    include_source=True
-)
-def transcribe_to_string_job(audio_fp: Union[str, Path],
-                             ) -> Union[str, None]:
-    logging.basicConfig(level=logging.INFO,
-                        style="{",
-                        format="{levelname}-{name}-{message}"
-                        )
-    fwhisper = FWhisperWrapper()
-    return fwhisper.transcribe_to_str(audio_fp)
+    @modal.enter()
+    def load(self) -> None:
+        logging.basicConfig(level=logging.INFO,
+                            style="{",
+                            format="{levelname}-{name}-{message}"
+                            )
+        self.jobs = WorkerJobs()
+        self.jobs.warm_up()
+        # Ephemeral runs have no schedule
+        try:
+            _prune_inputs()
+        except Exception as e:
+            logger.warning(f"Could not prune {MODAL_INPUT_VOLUME}: {e}")
+
+    @staticmethod
+    def input_path(media_fp: str) -> str:
+        """
+        `media_fp` once visible: files uploaded after this container
+        mounted the volume appear on reload.
+        """
+        if not Path(media_fp).exists():
+            input_volume.reload()
+        return media_fp
+
+    @modal.method()
+    def recipe(self, output: str) -> str:
+        return self.jobs.recipe(output)
+
+    @modal.method()
+    def transcribe_srt(self, OPENAI_API_KEY: str, media_fp: str) -> dict:
+        return self.jobs.transcribe_srt(OPENAI_API_KEY,
+                                        self.input_path(media_fp))
+
+    @modal.method()
+    def transcribe_str(self, media_fp: str) -> Optional[dict]:
+        return self.jobs.transcribe_str(self.input_path(media_fp))
+
+    @modal.method(is_generator=True)
+    def convert_to_mp4(self, video_fp: str) -> Generator[bytes, None, None]:
+        yield from self.jobs.convert_to_mp4(self.input_path(video_fp))
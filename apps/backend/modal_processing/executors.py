@@ -0,0 +1,297 @@
+"""
+Executors run the GPU jobs (transcription and MP4 conversion) for a
+Processor created with `use_modal=True`, by calling the methods of
+`jobs.WorkerJobs` on a worker:
+
+- `ModalDeployedExecutor` calls the `WhisperWorker` class of the
+  deployed app, looked up by name. Its containers keep Whisper loaded,
+  and a keep-warm pool removes cold starts altogether.
+- `ModalEphemeralExecutor` runs WhisperWorker in an ephemeral app for
+  every call (`app.run()`), cold-starting a container each time.
+- `LocalExecutor` is an in-process stand-in running WorkerJobs in
+  worker threads, for tests and development without Modal.
+
+Inputs are staged where the worker can read them without loading them
+into memory: Modal workers read them from a volume (MODAL_INPUT_VOLUME,
+mounted at INPUT_MOUNT) they are uploaded to from disk, keyed by content
+hash so a file's blocks are only sent once, and LocalExecutor reads
+them in place. Outputs come back as return values or, for the converted video,
+a stream of chunks, so workers never need access to media_files.
+
+MODAL_EXECUTOR selects one: `auto` (default) uses the deployed app and
+falls back to ephemeral runs if it is not deployed.
+"""
+import asyncio
+import logging
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+MODAL_EXECUTOR = os.getenv("MODAL_EXECUTOR", "auto")
+MODAL_APP_NAME = os.getenv("MODAL_APP_NAME", "mirumoji-gpu")
+WORKER_CLASS = "WhisperWorker"
+# Applied to the deployed worker at startup when set, overriding the
+# value it was deployed with
+MODAL_MIN_CONTAINERS = os.getenv("MODAL_MIN_CONTAINERS") or None
+# Volume the inputs of Modal workers are uploaded to, and its mount point
+# on the workers
+MODAL_INPUT_VOLUME = os.getenv("MODAL_INPUT_VOLUME", "mirumoji-inputs")
+INPUT_MOUNT = "/inputs"
+
+
+@lru_cache(maxsize=None)
+def _input_volume():
+    import modal
+    return modal.Volume.from_name(MODAL_INPUT_VOLUME,
+                                  create_if_missing=True)
+
+
+def _upload_input(path: Path) -> str:
+    """
+    Upload a local input file to the input volume and return its path on
+    the workers. Blocking. The file is streamed from disk under the name
+    `<sha256><suffix>`.
+    """
+    from utils.blob_store import hash_file
+    key = f"{hash_file(path)}{path.suffix}"
+    # Put again when already there: that renews its mtime, which pruning
+    # (ModalApp.prune_inputs) goes by, and the volume only transfers the
+    # blocks it doesn't have
+    with _input_volume().batch_upload(force=True) as batch:
+        batch.put_file(path, f"/{key}")
+    logger.info(f"Uploaded {path.name} to {MODAL_INPUT_VOLUME} as {key}")
+    return f"{INPUT_MOUNT}/{key}"
+
+
+class RemoteExecutor:
+    """
+    Interface of the GPU job executors. Paths are local files; executors
+    implement `_stage` to make one readable by their worker, and `_call`
+    and `_call_gen` to run a WorkerJobs method on it.
+    """
+    name = "remote"
+    # Whether GPT usage of the worker's jobs has to be passed on to this
+    # process's GptModel listeners
+    reports_usage = True
+
+    def __init__(self):
+        self._recipes = {}
+
+    async def _stage(self, path: Path) -> str:
+        raise NotImplementedError
+
+    async def _call(self, method: str, **kwargs):
+        raise NotImplementedError
+
+    def _call_gen(self, method: str, **kwargs) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def recipe(self, output: str) -> str:
+        """
+        Derived-output key of the worker's `output` (see
+        FWhisperWrapper.recipe), asked once per output.
+        """
+        if output not in self._recipes:
+            self._recipes[output] = await self._call("recipe", output=output)
+        return self._recipes[output]
+
+    async def transcribe_to_srt(self, media_fp: Union[str, Path],
+                                openai_api_key: str) -> Optional[str]:
+        """
+        Transcribe media to an SRT string, fixed up with GPT.
+        """
+        result = await self._call("transcribe_srt",
+                                  OPENAI_API_KEY=openai_api_key,
+                                  media_fp=await self._stage(Path(media_fp)))
+        if self.reports_usage:
+            # Into this process's ledger and budgets
+            from processing.gpt_wrapper import GptModel
+            for record in result["gpt_usage"]:
+                GptModel.notify_usage(**record)
+        return result["srt"]
+
+    async def transcribe_to_str(self,
+                                audio_fp: Union[str, Path]
+                                ) -> Optional[dict]:
+        """
+        Transcribe audio, as returned by FWhisperWrapper.transcribe_to_str.
+        """
+        return await self._call("transcribe_str",
+                                media_fp=await self._stage(Path(audio_fp)))
+
+    async def convert_to_mp4(self, video_fp: Union[str, Path]
+                             ) -> AsyncIterator[bytes]:
+        """
+        Convert a video to MP4, yielding the result in chunks.
+        """
+        video_fp = await self._stage(Path(video_fp))
+        async for chunk in self._call_gen("convert_to_mp4",
+                                          video_fp=video_fp):
+            yield chunk
+
+    def warm_up(self) -> None:
+        """
+        Blocking preparation run at startup (see utils/readiness_utils).
+        """
+
+
+class LocalExecutor(RemoteExecutor):
+    """
+    Runs WorkerJobs in this process, in worker threads.
+    """
+    name = "local"
+    # Jobs run here, their GPT requests reach the listeners directly
+    reports_usage = False
+
+    def __init__(self, jobs=None):
+        super().__init__()
+        self._jobs = jobs
+
+    @property
+    def jobs(self):
+        if self._jobs is None:
+            from modal_processing.jobs import WorkerJobs
+            self._jobs = WorkerJobs()
+        return self._jobs
+
+    async def _stage(self, path):
+        # Same filesystem, read in place
+        return str(path)
+
+    async def _call(self, method, **kwargs):
+        return await asyncio.to_thread(getattr(self.jobs, method), **kwargs)
+
+    async def _call_gen(self, method, **kwargs):
+        chunks = getattr(self.jobs, method)(**kwargs)
+        while (chunk := await asyncio.to_thread(next, chunks, None)) \
+                is not None:
+            yield chunk
+
+    def warm_up(self) -> None:
+        self.jobs.warm_up()
+
+
+class ModalEphemeralExecutor(RemoteExecutor):
+    """
+    Runs WhisperWorker in an ephemeral app per call.
+    """
+    name = "modal_ephemeral"
+
+    @property
+    def modal_app(self):
+        # Imports and configures modal on first use
+        from modal_processing import ModalApp
+        return ModalApp
+
+    async def _stage(self, path):
+        return await asyncio.to_thread(_upload_input, path)
+
+    async def _call(self, method, **kwargs):
+        async with self.modal_app.app.run():
+            worker = self.modal_app.WhisperWorker()
+            return await getattr(worker, method).remote.aio(**kwargs)
+
+    async def _call_gen(self, method, **kwargs):
+        async with self.modal_app.app.run():
+            worker = self.modal_app.WhisperWorker()
+            async for chunk in getattr(worker, method).remote_gen.aio(
+                    **kwargs):
+                yield chunk
+
+    def warm_up(self) -> None:
+        self.modal_app
+
+
+class ModalDeployedExecutor(RemoteExecutor):
+    """
+    Calls the deployed WhisperWorker. With a `fallback`, calls go there
+    instead when the app has not been deployed.
+    """
+    name = "modal_deployed"
+
+    def __init__(self, app_name: str = MODAL_APP_NAME,
+                 fallback: Optional[RemoteExecutor] = None):
+        super().__init__()
+        self.app_name = app_name
+        self.fallback = fallback
+        self._worker = None
+        self._use_fallback = False
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        """
+        The deployed worker, or None to use the fallback. Blocking: the
+        first call looks the class up on Modal.
+        """
+        with self._lock:
+            if self._worker is None and not self._use_fallback:
+                import modal
+                cls = modal.Cls.from_name(self.app_name, WORKER_CLASS)
+                try:
+                    cls.hydrate()
+                except modal.exception.NotFoundError:
+                    if self.fallback is None:
+                        raise
+                    logger.warning(
+                        f"Modal app {self.app_name} is not deployed, "
+                        f"using {self.fallback.name} runs instead")
+                    self._use_fallback = True
+                    return None
+                worker = cls()
+                if MODAL_MIN_CONTAINERS is not None:
+                    worker.update_autoscaler(
+                        min_containers=int(MODAL_MIN_CONTAINERS))
+                logger.info(f"Using deployed {self.app_name}.{WORKER_CLASS}")
+                self._worker = worker
+            return self._worker
+
+    async def _target(self):
+        if self._worker is not None:
+            return self._worker
+        return await asyncio.to_thread(self._resolve)
+
+    async def _stage(self, path):
+        if await self._target() is None:
+            return await self.fallback._stage(path)
+        return await asyncio.to_thread(_upload_input, path)
+
+    async def _call(self, method, **kwargs):
+        worker = await self._target()
+        if worker is None:
+            return await self.fallback._call(method, **kwargs)
+        return await getattr(worker, method).remote.aio(**kwargs)
+
+    async def _call_gen(self, method, **kwargs):
+        worker = await self._target()
+        if worker is None:
+            chunks = self.fallback._call_gen(method, **kwargs)
+        else:
+            chunks = getattr(worker, method).remote_gen.aio(**kwargs)
+        async for chunk in chunks:
+            yield chunk
+
+    def warm_up(self) -> None:
+        self._resolve()
+        if self._use_fallback:
+            self.fallback.warm_up()
+
+
+@lru_cache(maxsize=None)
+def get_executor(mode: str = MODAL_EXECUTOR) -> RemoteExecutor:
+    """
+    Executor for a MODAL_EXECUTOR value: auto, deployed, ephemeral or
+    local. Shared per mode, so the worker is looked up once.
+    """
+    if mode == "local":
+        return LocalExecutor()
+    if mode == "ephemeral":
+        return ModalEphemeralExecutor()
+    if mode == "deployed":
+        return ModalDeployedExecutor()
+    if mode == "auto":
+        return ModalDeployedExecutor(fallback=ModalEphemeralExecutor())
+    raise ValueError(f"Unknown MODAL_EXECUTOR: {mode}")
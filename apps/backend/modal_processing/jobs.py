@@ -0,0 +1,107 @@
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Generator, Iterator, List, Optional
+from processing.gpt_wrapper import GptModel
+from processing.whisper_wrapper import shared_whisper
+from processing.audio_processing import AudioTools
+
+logger = logging.getLogger(__name__)
+
+# Size of the pieces the converted video is streamed back in
+CHUNK_SIZE = 1024 * 1024
+
+
+@contextmanager
+def captured_usage() -> Iterator[List[Dict]]:
+    """
+    Collects the usage records (see GptModel.notify_usage) of the GPT
+    requests this thread makes meanwhile.
+    """
+    records: List[Dict] = []
+    thread = threading.get_ident()
+
+    def listener(record: Dict) -> None:
+        if threading.get_ident() == thread:
+            records.append(record)
+
+    GptModel.usage_listeners.append(listener)
+    try:
+        yield records
+    finally:
+        GptModel.usage_listeners.remove(listener)
+
+
+class WorkerJobs:
+    """
+    The GPU jobs as run by a worker: Modal's WhisperWorker, or in
+    process by LocalExecutor. Inputs are paths on the worker's
+    filesystem (see RemoteExecutor._stage), keeping their original
+    suffix for ffmpeg's format detection, and outputs go back as return
+    values or streamed chunks, so workers need no access to media_files.
+    """
+    def __init__(self):
+        self.fwhisper = shared_whisper()
+
+    def warm_up(self) -> None:
+        self.fwhisper.warm_up()
+
+    def recipe(self, output: str) -> str:
+        return self.fwhisper.recipe(output)
+
+    def transcribe_srt(self, OPENAI_API_KEY: str, media_fp: str) -> Dict:
+        """
+        Transcribe media with Whisper and fix it with GPT. Returns the SRT
+        string (None on failure) as "srt", and the usage records of the
+        GPT requests as "gpt_usage", for the caller's ledger: on a Modal
+        worker they never reach the backend's GptModel listeners.
+        """
+        logger.info(f"SRT transcription of {Path(media_fp).name}")
+        with captured_usage() as gpt_usage:
+            try:
+                srt_result_string = self.fwhisper.transcribe_to_srt(
+                    audio_path=media_fp,
+                    output_path=" ",
+                    string_result=True,
+                    fix_with_chat_gpt=True,
+                    gpt_model_kwargs={"ApiKey": OPENAI_API_KEY,
+                                      "from_dotenv": False})
+            except Exception as e:
+                logger.error(f"Error transcribing to SRT: {e}",
+                             exc_info=True)
+                srt_result_string = None
+        if not srt_result_string:
+            logger.warning("SRT transcription failed")
+            srt_result_string = None
+        return {"srt": srt_result_string, "gpt_usage": gpt_usage}
+
+    def transcribe_str(self, media_fp: str) -> Optional[dict]:
+        """
+        Transcribe audio to a single string, see
+        FWhisperWrapper.transcribe_to_str.
+        """
+        return self.fwhisper.transcribe_to_str(media_fp)
+
+    def convert_to_mp4(self, video_fp: str, use_nvenc: bool = True
+                       ) -> Generator[bytes, None, None]:
+        """
+        Convert a video to MP4 and stream the result in chunks.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            outp_local = Path(tmp) / "converted.mp4"
+            logger.info(f"Converting {Path(video_fp).name} to MP4")
+            result_p = AudioTools(working_dir=tmp).to_mp4(
+                input_path=video_fp,
+                output_path=str(outp_local),
+                use_nvenc=use_nvenc)
+            if not result_p or not result_p.exists() \
+                    or result_p.stat().st_size == 0:
+                raise RuntimeError("Video conversion failed or produced "
+                                   "an empty file")
+            logger.info(f"Streaming {result_p.stat().st_size} bytes of "
+                        f"converted video")
+            with open(result_p, "rb") as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    yield chunk
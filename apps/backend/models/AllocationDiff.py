@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class AllocationDiff(BaseModel):
+    location: str
+    size_diff_bytes: int
+    size_bytes: int
+    count_diff: int
@@ -1,5 +1,12 @@
 from pydantic import BaseModel
+from typing import Optional
 
 
 class AnkiExportResponse(BaseModel):
     anki_deck_url: str
+    cached: bool = False
+    compact: bool = False
+    clip_bytes: Optional[int] = None
+    package_bytes: Optional[int] = None
+    saved_ratio: Optional[float] = None
+    export_seconds: Optional[float] = None
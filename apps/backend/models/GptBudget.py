@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+class GptBudget(BaseModel):
+    budget_usd: Optional[float] = None
+    window_seconds: int
+    spent_usd: float
+    remaining_usd: Optional[float] = None
+    retry_after_seconds: Optional[int] = None
@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+
+class GptBudgetUpdate(BaseModel):
+    # 0 disables the limit for this profile
+    budget_usd: float = Field(..., ge=0)
+    window_seconds: Optional[int] = Field(None, gt=0)
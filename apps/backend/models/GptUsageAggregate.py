@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+class GptUsageAggregate(BaseModel):
+    key: Optional[str] = None
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    cost_usd: float
+    avg_latency_ms: float
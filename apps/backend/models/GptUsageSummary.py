@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from models.GptUsageAggregate import GptUsageAggregate
+
+
+class GptUsageSummary(BaseModel):
+    since: str
+    group_by: Optional[str] = None
+    total: GptUsageAggregate
+    groups: List[GptUsageAggregate] = []
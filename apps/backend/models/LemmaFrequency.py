@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+class LemmaFrequency(BaseModel):
+    lemma: str
+    occurrences: int
+    sources: int
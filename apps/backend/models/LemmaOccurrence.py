@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+class LemmaOccurrence(BaseModel):
+    source_type: str
+    source_id: str
+    occurrences: int
+    created_at: Optional[str] = None
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+from models.SearchResult import SearchResult
+from typing import List
+
+
+class SearchResponse(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    results: List[SearchResult]
@@ -6,6 +6,7 @@ from processing.text_processing import SentenceBreakdownService
 from processing.audio_processing import AudioTools
 from dotenv import load_dotenv
 from utils.env_utils import check_env
+from utils.metrics_utils import observe_stage
 
 
 class Processor:
@@ -19,6 +20,7 @@ class Processor:
         gpt_version: str = "gpt-4.1-mini",
         dotenv_path: Union[str, Path, None] = None,
         whisper_kwargs: Dict = {},
+        executor=None,
         OPENAI_API_KEY: Optional[str] = None,
         MODAL_TOKEN_ID: Optional[str] = None,
         MODAL_TOKEN_SECRET: Optional[str] = None
@@ -26,7 +28,10 @@ class Processor:
 
         """
         Initalize instance with API Keys or collect from
-        environment variables
+        environment variables.
+
+        With `use_modal`, GPU jobs go to `executor`, by default the one
+        selected by MODAL_EXECUTOR (see modal_processing/executors.py).
         """
         self.logger = logging.getLogger(__class__.__name__)
         # Configure Save Path
@@ -57,19 +62,15 @@ class Processor:
             self.audio_tools = AudioTools(self.save_path.name)
         else:
             self.audio_tools = AudioTools(self.save_path)
+        # Remote executor or local Whisper, both loaded lazily
         if use_modal:
-            from modal_processing.ModalApp import (app,
-                                                   transcribe_srt_job,
-                                                   transcribe_to_string_job,
-                                                   video_conversion_job
-                                                   )
-            self.modal_app = app
-            self.transcribe_srt_job = transcribe_srt_job
-            self.transcribe_to_string_job = transcribe_to_string_job
-            self.video_conversion_job = video_conversion_job
+            if executor is None:
+                from modal_processing.executors import get_executor
+                executor = get_executor()
+            self.executor = executor
         else:
-            from processing.whisper_wrapper import FWhisperWrapper
-            self.fwhisper = FWhisperWrapper(**whisper_kwargs)
+            from processing.whisper_wrapper import shared_whisper
+            self.fwhisper = shared_whisper(**whisper_kwargs)
         # Save attrs
         self.save_path_input = save_path
         self.use_modal = use_modal
@@ -104,33 +105,31 @@ class Processor:
         if isinstance(self.save_path, TemporaryDirectory):
             self.save_path.cleanup()
 
+    async def modal_recipe(self, output: str) -> str:
+        return await self.executor.recipe(output)
+
     async def modal_transcribe_to_srt(self,
                                       media_fp: Union[str, Path]
                                       ) -> Union[str, None]:
-        async with self.modal_app.run():
-            media_fp = Path(media_fp).as_posix()
-            return await self.transcribe_srt_job.remote.aio(
-                OPENAI_API_KEY=self.API_KEYS["OPENAI_API_KEY"],
-                media_fp=media_fp)
+        with observe_stage("modal_transcribe"):
+            return await self.executor.transcribe_to_srt(
+                media_fp, self.API_KEYS["OPENAI_API_KEY"])
 
     async def modal_transcribe_to_str(self,
                                       audio_fp: Union[str, Path]
                                       ) -> Union[str, None]:
-        with self.modal_app.run():
-            audio_fp = Path(audio_fp).as_posix()
-            return self.transcribe_to_string_job.remote(audio_fp=audio_fp)
+        with observe_stage("modal_transcribe"):
+            return await self.executor.transcribe_to_str(audio_fp)
 
     async def modal_convert_to_mp4(self,
                                    video_fp: Union[str, Path],
                                    outpath: Union[str, Path]
                                    ):
-        with self.modal_app.run():
-            video_fp = Path(video_fp).as_posix()
-            outpath = Path(outpath).as_posix()
+        with observe_stage("modal_convert"):
             try:
-                async for chunk in self.video_conversion_job.remote_gen.aio(
-                       video_fp=video_fp):
-                    with open(outpath, "ab") as f_out:
+                with open(outpath, "wb") as f_out:
+                    async for chunk in self.executor.convert_to_mp4(
+                            video_fp):
                         f_out.write(chunk)
                 self.logger.info("Finished receiving converted video")
                 return Path(outpath)
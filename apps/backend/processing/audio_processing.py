@@ -4,6 +4,8 @@ import pathlib
 from typing import Union
 import logging
 from datetime import datetime
+from utils.metrics_utils import timed_stage
+from utils.tracing_utils import KIND_CLIENT, tracer
 
 
 class AudioTools:
@@ -49,41 +51,59 @@ class AudioTools:
         in case of failed subprocess execution.
         """
         self.logger.debug(f"Running Command: {' '.join(command)}")
+        program = pathlib.Path(command[0]).name
+        with tracer.span(f"subprocess {program}", kind=KIND_CLIENT,
+                         **{"process.executable.name": program,
+                            "process.command_args.count": len(command)}
+                         ) as span:
+            # The child inherits the trace as TRACEPARENT
+            env = tracer.subprocess_env()
+            try:
+                if hide_and_log:
+                    result = subprocess.run(command,
+                                            check=check,
+                                            stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.PIPE,
+                                            text=True,
+                                            cwd=cwd,
+                                            env=env)
+                else:
+                    result = subprocess.run(command,
+                                            check=check,
+                                            capture_output=capture_output,
+                                            text=True,
+                                            cwd=cwd,
+                                            env=env)
+                if span:
+                    span.set_attribute("process.exit.code",
+                                       result.returncode)
+                    if result.returncode != 0:
+                        span.error = f"exit code {result.returncode}"
 
-        try:
-            if hide_and_log:
-                result = subprocess.run(command,
-                                        check=check,
-                                        stdout=subprocess.DEVNULL,
-                                        stderr=subprocess.PIPE,
-                                        text=True,
-                                        cwd=cwd)
-            else:
-                result = subprocess.run(command,
-                                        check=check,
-                                        capture_output=capture_output,
-                                        text=True,
-                                        cwd=cwd)
-
-            if capture_output:
-                self.logger.debug(f"STDOUT: {result.stdout}")
-                self.logger.debug(f"STDERR: {result.stderr}")
+                if capture_output:
+                    self.logger.debug(f"STDOUT: {result.stdout}")
+                    self.logger.debug(f"STDERR: {result.stderr}")
 
-            return result
+                return result
 
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Command Failed: {' '.join(command)}")
-            if capture_output:
-                self.logger.error(f"STDOUT: {e.stdout}")
-                self.logger.error(f"STDERR: {e.stderr}")
-                error_message = e.stderr.decode()
-                timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-                with open(self.working_dir / "error_log.txt",
-                          "w", encoding="utf-8") as log_file:
-                    log_file.write(
-                        f"{timestamp} FFmpeg error:\n{error_message}\n\n")
-            return None
+            except subprocess.CalledProcessError as e:
+                if span:
+                    span.set_attribute("process.exit.code", e.returncode)
+                    span.error = f"exit code {e.returncode}"
+                self.logger.error(f"Command Failed: {' '.join(command)}")
+                if capture_output:
+                    self.logger.error(f"STDOUT: {e.stdout}")
+                    self.logger.error(f"STDERR: {e.stderr}")
+                    error_message = e.stderr.decode()
+                    timestamp = datetime.now().strftime(
+                        "[%Y-%m-%d %H:%M:%S]")
+                    with open(self.working_dir / "error_log.txt",
+                              "w", encoding="utf-8") as log_file:
+                        log_file.write(
+                            f"{timestamp} FFmpeg error:\n{error_message}\n\n")
+                return None
 
+    @timed_stage("ffmpeg_encode")
     def to_wav(self,
                input_path: str,
                output_path: str = None):
@@ -106,6 +126,7 @@ class AudioTools:
                          hide_and_log=True)
         return op
 
+    @timed_stage("ffmpeg_extract")
     def extract_audio(self, input_path: str) -> str:
         """
         If input is a video container, extract to a temp WAV.
@@ -132,6 +153,7 @@ class AudioTools:
         self.logger.debug(f"Audio Saved at {so}")
         return out
 
+    @timed_stage("ffmpeg_filter")
     def filter_audio(self,
                      input_path: str,
                      output_wav: str,
@@ -167,6 +189,7 @@ class AudioTools:
         self.run_command(cmd, hide_and_log=True)
         return output_wav
 
+    @timed_stage("ffmpeg_encode")
     def to_mp4(
         self,
         input_path: str,
@@ -261,3 +284,76 @@ class AudioTools:
 
         self.logger.info("Converted %s → %s", src.name, dst.name)
         return dst
+
+    @timed_stage("ffmpeg_compact")
+    def to_compact_clip(
+        self,
+        input_path: str,
+        output_path: str,
+        max_height: int = 360,
+        codec: str = "h264",
+        threads: int = 1,
+    ) -> pathlib.Path | None:
+        """
+        Transcode a short clip to a small, mobile-friendly rendition
+        for Anki decks.
+
+        Args:
+            input_path:  Source clip.
+            output_path: Destination (.mp4 for 'h264', .webm for 'vp9').
+            max_height:  Downscale to at most this height, keeping aspect.
+            codec:       'h264' (H.264 + AAC, plays everywhere) or
+                         'vp9' (VP9 + Opus, smaller).
+            threads:     Encoder threads; keep low when running many
+                         transcodes in parallel.
+
+        Returns:
+            pathlib.Path of the clip, or None on failure.
+        """
+        src = pathlib.Path(input_path).resolve()
+        if not src.is_file():
+            self.logger.error("to_compact_clip: %s does not exist", src)
+            return None
+        dst = pathlib.Path(output_path).resolve()
+        # Never upscale, keep even dimensions for the encoders
+        vf = f"scale=-2:'min({max_height},ih)'"
+        if codec == "h264":
+            enc_args = [
+                "-c:v", "libx264",
+                "-profile:v", "main",
+                "-preset", "veryfast",
+                "-crf", "28",
+                "-pix_fmt", "yuv420p",
+                "-c:a", "aac",
+                "-b:a", "64k",
+                "-movflags", "+faststart",
+            ]
+        elif codec == "vp9":
+            enc_args = [
+                "-c:v", "libvpx-vp9",
+                "-crf", "36",
+                "-b:v", "0",
+                "-deadline", "good",
+                "-cpu-used", "4",
+                "-row-mt", "1",
+                "-c:a", "libopus",
+                "-b:a", "48k",
+            ]
+        else:
+            self.logger.error("to_compact_clip: unknown codec %s", codec)
+            return None
+        cmd = [
+            self.ffmpeg, "-y",
+            "-i", src.as_posix(),
+            "-vf", vf,
+            "-threads", str(threads),
+            *enc_args,
+            "-ac", "1",
+            dst.as_posix(),
+        ]
+        result = self.run_command(cmd, capture_output=True, hide_and_log=True)
+        if result is None or result.returncode != 0 or not dst.exists():
+            self.logger.error("FFmpeg to_compact_clip failed:\n%s",
+                              result.stderr if result else "")
+            return None
+        return dst
@@ -1,17 +1,31 @@
-from openai import OpenAI
-from openai.types.chat.chat_completion import ChatCompletion
 from dotenv import dotenv_values, load_dotenv
+from typing import TYPE_CHECKING, Callable, Dict, List
+from utils.metrics_utils import observe_duration, observe_gpt, observe_stage
+from utils.tracing_utils import tracer
 import logging
 import os
+import time
+
+if TYPE_CHECKING:
+    # openai takes a few hundred ms to import, so only on first request
+    from openai import OpenAI
+    from openai.types.chat.chat_completion import ChatCompletion
 
 
 class GptModel:
     model_versions = ['gpt-4.1', 'gpt-4o-mini', 'gpt-4o', 'gpt-4.1-mini']
     # Per 1 Million Tokens, in Dollars
-    pricing_dict = {'gpt-4o-mini': {'input': 0.150, 'output': 0.6},
-                    'gpt-4.1': {'input': 2.0, 'output': 8},
-                    'gpt-4o': {'input': 2.5, 'output': 10},
-                    'gpt-4.1-mini': {'input': 0.4, 'output': 1.6}}
+    pricing_dict = {'gpt-4o-mini': {'input': 0.150, 'cached_input': 0.075,
+                                    'output': 0.6},
+                    'gpt-4.1': {'input': 2.0, 'cached_input': 0.5,
+                                'output': 8},
+                    'gpt-4o': {'input': 2.5, 'cached_input': 1.25,
+                               'output': 10},
+                    'gpt-4.1-mini': {'input': 0.4, 'cached_input': 0.1,
+                                     'output': 1.6}}
+    # Called with a usage record (see notify_usage) after every request,
+    # e.g. by the usage ledger in utils/gpt_usage_utils.py
+    usage_listeners: List[Callable[[Dict], None]] = []
 
     logger = logging.getLogger('gpt-model')
     fr_0 = 'Success,Complete Message'
@@ -49,7 +63,8 @@ class GptModel:
                 _msg += 'client'
                 GptModel.logger.error(_msg)
                 raise Exception(_msg)
-            self.client = OpenAI(api_key=key)
+            self._api_key = key
+            self._client = None
             if version not in GptModel.model_versions:
                 _msg = 'Model version provided is not supported, got'
                 _msg += f"{version};Expected one of {GptModel.model_versions}"
@@ -94,28 +109,69 @@ class GptModel:
         return {"role": "assistant", "content": message}
 
     @staticmethod
-    def response_price(model: str, input_tokens: int, output_tokens: int):
+    def response_price(model: str, input_tokens: int, output_tokens: int,
+                       cached_tokens: int = 0):
         if model not in GptModel.model_versions:
             raise Exception(f'Model {model} not supported')
         input_price_1m = GptModel.pricing_dict[model]['input']
+        cached_price_1m = GptModel.pricing_dict[model]['cached_input']
         output_price_1m = GptModel.pricing_dict[model]['output']
         input_price_per_token = input_price_1m/(10**6)
+        cached_price_per_token = cached_price_1m/(10**6)
         output_price_per_token = output_price_1m/(10**6)
-        InputPrice = input_tokens*input_price_per_token
+        # Cached prompt tokens are part of input_tokens
+        InputPrice = (input_tokens-cached_tokens)*input_price_per_token
+        InputPrice += cached_tokens*cached_price_per_token
         OutputPrice = output_tokens*output_price_per_token
         return InputPrice+OutputPrice
 
     @staticmethod
-    def process_output(response: ChatCompletion,
+    def cached_prompt_tokens(usage_dict: Dict) -> int:
+        details = usage_dict.get('prompt_tokens_details') or {}
+        return int(details.get('cached_tokens') or 0)
+
+    @classmethod
+    def notify_usage(cls, model: str, latency_ms: float,
+                     finish_reason: str, prompt_tokens: int = 0,
+                     completion_tokens: int = 0, cached_tokens: int = 0,
+                     cost_usd: float = 0.0):
+        record = {'model': model,
+                  'prompt_tokens': prompt_tokens,
+                  'completion_tokens': completion_tokens,
+                  'cached_tokens': cached_tokens,
+                  'cost_usd': cost_usd,
+                  'latency_ms': latency_ms,
+                  'finish_reason': finish_reason}
+        # Listeners may be removed by other threads meanwhile
+        for listener in list(cls.usage_listeners):
+            try:
+                listener(record)
+            except Exception as e:
+                cls.logger.error(f'Usage listener failed : {str(e)}')
+
+    @property
+    def client(self) -> "OpenAI":
+        """
+        OpenAI client, created on first use.
+        """
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self._api_key)
+        return self._client
+
+    @staticmethod
+    def process_output(response: "ChatCompletion",
                        model: str):
         usage_dict = response.usage.to_dict()
         try:
             prompt_tokens = int(usage_dict['prompt_tokens'])
             output_tokens = int(usage_dict['completion_tokens'])
             total_tokens = int(usage_dict['total_tokens'])
+            cached_tokens = GptModel.cached_prompt_tokens(usage_dict)
             request_price = GptModel.response_price(model,
                                                     prompt_tokens,
-                                                    output_tokens)
+                                                    output_tokens,
+                                                    cached_tokens)
         except Exception as e:
             em = "Error converting token counts to int"
             em += f"and calculating price : {str(e)}"
@@ -138,6 +194,7 @@ class GptModel:
 
         return {'output': message, 'prompt_tokens': prompt_tokens,
                 'output_tokens': output_tokens, 'total_tokens': total_tokens,
+                'cached_tokens': cached_tokens,
                 'finish_reason': finish_reason, 'price': request_price}
 
     def __str__(self):
@@ -168,9 +225,36 @@ class GptModel:
             raise Exception('Max Context Exceeded')
         try:
             msgs = self.messages
-            result = self.client.chat.completions.create(model=self.model,
-                                                         messages=msgs)
+            t0 = time.perf_counter()
+            try:
+                with observe_stage("gpt_request", self.model):
+                    result = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=msgs)
+                    span = tracer.current_span()
+                    if span and result.usage:
+                        span.attributes.update({
+                            "gen_ai.usage.input_tokens":
+                                result.usage.prompt_tokens,
+                            "gen_ai.usage.output_tokens":
+                                result.usage.completion_tokens})
+            except Exception:
+                observe_gpt(self.model, "error")
+                GptModel.notify_usage(self.model,
+                                      (time.perf_counter() - t0) * 1000,
+                                      'error')
+                raise
+            latency_ms = (time.perf_counter() - t0) * 1000
             f_result = GptModel.process_output(result, self.model)
+            observe_gpt(self.model, "ok",
+                        f_result['prompt_tokens'],
+                        f_result['output_tokens'])
+            GptModel.notify_usage(self.model, latency_ms,
+                                  result.choices[0].finish_reason,
+                                  f_result['prompt_tokens'],
+                                  f_result['output_tokens'],
+                                  f_result['cached_tokens'],
+                                  f_result['price'])
             self.requests_info.append(f_result)
             self.outputs.append(f_result['output'])
             self.messages.append(GptModel.format_output(f_result['output']))
@@ -196,30 +280,70 @@ class GptModel:
         self.inputs.append(prompt)
         self.messages.append(GptModel.format_input(prompt))
 
+        t0 = time.perf_counter()
+        # The generator is resumed from different threads, so its span
+        # is recorded once it finishes rather than held open
+        start_ns = time.time_ns()
         try:
             # 2) fire off a streaming completion
             stream = self.client.chat.completions.create(
                 model=self.model,
                 messages=self.messages,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True}
             )
 
             full_output = ""
+            usage = None
+            finish_reason = None
             # 3) as chunks come in, yield them immediately
             for chunk in stream:
+                # The final chunk only carries usage and has no choices
+                if chunk.usage:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                finish_reason = (chunk.choices[0].finish_reason or
+                                 finish_reason)
                 delta = chunk.choices[0].delta
                 # use getattr to safely pull out .content
                 text = getattr(delta, "content", None) or ""
                 if text:
+                    if not full_output:
+                        observe_duration("gpt_first_token",
+                                         time.perf_counter() - t0,
+                                         self.model)
                     full_output += text
                     yield text
 
             # 4) once done, record the full response
+            latency_ms = (time.perf_counter() - t0) * 1000
+            observe_duration("gpt_stream", latency_ms / 1000, self.model)
+            usage_dict = usage.to_dict() if usage else {}
+            prompt_tokens = int(usage_dict.get('prompt_tokens') or 0)
+            output_tokens = int(usage_dict.get('completion_tokens') or 0)
+            cached_tokens = GptModel.cached_prompt_tokens(usage_dict)
+            observe_gpt(self.model, "ok", prompt_tokens, output_tokens)
+            tracer.record("gpt_stream", start_ns, model=self.model,
+                          **{"gen_ai.usage.input_tokens": prompt_tokens,
+                             "gen_ai.usage.output_tokens": output_tokens})
+            GptModel.notify_usage(self.model, latency_ms, finish_reason,
+                                  prompt_tokens, output_tokens, cached_tokens,
+                                  GptModel.response_price(self.model,
+                                                          prompt_tokens,
+                                                          output_tokens,
+                                                          cached_tokens))
             self.outputs.append(full_output)
             self.messages.append(GptModel.format_output(full_output))
             self.request_count += 1
 
         except Exception as e:
+            observe_gpt(self.model, "error")
+            tracer.record("gpt_stream", start_ns, error=str(e),
+                          model=self.model)
+            GptModel.notify_usage(self.model,
+                                  (time.perf_counter() - t0) * 1000,
+                                  'error')
             GptModel.logger.error(f"Streaming request error: {e}")
             raise Exception(f"Error during streaming request: {e}")
 
@@ -282,7 +406,8 @@ class GptModel:
         gpt_model.requests_info = info['requests_info']
         gpt_model.sessions_info = info['sessions_info']
         gpt_model.text_finishin_reasons = info['text_finishin_reasons']
-        gpt_model.client = OpenAI(api_key=gpt_model.ApiKey)
+        gpt_model._api_key = gpt_model.ApiKey
+        gpt_model._client = None
         return gpt_model
 
     def serialize(self):
@@ -0,0 +1,168 @@
+import asyncio
+import datetime
+import logging
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+import srt
+from sqlalchemy import select, func, desc
+from processing.text_processing import TokenizerService, shared_tokenizer
+from db.db import get_db, execute_write
+from db.Tables import lemma_occurrences, clips, profile_transcripts
+
+logger = logging.getLogger(__name__)
+
+# UniDic POS tags that never make useful index entries
+SKIPPED_POS = {"補助記号", "空白", "記号"}
+SOURCE_TYPES = ("clip", "transcript", "srt")
+
+
+class LemmaIndexService:
+    """
+    Maintains a per-profile inverted index from dictionary form (lemma)
+    to the saved clips, transcripts and SRTs it occurs in, so lemma
+    lookups and frequency lists don't need to re-tokenize anything.
+    """
+
+    def __init__(self, tokenizer: Optional[TokenizerService] = None):
+        self.tokenizer = tokenizer if tokenizer else shared_tokenizer()
+
+    def count_lemmas(self, text: str) -> Counter:
+        """
+        Tokenize text and count lemma occurrences.
+        """
+        counts: Counter = Counter()
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            for token in self.tokenizer.tokenize(line):
+                if token.get("pos") in SKIPPED_POS:
+                    continue
+                lemma = token.get("lemma") or token.get("surface") or ""
+                lemma = lemma.strip()
+                if lemma:
+                    counts[lemma] += 1
+        return counts
+
+    @staticmethod
+    def srt_text(srt_content: str) -> str:
+        """
+        Extract cue text from SRT content, dropping indices and timings.
+        """
+        try:
+            return "\n".join(s.content for s in srt.parse(srt_content))
+        except Exception:
+            return srt_content
+
+    async def index(self,
+                    profile_id: str,
+                    source_type: str,
+                    source_id: str,
+                    text: str) -> int:
+        """
+        (Re)index one saved item. Returns the number of distinct lemmas.
+        """
+        if source_type not in SOURCE_TYPES:
+            raise ValueError(f"Unknown source type: {source_type}")
+        counts = await asyncio.to_thread(self.count_lemmas, text or "")
+        await self.remove(source_type, source_id)
+        if not counts:
+            return 0
+        now = datetime.datetime.now()
+        rows = [{"id": str(uuid.uuid4()),
+                 "profile_id": profile_id,
+                 "lemma": lemma,
+                 "source_type": source_type,
+                 "source_id": source_id,
+                 "occurrences": n,
+                 "created_at": now} for lemma, n in counts.items()]
+        await execute_write(lemma_occurrences.insert().values(rows))
+        return len(rows)
+
+    async def safe_index(self, *args, **kwargs) -> None:
+        """
+        Index without failing the calling request.
+        """
+        try:
+            await self.index(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Lemma indexing failed: {e}")
+
+    async def remove(self, source_type: str, source_id: str) -> None:
+        await execute_write(lemma_occurrences.delete().where(
+            lemma_occurrences.c.source_type == source_type).where(
+                lemma_occurrences.c.source_id == source_id))
+
+    async def safe_remove(self, source_type: str, source_id: str) -> None:
+        try:
+            await self.remove(source_type, source_id)
+        except Exception as e:
+            logger.error(f"Lemma index removal failed: {e}")
+
+    async def occurrences(self,
+                          profile_id: str,
+                          lemma: str) -> List[Dict]:
+        """
+        Every saved item of the profile containing `lemma`.
+        """
+        db = await get_db()
+        q = lemma_occurrences.select().where(
+            lemma_occurrences.c.profile_id == profile_id).where(
+                lemma_occurrences.c.lemma == lemma).order_by(
+                    lemma_occurrences.c.occurrences.desc(),
+                    lemma_occurrences.c.created_at.desc())
+        return [{"source_type": r.source_type,
+                 "source_id": r.source_id,
+                 "occurrences": r.occurrences,
+                 "created_at": r.created_at.isoformat() if r.created_at
+                 else None} for r in await db.fetch_all(q)]
+
+    async def frequencies(self,
+                          profile_id: str,
+                          limit: int = 100,
+                          offset: int = 0,
+                          source_type: Optional[str] = None) -> List[Dict]:
+        """
+        Lemmas of the profile ordered by total occurrences.
+        """
+        db = await get_db()
+        total = func.sum(lemma_occurrences.c.occurrences).label("total")
+        sources = func.count(lemma_occurrences.c.id).label("sources")
+        q = select(lemma_occurrences.c.lemma, total, sources).where(
+            lemma_occurrences.c.profile_id == profile_id)
+        if source_type:
+            q = q.where(lemma_occurrences.c.source_type == source_type)
+        q = q.group_by(lemma_occurrences.c.lemma).order_by(
+            desc("total"), lemma_occurrences.c.lemma).limit(limit).offset(
+                offset)
+        return [{"lemma": r.lemma,
+                 "occurrences": int(r.total),
+                 "sources": int(r.sources)} for r in await db.fetch_all(q)]
+
+    async def rebuild(self, profile_id: str,
+                      srt_files: Dict[str, str]) -> int:
+        """
+        Re-index all clips and transcripts of a profile, plus the given
+        {profile_files.id: srt content} mapping. Returns items indexed.
+        """
+        db = await get_db()
+        await execute_write(lemma_occurrences.delete().where(
+            lemma_occurrences.c.profile_id == profile_id))
+        n = 0
+        for c in await db.fetch_all(clips.select().where(
+                clips.c.profile_id == profile_id)):
+            sentence = (c.gpt_breakdown_response or {}).get("sentence", "")
+            await self.index(profile_id, "clip", c.id, sentence)
+            n += 1
+        for t in await db.fetch_all(profile_transcripts.select().where(
+                profile_transcripts.c.profile_id == profile_id)):
+            await self.index(profile_id, "transcript", t.id, t.transcript)
+            n += 1
+        for file_id, content in srt_files.items():
+            await self.index(profile_id, "srt", file_id,
+                             self.srt_text(content))
+            n += 1
+        return n
+
+
+lemma_index = LemmaIndexService()
@@ -1,11 +1,15 @@
-import fugashi
-from typing import List, Dict, Optional
-from jamdict import Jamdict
+import threading
+from typing import TYPE_CHECKING, List, Dict, Optional
 from processing.gpt_wrapper import GptModel
 from functools import lru_cache
 from models.FocusInfo import FocusInfo
+from utils.metrics_utils import cache_stats, observe_stage
 import logging
 
+if TYPE_CHECKING:
+    import fugashi
+    from jamdict import Jamdict
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,7 +17,21 @@ class TokenizerService:
     """Service that performs morphological analysis using Fugashi + UniDic."""
 
     def __init__(self):
-        self.tagger = fugashi.Tagger()
+        # The UniDic tagger loads on first use or warm-up, not at import
+        self._tagger: Optional["fugashi.Tagger"] = None
+        self._lock = threading.Lock()
+        # A MeCab tagger parses into a single lattice and is not thread
+        # safe, callers run tokenize in worker threads
+        self._tag_lock = threading.Lock()
+
+    @property
+    def tagger(self) -> "fugashi.Tagger":
+        if self._tagger is None:
+            with self._lock:
+                if self._tagger is None:
+                    import fugashi
+                    self._tagger = fugashi.Tagger()
+        return self._tagger
 
     def tokenize(self, sentence: str) -> List[Dict[str, str]]:
         """
@@ -25,26 +43,59 @@ class TokenizerService:
         Returns:
             List[Dict[str, str]]: List of token metadata.
         """
-        return [
-            {
-                "surface": word.surface,
-                "lemma": word.feature.lemma,
-                "reading": word.feature.kana,
-                "pos": word.feature.pos1,
-            }
-            for word in self.tagger(sentence)
-        ]
+        tagger = self.tagger
+        with self._tag_lock, observe_stage("fugashi_tokenize"):
+            return [
+                {
+                    "surface": word.surface,
+                    "lemma": word.feature.lemma,
+                    "reading": word.feature.kana,
+                    "pos": word.feature.pos1,
+                }
+                for word in tagger(sentence)
+            ]
+
+    def warm_up(self) -> None:
+        self.tokenize("猫が好きです。")
+
+
+@lru_cache(maxsize=None)
+def shared_tokenizer() -> TokenizerService:
+    """
+    One tokenizer for the whole process, so the UniDic tagger is loaded
+    and warmed up once.
+    """
+    return TokenizerService()
 
 
 class WordInfoService:
     """Looks up dictionary and JLPT info using Jamdict."""
 
     def __init__(self):
-        self.jam = Jamdict()
+        self._jam: Optional["Jamdict"] = None
+        self._lock = threading.Lock()
+
+    @property
+    def jam(self) -> "Jamdict":
+        if self._jam is None:
+            with self._lock:
+                if self._jam is None:
+                    from jamdict import Jamdict
+                    self._jam = Jamdict()
+        return self._jam
+
+    def warm_up(self) -> None:
+        """
+        Open the dictionary databases, which Jamdict does lazily on the
+        first lookup (bypasses the cache).
+        """
+        self.jam.lookup("猫")
 
     @lru_cache(maxsize=1024)
     def lookup(self, lemma: str) -> Dict[str, str]:
-        result = self.jam.lookup(lemma)
+        # Only cache misses reach Jamdict and get timed
+        with observe_stage("jamdict_lookup"):
+            result = self.jam.lookup(lemma)
         if not result.entries:
             return {
                 "word": lemma,
@@ -72,6 +123,9 @@ class WordInfoService:
         }
 
 
+cache_stats.register_lru("jamdict_lookup", WordInfoService.lookup)
+
+
 class GptExplainService:
     """
     Service to generate sentence breakdowns and grammar explanations.
@@ -197,11 +251,17 @@ class SentenceBreakdownService:
     def __init__(self,
                  gpt_version: str = "gpt-4.1-mini",
                  gpt_kwargs: Dict = {}):
-        self.tokenizer = TokenizerService()
+        self.tokenizer = shared_tokenizer()
         self.word_info = WordInfoService()
         self.gpt_explainer = GptExplainService(gpt_model_kwargs=gpt_kwargs,
                                                version=gpt_version)
 
+    def warm_up(self) -> None:
+        self.tokenizer.warm_up()
+        self.word_info.warm_up()
+        # Imports openai and builds its client
+        self.gpt_explainer.model.client
+
     def word_lookup(self, sentence: str) -> List[Dict]:
         tokens = self.tokenizer.tokenize(sentence)
 
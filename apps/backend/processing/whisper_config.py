@@ -0,0 +1,123 @@
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Each setting is picked from the hardware when "auto" (or 0)
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "auto")
+WHISPER_MODEL_CUDA = os.getenv("WHISPER_MODEL_CUDA", "large-v3")
+WHISPER_MODEL_CPU = os.getenv("WHISPER_MODEL_CPU", "small")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "auto")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "auto")
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "0"))
+# Fastest first; int8 on CPU keeps float32 activations (= int8_float32)
+COMPUTE_TYPE_PREFERENCE = {
+    "cuda": ("float16", "int8_float16", "int8", "float32"),
+    "cpu": ("int8", "int8_float32", "float32"),
+}
+# Configuration of the last model loaded in this process, for /health
+loaded_config: Optional[Dict] = None
+
+
+@lru_cache(maxsize=1)
+def cuda_device_count() -> int:
+    try:
+        import ctranslate2
+        return ctranslate2.get_cuda_device_count()
+    except Exception:
+        return 0
+
+
+@lru_cache(maxsize=None)
+def supported_compute_types(device: str) -> Set[str]:
+    try:
+        import ctranslate2
+        return set(ctranslate2.get_supported_compute_types(device))
+    except Exception:
+        return set()
+
+
+def available_cores() -> int:
+    """
+    CPU cores this process may use: its affinity mask, further limited
+    by a cgroup v2 CPU quota (e.g. `docker run --cpus`).
+    """
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def resolve_whisper_config(model: Optional[str] = None,
+                           device: Optional[str] = None,
+                           compute_type: Optional[str] = None,
+                           cpu_threads: Optional[int] = None,
+                           num_workers: Optional[int] = None) -> Dict:
+    """
+    Whisper model, device, compute type and threading for this host.
+    Arguments take precedence over the WHISPER_* variables, and
+    anything left on "auto" is derived from the hardware. A compute type
+    the device cannot run (float16 on CPU) is replaced with the best
+    supported one.
+    """
+    cores = available_cores()
+    auto = []
+
+    device = device or WHISPER_DEVICE
+    if device == "auto":
+        device = "cuda" if cuda_device_count() > 0 else "cpu"
+        auto.append("device")
+
+    supported = supported_compute_types(device)
+    preferred = next((c for c in COMPUTE_TYPE_PREFERENCE.get(device, ())
+                      if c in supported), "default")
+    compute_type = compute_type or WHISPER_COMPUTE_TYPE
+    if compute_type == "auto":
+        compute_type = preferred
+        auto.append("compute_type")
+    elif supported and compute_type not in supported \
+            and compute_type != "default":
+        logger.warning(f"Compute type {compute_type} not supported on "
+                       f"{device}, using {preferred}")
+        compute_type = preferred
+        auto.append("compute_type")
+
+    model = model or WHISPER_MODEL
+    if model == "auto":
+        model = WHISPER_MODEL_CUDA if device == "cuda" else WHISPER_MODEL_CPU
+        auto.append("model")
+
+    num_workers = num_workers or WHISPER_NUM_WORKERS
+    if not num_workers:
+        # A worker per ~4 cores lets concurrent requests decode in
+        # parallel instead of queueing on one model
+        num_workers = 1 if device == "cuda" else max(1, min(4, cores // 4))
+        auto.append("num_workers")
+
+    cpu_threads = cpu_threads or WHISPER_CPU_THREADS
+    if not cpu_threads:
+        # On GPU the CPU only does feature extraction; 0 keeps the
+        # library default
+        cpu_threads = 0 if device == "cuda" else max(1, cores // num_workers)
+        auto.append("cpu_threads")
+
+    return {"model": model,
+            "device": device,
+            "compute_type": compute_type,
+            "cpu_threads": cpu_threads,
+            "num_workers": num_workers,
+            "available_cores": cores,
+            "cuda_devices": cuda_device_count(),
+            "supported_compute_types": sorted(supported),
+            "auto": auto}
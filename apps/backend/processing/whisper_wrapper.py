@@ -1,30 +1,50 @@
-from typing import Dict, Union
+from typing import TYPE_CHECKING, Dict, Optional, Union
 import logging
+import re
+import tempfile
+import threading
 import time
-from faster_whisper import WhisperModel
+import wave
+from functools import lru_cache
 import srt
 import datetime
 from pathlib import Path
 from processing.gpt_wrapper import GptModel
+from utils.metrics_utils import observe_whisper
+from utils.tracing_utils import tracer
+from processing import whisper_config
+
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
 
 
 class FWhisperWrapper:
     def __init__(self,
-                 model_name: str = 'large-v3',
+                 model_name: Optional[str] = None,
                  lang: str = 'ja',
-                 compute_type: str = "float16",
-                 device: str = 'cuda',
+                 compute_type: Optional[str] = None,
+                 device: Optional[str] = None,
                  gpt_sys_msg: str = None,
-                 gpt_version: str = 'gpt-4.1'
+                 gpt_version: str = 'gpt-4.1',
+                 cpu_threads: Optional[int] = None,
+                 num_workers: Optional[int] = None
                  ) -> None:
+        """
+        Unset model, device, compute type and threading are taken from
+        the WHISPER_* environment variables or detected from the
+        hardware, see `whisper_config.resolve_whisper_config`.
 
+        The model is downloaded and loaded on first use (or `load`), so
+        creating the wrapper at import time costs nothing.
+        """
         self.logger = logging.getLogger(self.__class__.__name__)
         self.lang = lang
-        self.instance = WhisperModel(model_name,
-                                     device=device,
-                                     compute_type=compute_type)
-        self.device = device
-        self.model_name = model_name
+        self.config = whisper_config.resolve_whisper_config(
+            model_name, device, compute_type, cpu_threads, num_workers)
+        self._instance: Optional["WhisperModel"] = None
+        self._load_lock = threading.Lock()
+        self.device = self.config["device"]
+        self.model_name = self.config["model"]
         self.gpt_version = gpt_version
 
         if not gpt_sys_msg:
@@ -54,6 +74,63 @@ class FWhisperWrapper:
         else:
             self.gpt_sys_msg = gpt_sys_msg
 
+    def load(self) -> "WhisperModel":
+        """
+        Load the model if not loaded yet. Thread-safe.
+        """
+        if self._instance is None:
+            with self._load_lock:
+                if self._instance is None:
+                    from faster_whisper import WhisperModel
+                    self.logger.info(
+                        "Loading Whisper %(model)s on %(device)s "
+                        "(%(compute_type)s, %(cpu_threads)s threads, "
+                        "%(num_workers)s workers)", self.config)
+                    self._instance = WhisperModel(
+                        self.config["model"],
+                        device=self.config["device"],
+                        compute_type=self.config["compute_type"],
+                        cpu_threads=self.config["cpu_threads"],
+                        num_workers=self.config["num_workers"])
+                    whisper_config.loaded_config = self.config
+        return self._instance
+
+    @property
+    def instance(self) -> "WhisperModel":
+        return self.load()
+
+    def warm_up(self) -> None:
+        """
+        Load the model and decode a second of silence, so the first
+        request doesn't pay for initialization and kernel selection.
+        """
+        model = self.load()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "warmup.wav"
+            with wave.open(str(path), "wb") as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(16000)
+                w.writeframes(b"\0\0" * 16000)
+            segments, _ = model.transcribe(str(path), language=self.lang,
+                                           beam_size=5)
+            list(segments)
+
+    def recipe(self, output: str) -> str:
+        """
+        Derived-output key (see BlobStore.get_derived) of an `output`
+        ("srt" or "transcript") of this wrapper: the device, model and
+        compute type it is transcribed with and, for SRTs, the GPT
+        version fixing it up. A different model or host gets new outputs
+        instead of the cached ones.
+        """
+        parts = [output, self.device, self.model_name,
+                 self.config["compute_type"]]
+        if output == "srt":
+            parts.append(self.gpt_version)
+        # Model names may be paths
+        return "-".join(re.sub(r"[^\w.-]+", "_", p) for p in parts)
+
     def _check_input(self,
                      audio_path: str) -> Union[str, None]:
 
@@ -81,7 +158,9 @@ class FWhisperWrapper:
         try:
             model = GptModel(**kwargs)
             self.logger.info("Requesting GPT to fix SRT")
-            request = model.request(source)
+            with tracer.span("gpt_fix_srt", model=self.gpt_version,
+                             **{"srt.chars": len(source)}):
+                request = model.request(source)
             rsrt = request['response']
             return rsrt
         except Exception as e:
@@ -119,17 +198,28 @@ class FWhisperWrapper:
         if add_kargs:
             add_kwds.update(add_kargs)
         try:
-            segments, info = self.instance.transcribe(** add_kwds)
             if generator_only:
+                segments, info = self.instance.transcribe(** add_kwds)
                 return {'obj': segments,
                         'info': info}
-            else:
-                elapsed = time.perf_counter()
-                segments = list(segments)
-                tt = time.perf_counter() - elapsed
-                return {'obj': segments,
-                        'info': info,
-                        'elapsed': tt}
+            with tracer.span("whisper_transcribe", model=self.model_name,
+                             device=self.device) as span:
+                with tracer.span("whisper_prepare"):
+                    segments, info = self.instance.transcribe(** add_kwds)
+                # Segments are decoded lazily as the generator is consumed
+                with tracer.span("whisper_decode"):
+                    elapsed = time.perf_counter()
+                    segments = list(segments)
+                    tt = time.perf_counter() - elapsed
+                if span:
+                    span.set_attribute("audio.duration_seconds",
+                                       getattr(info, "duration", 0) or 0)
+                    span.set_attribute("whisper.segments", len(segments))
+            observe_whisper(self.model_name, self.device, tt,
+                            getattr(info, "duration", 0) or 0)
+            return {'obj': segments,
+                    'info': info,
+                    'elapsed': tt}
         except Exception as e:
             self.logger.error(f"Transcription Failed :{e}")
             return None
@@ -220,3 +310,12 @@ class FWhisperWrapper:
             except Exception as e:
                 self.logger.error(f"Failed to save SRT File : {e}")
                 return None
+
+
+@lru_cache(maxsize=None)
+def shared_whisper(**kwargs) -> FWhisperWrapper:
+    """
+    One wrapper per configuration for the whole process, since every
+    instance holds its own copy of the model weights.
+    """
+    return FWhisperWrapper(**kwargs)
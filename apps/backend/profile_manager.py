@@ -1,11 +1,95 @@
 from fastapi import Header, HTTPException, Depends, status
-from db.db import get_db
+from db.db import get_db, execute_write, insert_or_ignore
 from db.Tables import profiles
+from utils.metrics_utils import record_cache
+from collections import OrderedDict
+from contextvars import ContextVar
 import logging
+import os
+import time
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "600"))
+PROFILE_CACHE_MAX_SIZE = int(os.getenv("PROFILE_CACHE_MAX_SIZE", "10000"))
+# Profile of the request being served, set by the dependencies below so
+# code without access to the request (e.g. GPT usage accounting) can
+# attribute work to it
+current_profile_id: ContextVar[Optional[str]] = ContextVar(
+    "current_profile_id", default=None)
+
+
+class ProfileCache:
+    """
+    In-process, TTL-bounded set of profile IDs known to exist, so
+    validating a profile on the hot path costs no database query.
+    """
+    def __init__(self,
+                 ttl: float = PROFILE_CACHE_TTL,
+                 max_size: int = PROFILE_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expiry: OrderedDict[str, float] = OrderedDict()
+
+    def __contains__(self, profile_id: str) -> bool:
+        expires = self._expiry.get(profile_id)
+        if expires is None or expires < time.monotonic():
+            self._expiry.pop(profile_id, None)
+            record_cache("profile", False)
+            return False
+        record_cache("profile", True)
+        return True
+
+    def add(self, profile_id: str) -> None:
+        self._expiry[profile_id] = time.monotonic() + self.ttl
+        self._expiry.move_to_end(profile_id)
+        while len(self._expiry) > self.max_size:
+            self._expiry.popitem(last=False)
+
+    def discard(self, profile_id: str) -> None:
+        self._expiry.pop(profile_id, None)
+
+    def clear(self) -> None:
+        self._expiry.clear()
+
+
+profile_cache = ProfileCache()
+
+
+async def _ensure_profile(profile_id: str) -> bool:
+    """
+    Make sure a profile row exists, creating it implicitly if needed.
+    Returns False if the profile could not be created.
+    """
+    if profile_id in profile_cache:
+        return True
+    try:
+        # Atomic, so concurrent first requests for a new ID cannot race
+        await execute_write(insert_or_ignore(profiles,
+                                             id=profile_id,
+                                             name=profile_id))
+    except Exception as e:
+        logger.error(f"Error creating profile {profile_id}: {e}")
+        return False
+    profile_cache.add(profile_id)
+    return True
+
+
+async def profile_known(profile_id: str) -> bool:
+    """
+    Whether a profile exists, without implicitly creating it.
+    """
+    if profile_id in profile_cache:
+        return True
+    db = await get_db()
+    row = await db.fetch_one(profiles.select().where(
+        profiles.c.id == profile_id))
+    if row is None:
+        return False
+    profile_cache.add(profile_id)
+    return True
+
 
 async def get_profile_id_from_header(x_profile_id: str = Header(None)
                                      ) -> Optional[str]:
@@ -27,24 +111,11 @@ async def ensure_profile_exists(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="X-Profile-ID header is required for this operation."
         )
-
-    db = await get_db()
-    query = profiles.select().where(profiles.c.id == profile_id)
-    profile = await db.fetch_one(query)
-    if not profile:
-        try:
-            insert_query = profiles.insert().values(id=profile_id,
-                                                    name=profile_id)
-            await db.execute(insert_query)
-            logger.info(f"Implicitly created profile with ID: {profile_id}")
-        except Exception as e:
-            logger.error(f"Error creating profile {profile_id}: {e}")
-            # Check if it was created by another request in the meantime
-            profile_check_after_error = await db.fetch_one(query)
-            if not profile_check_after_error:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Could not create or find profile {profile_id}.")
+    if not await _ensure_profile(profile_id):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Could not create or find profile {profile_id}.")
+    current_profile_id.set(profile_id)
     return profile_id
 
 
@@ -55,26 +126,10 @@ async def get_profile_id_optional(
     exists (implicitly creates if new). Returns None if header is missing."""
     if not profile_id:
         return None
-
-    # If header is provided, ensure profile exists (or create it)
-    db = await get_db()
-    query = profiles.select().where(profiles.c.id == profile_id)
-    profile = await db.fetch_one(query)
-    if not profile:
-        try:
-            insert_query = profiles.insert().values(id=profile_id,
-                                                    name=profile_id)
-            await db.execute(insert_query)
-            logger.info(f"Implicitly created profile with\
-                ID (optional context): {profile_id}")
-        except Exception as e:
-            logger.error(f"Error creating profile {profile_id} \
-                (optional context): {e}")
-            # Check again in case of race condition
-            profile_check_after_error = await db.fetch_one(query)
-            if not profile_check_after_error:
-                # Don't raise 500 here, as profile is optional.
-                logger.error(f"Could not find or create profile \
-                    {profile_id} (optional context) after error.")
-                return None
+    if not await _ensure_profile(profile_id):
+        # Don't raise 500 here, as profile is optional.
+        logger.error(f"Could not find or create profile \
+            {profile_id} (optional context).")
+        return None
+    current_profile_id.set(profile_id)
     return profile_id
@@ -0,0 +1,78 @@
+import asyncio
+import datetime
+import logging
+import os
+import secrets
+from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from models.AllocationDiff import AllocationDiff
+from utils.profiling_utils import PROFILE_MAX_SECONDS, profiler
+
+logger = logging.getLogger(__name__)
+
+# Shared secret for /admin; the routes don't exist while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+async def require_admin_token(x_admin_token: str = Header(None)) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token,
+                                                       ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Invalid admin token.")
+
+
+admin_router = APIRouter(prefix="/admin",
+                         dependencies=[Depends(require_admin_token)],
+                         include_in_schema=False)
+
+
+async def _run_profile(**kwargs):
+    # The sampler runs in its own thread so the event loop keeps serving
+    # (and being sampled) during the window
+    result = await asyncio.to_thread(profiler.profile, **kwargs)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="A profile is already running.")
+    return result
+
+
+@admin_router.post("/profile/cpu", response_class=PlainTextResponse)
+async def profile_cpu(
+        seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+        interval_ms: float = Query(5, ge=1, le=1000),
+        include_idle: bool = False):
+    """
+    Sample every thread's stack for `seconds` and return the
+    collapsed stacks, ready for flamegraph.pl or speedscope.
+    """
+    logger.info(f"CPU profile started for {seconds}s")
+    result = await _run_profile(seconds=seconds,
+                                interval=interval_ms / 1000,
+                                include_idle=include_idle)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return PlainTextResponse(
+        result["collapsed"],
+        headers={"Content-Disposition":
+                 f'attachment; filename="cpu-{stamp}.collapsed"',
+                 "X-Profile-Samples": str(result["samples"])})
+
+
+@admin_router.post("/profile/allocations",
+                   response_model=List[AllocationDiff])
+async def profile_allocations(
+        seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+        limit: int = Query(50, ge=1, le=1000)):
+    """
+    Trace allocations with tracemalloc for `seconds` and return the
+    source lines whose memory grew the most over the window.
+    """
+    logger.info(f"Allocation profile started for {seconds}s")
+    result = await _run_profile(seconds=seconds,
+                                interval=0.05,
+                                allocations=True,
+                                limit=limit)
+    return result["allocations"]
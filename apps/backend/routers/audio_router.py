@@ -17,17 +17,24 @@ from fastapi import (
 # Project-specific modules
 from processing.audio_processing import AudioTools
 from processing.text_processing import GptExplainService
-from profile_manager import ensure_profile_exists
-from db.db import get_db
+from processing.lemma_index import lemma_index
+from utils.storage_utils import enforce_quota
+from utils.blob_store import blob_store
+from db.db import execute_write
 from db.Tables import profile_transcripts, profile_files
 from processing.Processor import Processor
 from utils.env_utils import using_modal
+from utils.metrics_utils import observe_stage
+from utils.tracing_utils import tracer
+from utils.readiness_utils import readiness
+from utils.gpt_usage_utils import enforce_gpt_budget
 import asyncio
 USING_MODAL = using_modal()
 
 if not USING_MODAL:
-    from processing.whisper_wrapper import FWhisperWrapper
-    fwhisper = FWhisperWrapper()
+    from processing.whisper_wrapper import shared_whisper
+    fwhisper = shared_whisper()
+    readiness.register("whisper", fwhisper.warm_up)
 
 logger = logging.getLogger(__name__)
 audio_router = APIRouter(prefix="/audio")
@@ -38,14 +45,27 @@ TEMP_DIR = BASE_MEDIA_DIR / "temp"
 TEMP_DIR.mkdir(parents=True, exist_ok=True)
 if USING_MODAL:
     processor = Processor(save_path=TEMP_DIR, use_modal=True)
+    # Look up the deployed worker before the first request
+    readiness.register("modal", processor.executor.warm_up)
 
 
-@audio_router.post("/transcribe_from_audio")
+async def _transcript_recipe() -> str:
+    """
+    Derived-output key of transcripts of stored audio, which depends on
+    the Whisper configuration doing the transcription.
+    """
+    if USING_MODAL:
+        return await processor.modal_recipe("transcript")
+    return fwhisper.recipe("transcript")
+
+
+@audio_router.post("/transcribe_from_audio",
+                   dependencies=[Depends(enforce_gpt_budget)])
 async def transcribe_from_audio(
     file: UploadFile = File(...),
     clean_audio_str: str = Form("false", alias="clean_audio"),
     gpt_explain_str: str = Form("false", alias="gpt_explain"),
-    profile_id: str = Depends(ensure_profile_exists),
+    profile_id: str = Depends(enforce_quota),
 ):
     if not profile_id:
         raise HTTPException(
@@ -72,9 +92,11 @@ async def transcribe_from_audio(
 
     tmp_uploaded_audio_loc = op_tmp_dir / original_filename
     audio_to_process_loc = tmp_uploaded_audio_loc
+    audio_digest = None
 
     try:
-        with open(tmp_uploaded_audio_loc, "wb+") as f_obj:
+        with observe_stage("upload_write"), \
+                open(tmp_uploaded_audio_loc, "wb+") as f_obj:
             shutil.copyfileobj(file.file, f_obj)
         logger.info(f"Temp audio for transcription: {tmp_uploaded_audio_loc}")
 
@@ -97,26 +119,39 @@ async def transcribe_from_audio(
             audio_to_process_loc = Path(cleaned_path_str)
             logger.info(f"Audio cleaned: {audio_to_process_loc}")
 
-        shutil.copyfile(audio_to_process_loc, final_audio_storage_loc)
+        audio_digest = await asyncio.to_thread(blob_store.ingest,
+                                               audio_to_process_loc,
+                                               final_audio_storage_loc)
         logger.info(
             f"Audio ({'cleaned' if do_clean_audio else 'original'}) "
-            f"copied to persistent: {final_audio_storage_loc}"
+            f"stored at: {final_audio_storage_loc} ({audio_digest[:12]})"
         )
+        # Identical audio was transcribed before
+        transcript_recipe = await _transcript_recipe()
+        cached_text = await asyncio.to_thread(blob_store.read_derived_text,
+                                              audio_digest,
+                                              transcript_recipe)
+        if cached_text is not None:
+            logger.info(f"Reusing transcript of {audio_digest[:12]}")
+            transcription_data = {"text": cached_text}
         # When MODAL env variables are available use MODAL
-        if USING_MODAL:
+        elif USING_MODAL:
             logger.info("Conversion sent to Modal")
             logger.info(f"Audio Filepath: {final_audio_storage_loc}")
-            transcription_data = await processor.modal_transcribe_to_str(
-                audio_fp=str(final_audio_storage_loc)
-            )
+            with tracer.span("transcribe_to_str",
+                             executor=processor.executor.name):
+                transcription_data = await processor.modal_transcribe_to_str(
+                    audio_fp=str(final_audio_storage_loc)
+                )
         # Run locally
         else:
             logger.info("Running Locally")
             logger.info(f"Audio Filepath: {final_audio_storage_loc}")
-            transcription_data = await asyncio.to_thread(
-                fwhisper.transcribe_to_str,
-                audio_path=str(final_audio_storage_loc)
-            )
+            with tracer.span("transcribe_to_str", executor="local"):
+                transcription_data = await asyncio.to_thread(
+                    fwhisper.transcribe_to_str,
+                    audio_path=str(final_audio_storage_loc)
+                )
         if not transcription_data or "text" not in transcription_data:
             logger.error(
                 f"Transcription (to_str) failed or gave invalid\
@@ -126,6 +161,11 @@ async def transcribe_from_audio(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Audio transcription failed to produce text.",
             )
+        if cached_text is None:
+            await asyncio.to_thread(blob_store.put_derived_text,
+                                    audio_digest,
+                                    transcript_recipe,
+                                    transcription_data["text"])
 
         # The plain_text_transcript is what will be returned in the API
         plain_text_transcript = transcription_data["text"]
@@ -143,16 +183,16 @@ async def transcribe_from_audio(
                 try:
                     logger.info(f"Generating GPT \
                         explanation (Profile: {profile_id})")
-                    gpt_explanation_text = gpt_explainer.explain_sentence(
-                        sentence=plain_text_transcript
-                    )
+                    with tracer.span("gpt_explain"):
+                        gpt_explanation_text = gpt_explainer.explain_sentence(
+                            sentence=plain_text_transcript
+                        )
                     logger.info(f"GPT explanation\
                         generated (Profile: {profile_id})")
                 except Exception as e_gpt:
                     logger.error(f"GPT explanation failed: {e_gpt}")
                     gpt_explanation_text = "Failed to generate GPT \
                         explanation."
-        db = await get_db()
         transcript_id = str(uuid.uuid4())
 
         ins_transcript_q = profile_transcripts.insert().values(
@@ -163,9 +203,11 @@ async def transcribe_from_audio(
             gpt_explanation=gpt_explanation_text,
             audio_file_path=str(rel_audio_path_db),
         )
-        await db.execute(ins_transcript_q)
+        await execute_write(ins_transcript_q)
         logger.info(f"Transcript {transcript_id} (plain text) \
             saved (Profile: {profile_id})")
+        await lemma_index.safe_index(profile_id, "transcript",
+                                     transcript_id, plain_text_transcript)
 
         audio_file_rec_id = str(uuid.uuid4())
         ins_audio_file_q = profile_files.insert().values(
@@ -175,8 +217,9 @@ async def transcribe_from_audio(
             file_path=str(rel_audio_path_db),
             file_type="audio_source",
             related_transcript_id=transcript_id,
+            content_hash=audio_digest,
         )
-        await db.execute(ins_audio_file_q)
+        await execute_write(ins_audio_file_q)
         logger.info(f"Audio source record {audio_file_rec_id}\
             saved (Profile: {profile_id})")
 
@@ -195,6 +238,7 @@ async def transcribe_from_audio(
         if final_audio_storage_loc.exists():
             try:
                 final_audio_storage_loc.unlink()
+                blob_store.release(audio_digest)
             except OSError as ose:
                 logger.error(f"Could not remove\
                 {final_audio_storage_loc}: {ose}")
@@ -2,12 +2,14 @@ from fastapi import APIRouter, Query, HTTPException
 import logging
 from processing.Processor import Processor
 from utils.env_utils import using_modal
+from utils.readiness_utils import readiness
 
 USING_MODAL = using_modal()
 logger = logging.getLogger(__name__)
 dict_router = APIRouter(prefix="/dict")
 processor = Processor(use_modal=USING_MODAL)
 breakdown_service = processor.sentence_breakdown_service
+readiness.register("dict_text", breakdown_service.warm_up)
 
 
 @dict_router.get("/sentence_lookup")
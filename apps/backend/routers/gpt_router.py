@@ -18,17 +18,21 @@ from models.CustomBreakdownRequest import CustomBreakdownRequest
 from utils.stream_utils import sse_gen
 from profile_manager import get_profile_id_optional
 from utils.env_utils import using_modal
+from utils.gpt_usage_utils import enforce_gpt_budget
+from utils.readiness_utils import readiness
 
 USING_MODAL = using_modal()
 logger = logging.getLogger(__name__)
 
 processor = Processor(use_modal=USING_MODAL)
 breakdown_service = processor.sentence_breakdown_service
+readiness.register("gpt_text", breakdown_service.warm_up)
 
 gpt_router = APIRouter(prefix='/gpt')
 
 
-@gpt_router.post("/breakdown", response_model=BreakdownResponse)
+@gpt_router.post("/breakdown", response_model=BreakdownResponse,
+                 dependencies=[Depends(enforce_gpt_budget)])
 async def breakdown(
     req: BreakdownRequest,
     profile_id: Optional[str] = Depends(get_profile_id_optional)
@@ -62,7 +66,8 @@ async def breakdown(
                 detail=str(e2))
 
 
-@gpt_router.post("/custom_breakdown", response_model=BreakdownResponse)
+@gpt_router.post("/custom_breakdown", response_model=BreakdownResponse,
+                 dependencies=[Depends(enforce_gpt_budget)])
 async def custom_breakdown(
     req: CustomBreakdownRequest,
     profile_id: Optional[str] = Depends(get_profile_id_optional)
@@ -102,6 +107,7 @@ async def custom_breakdown(
 @gpt_router.get(
     "/explain",
     summary="Cure Dolly–style full sentence explanation",
+    dependencies=[Depends(enforce_gpt_budget)],
 )
 async def explain_sentence(
     sentence: str = Query(..., description="Japanese sentence to explain")
@@ -114,7 +120,7 @@ async def explain_sentence(
                             detail=str(e))
 
 
-@gpt_router.post("/stream")
+@gpt_router.post("/stream", dependencies=[Depends(enforce_gpt_budget)])
 async def chat_stream(req: ChatRequest):
     try:
         return StreamingResponse(sse_gen(req.model, req.system_message,
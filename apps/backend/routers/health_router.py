@@ -1,7 +1,18 @@
+import asyncio
 from fastapi import APIRouter
-from utils.system_info_utils import get_system_info
+from fastapi.responses import JSONResponse
+from utils.system_info_utils import (get_system_info,
+                                     hardware_probed,
+                                     hardware_probing,
+                                     hardware_snapshot)
+from utils.storage_utils import storage_janitor
+from utils.env_utils import using_modal
+from utils.readiness_utils import readiness
+from processing import whisper_config
 
 health_router = APIRouter(prefix="/health")
+# Probe the hardware once, in the background at startup
+readiness.register("hardware", hardware_snapshot)
 
 
 @health_router.get("/status")
@@ -9,6 +20,60 @@ async def health_check():
     return {"status": "ok"}
 
 
+@health_router.get("/live")
+async def liveness():
+    """
+    The process is up and serving requests, models may still be loading.
+    """
+    return {"status": "ok"}
+
+
+@health_router.get("/ready")
+async def readiness_check():
+    """
+    503 until every registered model has warmed up, with the state and
+    warm-up time of each component.
+    """
+    status = readiness.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+
 @health_router.get("/system")
 async def gpu_check():
+    """
+    Hardware inventory (probed once) plus current load, memory, queue
+    depths and model readiness. While the probe runs, the hardware is
+    reported as "probing" instead of waiting for torch and CUDA.
+    """
+    if not hardware_probed() and not hardware_probing():
+        # Warm-up disabled: probe now, keeping torch off the loop
+        await asyncio.to_thread(hardware_snapshot)
     return get_system_info()
+
+
+@health_router.get("/storage")
+async def storage_usage():
+    """
+    Disk usage, per-profile storage and the last janitor run.
+    """
+    return await asyncio.to_thread(storage_janitor.metrics)
+
+
+@health_router.get("/whisper")
+async def whisper_status():
+    """
+    Whisper configuration in use: detected hardware, the chosen model,
+    device, compute type and threading, and which were picked
+    automatically.
+    """
+    if using_modal():
+        return {"backend": "modal"}
+    config = whisper_config.loaded_config
+    if config is None:
+        # Not loaded yet, report what would be used
+        config = await asyncio.to_thread(
+            whisper_config.resolve_whisper_config)
+    return {"backend": "local", "loaded": whisper_config.loaded_config
+            is not None, **config}
@@ -0,0 +1,78 @@
+import logging
+from pathlib import Path, PurePosixPath
+from typing import Optional
+from urllib.parse import quote
+from fastapi import APIRouter, Header, HTTPException, Query, Response, status
+from profile_manager import profile_known
+from utils.media_utils import (MEDIA_ACCEL_PREFIX,
+                               cache_control_for,
+                               resolve_media_path)
+
+logger = logging.getLogger(__name__)
+media_router = APIRouter(prefix="/media")
+
+BASE_MEDIA_DIR = Path("media_files")
+# Top-level media directories that may be served
+SERVED_DIRS = {"profiles", "temp"}
+
+
+def _owner_profile(path: str) -> Optional[str]:
+    """
+    Profile that owns a media path: profiles/<id>/... or
+    temp/profiles/<id>/...
+    """
+    parts = PurePosixPath(path).parts
+    if parts[:1] == ("temp",):
+        parts = parts[1:]
+    if len(parts) >= 3 and parts[0] == "profiles":
+        return parts[1]
+    return None
+
+
+@media_router.api_route("/{path:path}", methods=["GET", "HEAD"])
+async def accel_media(path: str,
+                      x_profile_id: Optional[str] = Header(None),
+                      profile_id: Optional[str] = Query(None)):
+    """
+    Authorize a media request and let nginx stream the file through
+    an internal X-Accel-Redirect location. Only the owning profile,
+    identified by X-Profile-ID or `profile_id`, may fetch a file.
+
+    Profiles carry no credentials, so this only proves that the caller
+    knows the path: the owner's ID is part of it, and
+    `?profile_id=<owner>` always passes. It keeps other profiles from
+    browsing each other's media by mistake, and is not access control
+    against someone holding a URL. Responses are `private`, so shared
+    caches in front of nginx never store them and re-serve them without
+    asking the backend.
+    """
+    # <video>/<img> tags can't send headers, hence the query parameter
+    requester = x_profile_id or profile_id
+    if not requester:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="X-Profile-ID header or profile_id query is required.")
+    full_path = resolve_media_path(BASE_MEDIA_DIR, path)
+    if full_path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Not Found")
+    # Authorize the normalized path, not the raw one
+    rel = PurePosixPath(full_path.relative_to(BASE_MEDIA_DIR.resolve()))
+    if rel.parts[0] not in SERVED_DIRS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Not Found")
+    owner = _owner_profile(str(rel))
+    if owner is None or not await profile_known(owner):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Not Found")
+    if requester != owner:
+        logger.warning(f"Profile {requester} denied media of {owner}")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Media belongs to another profile.")
+    if not full_path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Not Found")
+    return Response(headers={
+        "X-Accel-Redirect": MEDIA_ACCEL_PREFIX + quote(str(rel)),
+        "Cache-Control": cache_control_for(str(rel), private=True),
+    })
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException, Response, status
+from utils.metrics_utils import (CONTENT_TYPE_LATEST,
+                                 METRICS_PATH,
+                                 PROMETHEUS_AVAILABLE,
+                                 render_metrics)
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get(METRICS_PATH, include_in_schema=False)
+async def metrics():
+    """
+    Prometheus exposition of request, pipeline stage, GPT, database,
+    queue and cache metrics.
+    """
+    if not PROMETHEUS_AVAILABLE:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="prometheus-client is not installed.")
+    return Response(content=render_metrics(),
+                    media_type=CONTENT_TYPE_LATEST)
@@ -3,27 +3,53 @@ import uuid
 import os
 import shutil
 import json
+import asyncio
+import datetime
+import time
 from fastapi import (
     APIRouter, Depends, HTTPException, status,
-    File, UploadFile, Form, Path
+    File, UploadFile, Form, Path, Query
 )
+from fastapi.responses import FileResponse, StreamingResponse
 from models.GptTemplateResponse import GptTemplateResponse
 from models.GptTemplateBase import GptTemplateBase
 from models.ClipResponse import ClipResponse
 from models.ProfileFileResponse import ProfileFileResponse
 from models.ProfileTranscriptResponse import ProfileTranscriptResponse
 from models.AnkiExportResponse import AnkiExportResponse
+from models.SearchResponse import SearchResponse
+from models.SearchResult import SearchResult
+from models.LemmaFrequency import LemmaFrequency
+from models.LemmaOccurrence import LemmaOccurrence
+from models.GptUsageAggregate import GptUsageAggregate
+from models.GptUsageSummary import GptUsageSummary
+from models.GptBudget import GptBudget
+from models.GptBudgetUpdate import GptBudgetUpdate
 from typing import Optional, List
 import pathlib
 from db.db import (get_db,
+                   execute_write,
                    get_gpt_template_db)
 from db.Tables import (gpt_templates,
+                       gpt_budgets,
                        clips,
                        profile_files,
                        profile_transcripts
                        )
+from db.search import search_profile
+from processing.lemma_index import lemma_index
 from profile_manager import ensure_profile_exists
-from utils.anki_utils import AnkiExporter
+from utils.storage_utils import enforce_quota
+from utils.blob_store import blob_store
+from utils.metrics_utils import observe_stage, record_cache
+from utils.gpt_usage_utils import (GPT_BUDGET_WINDOW,
+                                   budget_status,
+                                   gpt_usage_ledger)
+from utils.anki_utils import (AnkiExporter,
+                              AnkiPackageCache,
+                              ClipCompactor,
+                              deck_version,
+                              size_report)
 logger = logging.getLogger(__name__)
 profile_router = APIRouter(prefix='/profiles',
                            dependencies=[Depends(ensure_profile_exists)])
@@ -31,6 +57,7 @@ profile_router = APIRouter(prefix='/profiles',
 BASE_MEDIA_PATH = "media_files"
 TEMP_MEDIA_PATH = os.path.join(BASE_MEDIA_PATH, "temp")
 os.makedirs(TEMP_MEDIA_PATH, exist_ok=True)
+anki_cache = AnkiPackageCache(pathlib.Path(TEMP_MEDIA_PATH))
 
 
 # --- GPT Template Management ---
@@ -57,12 +84,11 @@ async def upsert_gpt_template(template_data: GptTemplateBase,
     if not profile_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="X-Profile-ID header is required.")
-    db = await get_db()
     values = {"profile_id": profile_id, "sys_msg": template_data.sys_msg,
               "prompt": template_data.prompt}
     ex = await get_gpt_template_db(profile_id)
     if ex:
-        await db.execute(
+        await execute_write(
             gpt_templates.update().where(
                 gpt_templates.c.id == ex.id).values(
                     **values))
@@ -70,7 +96,7 @@ async def upsert_gpt_template(template_data: GptTemplateBase,
     else:
         tid = str(uuid.uuid4())
         values["id"] = tid
-        await db.execute(gpt_templates.insert().values(**values))
+        await execute_write(gpt_templates.insert().values(**values))
     return GptTemplateResponse(id=tid, sysMsg=values["sys_msg"],
                                prompt=values["prompt"])
 
@@ -81,8 +107,7 @@ async def delete_gpt_template(profile_id: str = Depends(ensure_profile_exists)
     if not profile_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="X-Profile-ID header is required.")
-    db = await get_db()
-    res = await db.execute(gpt_templates.delete().where(
+    res = await execute_write(gpt_templates.delete().where(
         gpt_templates.c.profile_id == profile_id))
     if res == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
@@ -90,9 +115,85 @@ async def delete_gpt_template(profile_id: str = Depends(ensure_profile_exists)
     return {"success": True, "message": "Template deleted successfully."}
 
 
+# --- GPT Usage ---
+@profile_router.get("/gpt_usage", response_model=GptUsageSummary)
+async def get_gpt_usage(
+      days: int = Query(30, ge=1, le=3650),
+      group_by: Optional[str] = Query(None, pattern="^(model|route|day)$"),
+      profile_id: str = Depends(ensure_profile_exists)):
+    """
+    Requests, tokens, cost and latency of the profile's GPT calls over
+    the last `days`, optionally broken down by model, route or day.
+    """
+    if not profile_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="X-Profile-ID header is required.")
+    since = datetime.datetime.now() - datetime.timedelta(days=days)
+    total = await gpt_usage_ledger.aggregate(profile_id, since)
+    groups = []
+    if group_by:
+        groups = await gpt_usage_ledger.aggregate(profile_id, since,
+                                                  group_by)
+    return GptUsageSummary(since=since.isoformat(timespec="seconds"),
+                           group_by=group_by,
+                           total=GptUsageAggregate(**total[0]),
+                           groups=[GptUsageAggregate(**g) for g in groups])
+
+
+@profile_router.get("/gpt_usage/budget", response_model=GptBudget)
+async def get_gpt_budget(profile_id: str = Depends(ensure_profile_exists)):
+    """
+    The profile's GPT budget and what is left of it in the current
+    window.
+    """
+    if not profile_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="X-Profile-ID header is required.")
+    return GptBudget(**await budget_status(profile_id))
+
+
+@profile_router.put("/gpt_usage/budget", response_model=GptBudget)
+async def set_gpt_budget(budget: GptBudgetUpdate,
+                         profile_id: str = Depends(ensure_profile_exists)):
+    """
+    Override the default GPT budget for this profile.
+    """
+    if not profile_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="X-Profile-ID header is required.")
+    db = await get_db()
+    ex = await db.fetch_one(gpt_budgets.select().where(
+        gpt_budgets.c.profile_id == profile_id))
+    values = {"budget_usd": budget.budget_usd,
+              "window_seconds": (budget.window_seconds or
+                                 (ex.window_seconds if ex else
+                                  GPT_BUDGET_WINDOW)),
+              "updated_at": datetime.datetime.now()}
+    if ex:
+        await execute_write(gpt_budgets.update().where(
+            gpt_budgets.c.profile_id == profile_id).values(**values))
+    else:
+        await execute_write(gpt_budgets.insert().values(
+            profile_id=profile_id, **values))
+    return GptBudget(**await budget_status(profile_id))
+
+
+@profile_router.delete("/gpt_usage/budget", response_model=GptBudget)
+async def reset_gpt_budget(profile_id: str = Depends(ensure_profile_exists)):
+    """
+    Drop the profile's override, going back to the default budget.
+    """
+    if not profile_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="X-Profile-ID header is required.")
+    await execute_write(gpt_budgets.delete().where(
+        gpt_budgets.c.profile_id == profile_id))
+    return GptBudget(**await budget_status(profile_id))
+
+
 # --- Clip Management --- (collapsed)
 @profile_router.post("/clips/save", status_code=status.HTTP_201_CREATED)
-async def save_video_clip(profile_id: str = Depends(ensure_profile_exists),
+async def save_video_clip(profile_id: str = Depends(enforce_quota),
                           clip_start_time: str = Form(...),
                           clip_end_time: str = Form(...),
                           gpt_breakdown_response: str = Form(...),
@@ -112,15 +213,17 @@ async def save_video_clip(profile_id: str = Depends(ensure_profile_exists),
                             profile_id,
                             "clips",
                             fname)
+    c_digest = None
     try:
-        with open(loc, "wb+") as f:
+        with observe_stage("upload_write"), \
+                open(loc, "wb+") as f:
             shutil.copyfileobj(video_clip.file, f)
+        c_digest = await asyncio.to_thread(blob_store.adopt, loc)
         gpt_j = json.loads(gpt_breakdown_response)
         s_time = float(clip_start_time)
         e_time = float(clip_end_time)
-        db = await get_db()
         c_id = str(uuid.uuid4())
-        await db.execute(
+        await execute_write(
             clips.insert().values(
                 id=c_id,
                 profile_id=profile_id,
@@ -130,13 +233,16 @@ async def save_video_clip(profile_id: str = Depends(ensure_profile_exists),
                 video_clip_path=rel_path,
                 original_video_file_name=original_video_file_name,
                 original_video_url=original_video_url))
-        await db.execute(
+        await execute_write(
             profile_files.insert().values(
                 id=str(uuid.uuid4()),
                 profile_id=profile_id,
                 file_name=video_clip.filename,
                 file_path=rel_path,
-                file_type="video_clip"))
+                file_type="video_clip",
+                content_hash=c_digest))
+        await lemma_index.safe_index(profile_id, "clip", c_id,
+                                     gpt_j.get("sentence", ""))
         return {"success": True,
                 "message": "Clip saved successfully.",
                 "clip_id": c_id}
@@ -152,6 +258,7 @@ async def save_video_clip(profile_id: str = Depends(ensure_profile_exists),
         logger.exception("Err saving clip")
         if os.path.exists(loc):
             os.remove(loc)
+            blob_store.release(c_digest)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"Failed to save clip: {e}")
 
@@ -186,10 +293,14 @@ async def delete_saved_clip(clipId: str = Path(...,
     if not clip_r:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Clip not found.")
-    await db.execute(
+    await execute_write(
         clips.delete().where(clips.c.id == clipId).where(
             clips.c.profile_id == profile_id))
-    await db.execute(profile_files.delete().where(
+    await lemma_index.safe_remove("clip", clipId)
+    file_r = await db.fetch_one(profile_files.select().where(
+        profile_files.c.file_path == clip_r.video_clip_path
+        ).where(profile_files.c.profile_id == profile_id))
+    await execute_write(profile_files.delete().where(
         profile_files.c.file_path == clip_r.video_clip_path
         ).where(profile_files.c.profile_id == profile_id))
     fp = os.path.join(BASE_MEDIA_PATH, clip_r.video_clip_path)
@@ -197,6 +308,8 @@ async def delete_saved_clip(clipId: str = Path(...,
         try:
             os.remove(fp)
             logger.info(f"Deleted: {fp}")
+            if file_r:
+                blob_store.release(file_r.content_hash)
         except OSError as e:
             logger.error(f"Err deleting {fp}: {e}")
     else:
@@ -239,28 +352,35 @@ async def delete_profile_file(
     if not file_r:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="File record not found.")
-    await db.execute(profile_files.delete().where(profile_files.c.id == fileId)
-                     )
+    await execute_write(profile_files.delete().where(
+        profile_files.c.id == fileId))
     fp = os.path.join(BASE_MEDIA_PATH, file_r.file_path)
     if os.path.exists(fp):
         try:
             os.remove(fp)
             logger.info(f"Deleted file: {fp}")
+            blob_store.release(file_r.content_hash)
         except OSError as e:
             logger.error(f"Err deleting {fp}: {e}")
     else:
         logger.warning(f"File not found for del: {fp}")
     if file_r.file_type == "video_clip":
-        if await db.execute(
+        clip_r = await db.fetch_one(clips.select().where(
+            clips.c.video_clip_path == file_r.file_path))
+        if clip_r:
+            await lemma_index.safe_remove("clip", clip_r.id)
+        if await execute_write(
             clips.delete().where(
                 clips.c.video_clip_path == file_r.file_path)) > 0:
             logger.info(f"Del assoc. clip for {file_r.file_path}")
     elif file_r.file_type == "audio_source":
-        if await db.execute(
+        if await execute_write(
             profile_transcripts.update().where(
                 profile_transcripts.c.audio_file_path == file_r.file_path
                 ).values(audio_file_path=None)) > 0:
             logger.info(f"Cleared path in transcripts for {file_r.file_path}")
+    elif file_r.file_type == "srt":
+        await lemma_index.safe_remove("srt", fileId)
     return {"success": True, "message": "File deleted successfully."}
 
 
@@ -305,12 +425,16 @@ async def delete_profile_transcript(
     if not trans_r:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Transcript not found.")
-    await db.execute(profile_transcripts.delete().where(
+    await execute_write(profile_transcripts.delete().where(
         profile_transcripts.c.id == transcriptId))
     logger.info(f"Del transcript {transcriptId}")
+    await lemma_index.safe_remove("transcript", transcriptId)
     if trans_r.audio_file_path:
         aud_path = trans_r.audio_file_path
-        if await db.execute(profile_files.delete().where(
+        aud_r = await db.fetch_one(profile_files.select().where(
+            profile_files.c.file_path == aud_path
+            ).where(profile_files.c.profile_id == profile_id))
+        if await execute_write(profile_files.delete().where(
             profile_files.c.file_path == aud_path
              ).where(profile_files.c.profile_id == profile_id)) > 0:
             logger.info(f"Del assoc. profile_files for: {aud_path}")
@@ -319,6 +443,8 @@ async def delete_profile_transcript(
                 try:
                     os.remove(fp_aud)
                     logger.info(f"Del audio file: {fp_aud}")
+                    if aud_r:
+                        blob_store.release(aud_r.content_hash)
                 except OSError as e:
                     logger.error(f"Err del audio {fp_aud}: {e}")
             else:
@@ -329,34 +455,200 @@ async def delete_profile_transcript(
     return {"success": True, "message": "Transcript deleted successfully."}
 
 
-# --- Anki Export ---
-@profile_router.get("/anki_export", response_model=AnkiExportResponse)
-async def export_anki_deck(profile_id: str = Depends(ensure_profile_exists)):
+# --- Search ---
+@profile_router.get("/search", response_model=SearchResponse)
+async def search_saved(q: str = Query(..., min_length=1),
+                       limit: int = Query(20, ge=1, le=100),
+                       offset: int = Query(0, ge=0),
+                       profile_id: str = Depends(ensure_profile_exists)):
+    """
+    Ranked full-text search over the profile's transcripts, GPT
+    explanations and saved clip breakdowns.
+    """
+    if not profile_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="X-Profile-ID header is required.")
+    db = await get_db()
+    total, hits = await search_profile(db, profile_id, q, limit, offset)
+    return SearchResponse(query=q,
+                          total=total,
+                          limit=limit,
+                          offset=offset,
+                          results=[SearchResult(**h) for h in hits])
+
+
+# --- Lemma Index ---
+@profile_router.get("/lemmas", response_model=List[LemmaFrequency])
+async def get_lemma_frequencies(
+      limit: int = Query(100, ge=1, le=1000),
+      offset: int = Query(0, ge=0),
+      source_type: Optional[str] = Query(None,
+                                         pattern="^(clip|transcript|srt)$"),
+      profile_id: str = Depends(ensure_profile_exists)):
+    """
+    Lemmas in the profile's saved material, most frequent first.
+    """
+    if not profile_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="X-Profile-ID header is required.")
+    rows = await lemma_index.frequencies(profile_id, limit, offset,
+                                         source_type)
+    return [LemmaFrequency(**r) for r in rows]
+
+
+@profile_router.get("/lemmas/{lemma}", response_model=List[LemmaOccurrence])
+async def get_lemma_occurrences(
+      lemma: str = Path(..., title="Dictionary form to look up"),
+      profile_id: str = Depends(ensure_profile_exists)):
+    """
+    Saved clips, transcripts and SRTs containing any form of `lemma`.
+    """
     if not profile_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="X-Profile-ID header is required.")
+    rows = await lemma_index.occurrences(profile_id, lemma)
+    return [LemmaOccurrence(**r) for r in rows]
+
+
+@profile_router.post("/lemmas/rebuild", status_code=status.HTTP_200_OK)
+async def rebuild_lemma_index(profile_id: str = Depends(
+      ensure_profile_exists)):
+    """
+    Re-index everything the profile has saved, e.g. material saved
+    before the index existed.
+    """
+    if not profile_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="X-Profile-ID header is required.")
+    db = await get_db()
+    srt_files = {}
+    for f in await db.fetch_all(profile_files.select().where(
+            profile_files.c.profile_id == profile_id).where(
+                profile_files.c.file_type == "srt")):
+        fp = os.path.join(BASE_MEDIA_PATH, f.file_path)
+        if os.path.exists(fp):
+            with open(fp, "r", encoding="utf-8") as srt_f:
+                srt_files[f.id] = srt_f.read()
+    indexed = await lemma_index.rebuild(profile_id, srt_files)
+    return {"success": True, "indexed": indexed}
+
+
+# --- Anki Export ---
+ANKI_MEDIA_TYPE = "application/apkg"
+ANKI_DOWNLOAD_NAME = "mirumoji_saved_deck.apkg"
+
+
+async def _profile_clips(profile_id: str) -> List:
     db = await get_db()
     query = clips.select().where(clips.c.profile_id == profile_id).order_by(
         clips.c.created_at.desc())
-    clip_lst = [c for c in await db.fetch_all(query)]
+    return [c for c in await db.fetch_all(query)]
+
+
+def _clip_paths(clip_lst: List) -> List[str]:
+    return [str(pathlib.Path(BASE_MEDIA_PATH) / c.video_clip_path)
+            for c in clip_lst]
+
+
+def _compactor_for(profile_id: str) -> ClipCompactor:
+    return ClipCompactor(anki_cache.profile_dir(profile_id) / "media")
+
+
+def _deck_reusable(profile_id: str, clip_lst: List, compact: bool) -> bool:
+    """
+    Whether a cached deck may be served: compact decks only once every
+    clip was transcoded.
+    """
+    return not compact or _compactor_for(profile_id).complete(
+        c.id for c in clip_lst)
+
+
+def _anki_exporter_for(profile_id: str,
+                       clip_lst: List,
+                       compact: bool = False) -> AnkiExporter:
+    media = _clip_paths(clip_lst)
+    if compact:
+        media = _compactor_for(profile_id).compact(
+            list(zip((c.id for c in clip_lst), media)))
     anki = AnkiExporter()
-    for c in clip_lst:
+    for c, path in zip(clip_lst, media):
         breakdown = c.gpt_breakdown_response
         explanation = breakdown["gpt_explanation"]
         sentence = breakdown['sentence']
-        path = str(pathlib.Path(BASE_MEDIA_PATH) / c.video_clip_path)
         focus = breakdown["focus"]['word']
         meanings = ','.join(breakdown['focus']['meanings'])
         anki.add_card(clip_path=path,
                       word=focus,
                       meanings=meanings,
                       sentence=sentence,
-                      explanation=explanation
+                      explanation=explanation,
+                      note_id=c.id
                       )
-    anki_dir = pathlib.Path(TEMP_MEDIA_PATH) / 'profiles' / profile_id / 'anki'
-    anki_dir.mkdir(parents=True, exist_ok=True)
-    pkg_fn = f"{uuid.uuid4()}_saved_deck.apkg"
-    outpath = anki_dir / pkg_fn
-    anki.export(outpath)
-    media_path = f"/media/temp/profiles/{profile_id}/anki/{pkg_fn}"
-    return AnkiExportResponse(anki_deck_url=media_path)
+    return anki
+
+
+@profile_router.get("/anki_export", response_model=AnkiExportResponse)
+async def export_anki_deck(compact: bool = Query(False),
+                           profile_id: str = Depends(ensure_profile_exists)):
+    """
+    Export saved clips as an Anki deck. With `compact`, clips are
+    transcoded to small mobile-friendly renditions first.
+    """
+    if not profile_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="X-Profile-ID header is required.")
+    t0 = time.perf_counter()
+    clip_lst = await _profile_clips(profile_id)
+    version = deck_version((c.id for c in clip_lst),
+                           "compact" if compact else "")
+    reuse = await asyncio.to_thread(_deck_reusable, profile_id, clip_lst,
+                                    compact)
+    outpath, cached = await anki_cache.get_or_build(
+        profile_id, version,
+        lambda out: _anki_exporter_for(profile_id, clip_lst,
+                                       compact).export(out),
+        reuse=reuse)
+    report = await asyncio.to_thread(size_report, _clip_paths(clip_lst),
+                                     outpath)
+    elapsed = round(time.perf_counter() - t0, 3)
+    logger.info(f"Anki export for {profile_id}: version {version} "
+                f"({'cached' if cached else 'built'}) in {elapsed}s, "
+                f"{report}")
+    media_path = (f"/media/temp/profiles/{profile_id}/anki/"
+                  f"{outpath.name}")
+    return AnkiExportResponse(anki_deck_url=media_path,
+                              cached=cached,
+                              compact=compact,
+                              export_seconds=elapsed,
+                              **report)
+
+
+@profile_router.get("/anki_export/stream")
+async def stream_anki_deck(compact: bool = Query(False),
+                           profile_id: str = Depends(ensure_profile_exists)):
+    """
+    Download the deck directly. Uncached decks are streamed while they
+    are generated (and saved for the next export) instead of being
+    built in full first.
+    """
+    if not profile_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="X-Profile-ID header is required.")
+    clip_lst = await _profile_clips(profile_id)
+    version = deck_version((c.id for c in clip_lst),
+                           "compact" if compact else "")
+    cached = anki_cache.path_for(profile_id, version)
+    hit = cached.exists() and await asyncio.to_thread(
+        _deck_reusable, profile_id, clip_lst, compact)
+    record_cache("anki_package", hit)
+    if hit:
+        return FileResponse(cached,
+                            media_type=ANKI_MEDIA_TYPE,
+                            filename=ANKI_DOWNLOAD_NAME)
+    anki = await asyncio.to_thread(_anki_exporter_for, profile_id, clip_lst,
+                                   compact)
+    disposition = f'attachment; filename="{ANKI_DOWNLOAD_NAME}"'
+    return StreamingResponse(
+        anki_cache.tee(profile_id, version, anki.iter_package()),
+        media_type=ANKI_MEDIA_TYPE,
+        headers={"Content-Disposition": disposition})
@@ -9,18 +9,25 @@ from fastapi import (
     status,
 )
 import asyncio
-from profile_manager import ensure_profile_exists
+from utils.storage_utils import enforce_quota
+from utils.blob_store import blob_store, hash_file
 import shutil
-from db.db import get_db
+from db.db import execute_write
 from db.Tables import profile_files
 import uuid
 from utils.env_utils import using_modal
+from utils.metrics_utils import observe_stage
+from utils.tracing_utils import tracer
+from utils.readiness_utils import readiness
+from utils.gpt_usage_utils import enforce_gpt_budget
 from processing.audio_processing import AudioTools
 from processing.Processor import Processor
+from processing.lemma_index import lemma_index
 USING_MODAL = using_modal()
 if not USING_MODAL:
-    from processing.whisper_wrapper import FWhisperWrapper
-    fwhisper = FWhisperWrapper()
+    from processing.whisper_wrapper import shared_whisper
+    fwhisper = shared_whisper()
+    readiness.register("whisper", fwhisper.warm_up)
 
 
 logger = logging.getLogger(__name__)
@@ -31,13 +38,28 @@ TEMP_DIR = BASE_MEDIA_DIR / "temp"
 if USING_MODAL:
     processor = Processor(save_path=BASE_MEDIA_DIR,
                           use_modal=True)
+    # Look up the deployed worker before the first request
+    readiness.register("modal", processor.executor.warm_up)
 TEMP_DIR.mkdir(parents=True, exist_ok=True)
+# Derived-output key of conversions, by digest of the uploaded video
+MP4_RECIPE = "mp4-1280x720"
 
 
-@video_router.post("/generate_srt")
+async def _srt_recipe() -> str:
+    """
+    Derived-output key of SRTs, which depends on the Whisper
+    configuration and GPT version doing the transcription.
+    """
+    if USING_MODAL:
+        return await processor.modal_recipe("srt")
+    return fwhisper.recipe("srt")
+
+
+@video_router.post("/generate_srt",
+                   dependencies=[Depends(enforce_gpt_budget)])
 async def generate_srt(
     video_file: UploadFile = File(...),
-    profile_id: str = Depends(ensure_profile_exists),
+    profile_id: str = Depends(enforce_quota),
 ):
     if not profile_id:
         raise HTTPException(
@@ -60,64 +82,32 @@ async def generate_srt(
 
     try:
         # 1. Save uploaded video to operation's temp dir
-        with open(tmp_vid_upload_loc, "wb+") as f_obj:
+        with observe_stage("upload_write"), \
+                open(tmp_vid_upload_loc, "wb+") as f_obj:
             shutil.copyfileobj(video_file.file, f_obj)
         logger.info(f"Temp video for SRT: {tmp_vid_upload_loc}")
-
-        # 2. Init AudioTools with operation's temp dir
-        audio_tools = AudioTools(working_dir=op_tmp_dir)
-
-        # 3. Extract audio
-        extracted_audio_fpath = audio_tools.extract_audio(
-            input_path=str(tmp_vid_upload_loc)
-        )
-        if not extracted_audio_fpath or not Path(extracted_audio_fpath
-                                                 ).exists():
-            logger.error(f"Audio extraction failed for {tmp_vid_upload_loc}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to extract audio from video.",
-            )
-        logger.info(f"Audio extracted to {extracted_audio_fpath}")
-
-        # 4. Transcribe extracted audio to SRT string
-        # If Modal env variables are available use MODAL
-        if USING_MODAL:
-            logger.info("Conversion sent to Modal")
-            logger.info(f"Local Filepath: {extracted_audio_fpath}")
-            # Fix path for Internal Mounted Modal Container
-            parts = Path(extracted_audio_fpath).parts
-            extracted_audio_fpath = Path(*parts[-4:])
-            logger.info(
-                f"Media Filepath Adapted for Modal: {extracted_audio_fpath}")
-            srt_result = await processor.modal_transcribe_to_srt(
-                    media_fp=str(extracted_audio_fpath),
-                    )
-        # Run locally
+        video_digest = await asyncio.to_thread(hash_file, tmp_vid_upload_loc)
+        srt_recipe = await _srt_recipe()
+        srt_result = await asyncio.to_thread(blob_store.read_derived_text,
+                                             video_digest, srt_recipe)
+        span = tracer.current_span()
+        if span:
+            span.set_attribute("srt.cache_hit", srt_result is not None)
+        if srt_result is not None:
+            logger.info(f"Reusing SRT generated for {video_digest[:12]}")
         else:
-            logger.info("Running Locally")
-            logger.info(f"Local Filepath: {extracted_audio_fpath}")
-            srt_result = await asyncio.to_thread(
-                fwhisper.transcribe_to_srt,
-                audio_path=str(extracted_audio_fpath),
-                output_path=" ",
-                string_result=True,
-                fix_with_chat_gpt=True
-            )
-
-        if not srt_result:
-            logger.error(
-                f"SRT transcription failed for {extracted_audio_fpath}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to generate SRT from audio.",
-            )
-        with open(srt_fp, "w", encoding="utf-8") as f:
+            srt_result = await _transcribe_video_to_srt(op_tmp_dir,
+                                                        tmp_vid_upload_loc)
+            await asyncio.to_thread(blob_store.put_derived_text,
+                                    video_digest, srt_recipe, srt_result)
+        tmp_srt = op_tmp_dir / f"{op_id}.srt"
+        with open(tmp_srt, "w", encoding="utf-8") as f:
             f.write(srt_result)
+        srt_digest = await asyncio.to_thread(blob_store.ingest, tmp_srt,
+                                             srt_fp)
         logger.info(f"SRT content generated for profile {profile_id}")
 
         # 5. Save metadata
-        db = await get_db()
         vid_rec_id = str(uuid.uuid4())
         ins_vid_query = profile_files.insert().values(
             id=vid_rec_id,
@@ -125,11 +115,14 @@ async def generate_srt(
             file_name=srt_fp.name,
             file_path=str(relative_srt_fp),
             file_type="srt",
+            content_hash=srt_digest,
         )
-        await db.execute(ins_vid_query)
+        await execute_write(ins_vid_query)
         logger.info(
             f"SRT record saved for profile {profile_id}"
         )
+        await lemma_index.safe_index(profile_id, "srt", vid_rec_id,
+                                     lemma_index.srt_text(srt_result))
 
         return {"srt_content": srt_result}
 
@@ -153,10 +146,64 @@ async def generate_srt(
                 logger.error(f"Error cleaning temp dir {op_tmp_dir}: {e_os}")
 
 
+async def _transcribe_video_to_srt(op_tmp_dir: Path,
+                                   tmp_vid_upload_loc: Path) -> str:
+    """
+    Extract the audio of an uploaded video and transcribe it to SRT.
+    """
+    # 2. Init AudioTools with operation's temp dir
+    audio_tools = AudioTools(working_dir=op_tmp_dir)
+
+    # 3. Extract audio
+    extracted_audio_fpath = audio_tools.extract_audio(
+        input_path=str(tmp_vid_upload_loc)
+    )
+    if not extracted_audio_fpath or not Path(extracted_audio_fpath
+                                             ).exists():
+        logger.error(f"Audio extraction failed for {tmp_vid_upload_loc}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to extract audio from video.",
+        )
+    logger.info(f"Audio extracted to {extracted_audio_fpath}")
+
+    # 4. Transcribe extracted audio to SRT string
+    # If Modal env variables are available use MODAL
+    if USING_MODAL:
+        logger.info("Conversion sent to Modal")
+        logger.info(f"Local Filepath: {extracted_audio_fpath}")
+        with tracer.span("transcribe_to_srt",
+                         executor=processor.executor.name):
+            srt_result = await processor.modal_transcribe_to_srt(
+                    media_fp=str(extracted_audio_fpath),
+                    )
+    # Run locally
+    else:
+        logger.info("Running Locally")
+        logger.info(f"Local Filepath: {extracted_audio_fpath}")
+        with tracer.span("transcribe_to_srt", executor="local"):
+            srt_result = await asyncio.to_thread(
+                fwhisper.transcribe_to_srt,
+                audio_path=str(extracted_audio_fpath),
+                output_path=" ",
+                string_result=True,
+                fix_with_chat_gpt=True
+            )
+
+    if not srt_result:
+        logger.error(
+            f"SRT transcription failed for {extracted_audio_fpath}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to generate SRT from audio.",
+        )
+    return srt_result
+
+
 @video_router.post("/convert_to_mp4")
 async def convert_to_mp4(
     video_file: UploadFile = File(...),
-    profile_id: str = Depends(ensure_profile_exists),
+    profile_id: str = Depends(enforce_quota),
 ):
     if not profile_id:
         raise HTTPException(
@@ -184,35 +231,50 @@ async def convert_to_mp4(
     rel_conv_db_path = (
        Path("profiles") / profile_id / "converted" / conv_stored_fname
     )
+    converted_digest = None
 
     try:
         # 1. Save uploaded video to temp location
-        with open(tmp_uploaded_vid_loc, "wb+") as f_obj:
+        with observe_stage("upload_write"), \
+                open(tmp_uploaded_vid_loc, "wb+") as f_obj:
             shutil.copyfileobj(video_file.file, f_obj)
         logger.info(f"Temp video for conversion: {tmp_uploaded_vid_loc}")
+        source_digest = await asyncio.to_thread(hash_file,
+                                                tmp_uploaded_vid_loc)
+        converted_digest = await asyncio.to_thread(blob_store.get_derived,
+                                                   source_digest, MP4_RECIPE)
 
         # 3. Convert video, saving to final converted location
-        # If MODAL env variables are available use MODAL
-        if USING_MODAL:
-            logger.info("Conversion sent to Modal")
-            logger.info(f"Video Filepath:{tmp_uploaded_vid_loc}")
-            logger.info(f"Output Path: {final_conv_stored_loc}")
-            conv_path_obj = await processor.modal_convert_to_mp4(
-                video_fp=str(tmp_uploaded_vid_loc),
-                outpath=str(final_conv_stored_loc)
-            )
-        # Run Locally
-        else:
-            logger.info("Running Locally")
+        conv_path_obj = None
+        if converted_digest:
+            logger.info(f"Reusing conversion of {source_digest[:12]}")
+            try:
+                conv_path_obj = await asyncio.to_thread(
+                    blob_store.link, converted_digest, final_conv_stored_loc)
+            except OSError as e:
+                # Collected since the lookup
+                logger.warning(f"Could not reuse conversion: {e}")
+                converted_digest = None
+        if not conv_path_obj:
             logger.info(f"Video Filepath:{tmp_uploaded_vid_loc}")
             logger.info(f"Output Path: {final_conv_stored_loc}")
-            audio_tools = AudioTools(working_dir=op_tmp_dir)
-            conv_path_obj = await asyncio.to_thread(
-                audio_tools.to_mp4,
-                input_path=str(tmp_uploaded_vid_loc),
-                output_path=str(final_conv_stored_loc),
-                use_nvenc=True
-            )
+            # If MODAL env variables are available use MODAL
+            if USING_MODAL:
+                logger.info("Conversion sent to Modal")
+                conv_path_obj = await processor.modal_convert_to_mp4(
+                    video_fp=str(tmp_uploaded_vid_loc),
+                    outpath=str(final_conv_stored_loc)
+                )
+            # Run Locally
+            else:
+                logger.info("Running Locally")
+                audio_tools = AudioTools(working_dir=op_tmp_dir)
+                conv_path_obj = await asyncio.to_thread(
+                    audio_tools.to_mp4,
+                    input_path=str(tmp_uploaded_vid_loc),
+                    output_path=str(final_conv_stored_loc),
+                    use_nvenc=True
+                )
 
         if not conv_path_obj or not final_conv_stored_loc.exists():
             logger.error(f"MP4 conversion failed for {tmp_uploaded_vid_loc}")
@@ -221,9 +283,12 @@ async def convert_to_mp4(
                 detail="Video conversion to MP4 failed.",
             )
         logger.info(f"Video converted to {final_conv_stored_loc}")
+        if not converted_digest:
+            converted_digest = await asyncio.to_thread(
+                blob_store.put_derived, source_digest, MP4_RECIPE,
+                final_conv_stored_loc)
 
         # 5. Save metadata for converted files to DB
-        db = await get_db()
         conv_rec_id = str(uuid.uuid4())
 
         ins_conv_q = profile_files.insert().values(
@@ -232,8 +297,9 @@ async def convert_to_mp4(
             file_name=conv_stored_fname,
             file_path=str(rel_conv_db_path),
             file_type="mp4",
+            content_hash=converted_digest,
         )
-        await db.execute(ins_conv_q)
+        await execute_write(ins_conv_q)
         logger.info(
             f"Converted video records saved for profile:{profile_id}"
         )
@@ -254,6 +320,7 @@ async def convert_to_mp4(
             if loc.exists():
                 try:
                     loc.unlink()
+                    blob_store.release(converted_digest)
                 except OSError:
                     logger.error(f"Could not remove {loc}")
         raise HTTPException(
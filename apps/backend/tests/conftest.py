@@ -0,0 +1,70 @@
+"""
+Shared fixtures. Run from apps/backend:
+    python -m pip install -r requirements-dev.txt
+    python -m pytest
+
+Database tests run on SQLite and on PostgreSQL. The PostgreSQL server
+is TEST_POSTGRES_URL (a database the tests may create databases on)
+or, when unset, an embedded server started with `pgserver`; without
+either the PostgreSQL cases are skipped.
+"""
+import os
+import tempfile
+import uuid
+import pytest
+from databases import Database, DatabaseURL
+
+# Modules read their configuration at import time
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TRACING_EXPORTER", "none")
+os.environ.setdefault("DATABASE_URL",
+                      f"sqlite:///{tempfile.mkdtemp()}/mirumoji.db")
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def postgres_url(tmp_path_factory):
+    """
+    URL of a PostgreSQL server for the session.
+    """
+    if TEST_POSTGRES_URL:
+        return TEST_POSTGRES_URL
+    pgserver = pytest.importorskip(
+        "pgserver", reason="set TEST_POSTGRES_URL or install pgserver")
+    server = pgserver.get_server(tmp_path_factory.mktemp("pgdata"),
+                                 cleanup_mode="stop")
+    url = DatabaseURL(server.get_uri())
+    return str(url.replace(dialect="postgresql", driver="asyncpg"))
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+async def database(request, tmp_path):
+    """
+    A connected, empty database of each dialect.
+    """
+    if request.param == "sqlite":
+        db = Database(f"sqlite:///{tmp_path / 'test.db'}")
+        await db.connect()
+        try:
+            yield db
+        finally:
+            await db.disconnect()
+        return
+    server_url = DatabaseURL(request.getfixturevalue("postgres_url"))
+    name = f"test_{uuid.uuid4().hex}"
+    async with Database(server_url) as admin:
+        await admin.execute(f"CREATE DATABASE {name}")
+    db = Database(server_url.replace(database=name))
+    await db.connect()
+    try:
+        yield db
+    finally:
+        await db.disconnect()
+        async with Database(server_url) as admin:
+            await admin.execute(f"DROP DATABASE {name}")
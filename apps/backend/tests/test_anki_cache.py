@@ -0,0 +1,113 @@
+import asyncio
+import time
+from pathlib import Path
+import pytest
+import processing.audio_processing as audio_processing
+from utils.anki_utils import AnkiPackageCache, ClipCompactor, deck_version
+
+
+def _builder(builds):
+    def build(path):
+        builds.append(path)
+        time.sleep(0.05)
+        path.write_bytes(b"apkg")
+    return build
+
+
+@pytest.mark.anyio
+async def test_concurrent_exports_share_one_build(tmp_path):
+    cache = AnkiPackageCache(tmp_path)
+    builds = []
+    version = deck_version(["c1", "c2"])
+    results = await asyncio.gather(*(cache.get_or_build(
+        "p1", version, _builder(builds)) for _ in range(5)))
+    assert len(builds) == 1
+    assert {path for path, _ in results} == {cache.path_for("p1", version)}
+    assert sorted(hit for _, hit in results) == [False] + [True] * 4
+    assert cache._locks == {}
+
+
+@pytest.mark.anyio
+async def test_new_version_replaces_stale_package(tmp_path):
+    cache = AnkiPackageCache(tmp_path)
+    builds = []
+    old, _ = await cache.get_or_build("p1", deck_version(["c1"]),
+                                      _builder(builds))
+    compact, _ = await cache.get_or_build(
+        "p1", deck_version(["c1"], "compact"), _builder(builds))
+    new, _ = await cache.get_or_build("p1", deck_version(["c1", "c2"]),
+                                      _builder(builds))
+    assert not old.exists()
+    # Other variants are kept
+    assert compact.exists()
+    assert new.exists()
+    assert cache._locks == {}
+
+
+@pytest.mark.anyio
+async def test_failed_build_leaves_no_package(tmp_path):
+    cache = AnkiPackageCache(tmp_path)
+
+    def build(path):
+        path.write_bytes(b"partial")
+        raise RuntimeError("ffmpeg failed")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_build("p1", "v1", build)
+    assert list(cache.profile_dir("p1").iterdir()) == []
+    assert cache._locks == {}
+
+
+class FlakyTools:
+    """
+    AudioTools stand-in whose transcodes fail for clips in `failing`.
+    """
+    failing = set()
+    calls = []
+
+    def __init__(self, working_dir):
+        pass
+
+    def to_compact_clip(self, input_path, output_path, max_height, codec):
+        FlakyTools.calls.append(input_path)
+        if input_path in FlakyTools.failing:
+            return None
+        Path(output_path).write_bytes(b"compact")
+        return Path(output_path)
+
+
+def test_failed_transcode_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_processing, "AudioTools", FlakyTools)
+    FlakyTools.calls = []
+    clips = []
+    for clip_id in ("c1", "c2"):
+        src = tmp_path / f"{clip_id}.webm"
+        src.write_bytes(b"original")
+        clips.append((clip_id, str(src)))
+    FlakyTools.failing = {clips[1][1]}
+    compactor = ClipCompactor(tmp_path / "media", workers=2)
+
+    media = compactor.compact(clips)
+    assert media[0] == str(compactor.path_for("c1"))
+    assert media[1] == clips[1][1]
+    assert not compactor.complete(["c1", "c2"])
+
+    FlakyTools.failing = set()
+    media = compactor.compact(clips)
+    assert media == [str(compactor.path_for(c)) for c in ("c1", "c2")]
+    assert compactor.complete(["c1", "c2"])
+    # c1 came from the cache both times
+    assert FlakyTools.calls.count(clips[0][1]) == 1
+    assert FlakyTools.calls.count(clips[1][1]) == 2
+
+
+@pytest.mark.anyio
+async def test_reuse_false_rebuilds(tmp_path):
+    cache = AnkiPackageCache(tmp_path)
+    builds = []
+    await cache.get_or_build("p1", "v1", _builder(builds))
+    path, hit = await cache.get_or_build("p1", "v1", _builder(builds),
+                                         reuse=False)
+    assert not hit
+    assert len(builds) == 2
+    assert path.exists()
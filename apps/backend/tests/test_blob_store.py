@@ -0,0 +1,102 @@
+import errno
+import os
+import time
+import pytest
+import utils.blob_store as blob_module
+from utils.blob_store import BlobStore, hash_file
+from utils.storage_utils import _age
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path / "blobs")
+
+
+def _upload(tmp_path, name: str, content: bytes = b"video"):
+    path = tmp_path / "uploads" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def test_identical_files_share_one_blob(tmp_path, store):
+    a = store.ingest(_upload(tmp_path, "a"), tmp_path / "p1" / "a.mp4")
+    b = store.ingest(_upload(tmp_path, "b"), tmp_path / "p2" / "b.mp4")
+    assert a == b == hash_file(tmp_path / "p1" / "a.mp4")
+    blob = store.path_for(a)
+    assert os.path.samefile(blob, tmp_path / "p1" / "a.mp4")
+    assert os.path.samefile(blob, tmp_path / "p2" / "b.mp4")
+    assert blob.stat().st_nlink == 3
+    assert len(list(store.objects_dir.glob("*/*/*"))) == 1
+
+
+def test_release_deletes_last_reference_only(tmp_path, store):
+    first, second = tmp_path / "p1" / "a.mp4", tmp_path / "p2" / "b.mp4"
+    digest = store.ingest(_upload(tmp_path, "a"), first)
+    store.ingest(_upload(tmp_path, "b"), second)
+    first.unlink()
+    assert not store.release(digest)
+    assert store.exists(digest)
+    second.unlink()
+    assert store.release(digest)
+    assert not store.exists(digest)
+
+
+def test_collect_garbage_keeps_referenced_blobs(tmp_path, store):
+    kept = store.ingest(_upload(tmp_path, "a", b"kept"),
+                        tmp_path / "p1" / "a.mp4")
+    dropped_path = tmp_path / "p1" / "b.mp4"
+    dropped = store.ingest(_upload(tmp_path, "b", b"dropped"), dropped_path)
+    dropped_path.unlink()
+    assert store.collect_garbage() == len(b"dropped")
+    assert store.exists(kept)
+    assert not store.exists(dropped)
+
+
+def test_link_replaces_destination_atomically(tmp_path, store):
+    digest = store.ingest(_upload(tmp_path, "a", b"new"),
+                          tmp_path / "p1" / "a.mp4")
+    dest = tmp_path / "p2" / "b.mp4"
+    dest.parent.mkdir()
+    dest.write_bytes(b"old")
+    store.link(digest, dest)
+    assert dest.read_bytes() == b"new"
+    store.link(digest, dest)
+    assert sorted(p.name for p in dest.parent.iterdir()) == ["b.mp4"]
+    with pytest.raises(FileNotFoundError):
+        store.link("0" * 64, dest)
+    assert dest.read_bytes() == b"new"
+
+
+def test_derived_outputs(tmp_path, store):
+    source = store.ingest(_upload(tmp_path, "a"), tmp_path / "p1" / "a.mp4")
+    assert store.get_derived(source, "srt") is None
+    store.put_derived_text(source, "srt", "1\n00:00:01,000 --> ...")
+    assert store.read_derived_text(source, "srt").startswith("1\n")
+    # The output survives garbage collection through its record
+    store.collect_garbage()
+    assert store.read_derived_text(source, "srt") is not None
+    assert store.prune_derived(max_age=60, now=time.time() + 120) == 1
+    assert store.get_derived(source, "srt") is None
+
+
+def test_no_copies_without_hard_links(tmp_path, store, monkeypatch):
+    def no_links(src, dst):
+        raise OSError(errno.EPERM, "Operation not permitted")
+
+    monkeypatch.setattr(blob_module.os, "link", no_links)
+    path = tmp_path / "p1" / "a.mp4"
+    digest = store.ingest(_upload(tmp_path, "a"), path)
+    assert path.read_bytes() == b"video"
+    assert not store.exists(digest)
+    store.put_derived_text(digest, "srt", "text")
+    assert store.get_derived(digest, "srt") is None
+
+
+def test_linked_file_is_young(tmp_path, store):
+    digest = store.ingest(_upload(tmp_path, "a"), tmp_path / "p1" / "a.mp4")
+    day_ago = time.time() - 86400
+    os.utime(store.path_for(digest), (day_ago, day_ago))
+    dest = store.link(digest, tmp_path / "p2" / "b.mp4")
+    assert dest.stat().st_mtime == pytest.approx(day_ago)
+    assert _age(dest, time.time()) < 60
@@ -0,0 +1,109 @@
+import pytest
+from databases import Database
+from db.migrations import (MIGRATIONS, create_tables, dialect_name,
+                           run_migrations)
+from db.migrations import _baseline_tables
+from db.search import search_profile
+from db.Tables import (clips, gpt_templates, profile_files,
+                       profile_transcripts, profiles)
+
+pytestmark = pytest.mark.anyio
+
+ALL_VERSIONS = sorted(version for version, _, _ in MIGRATIONS)
+
+
+async def _columns(database, table: str) -> set:
+    row = await database.fetch_one(f"SELECT * FROM {table} LIMIT 1")
+    if row is not None:
+        return set(row._mapping.keys())
+    if database.url.dialect == "sqlite":
+        rows = await database.fetch_all(f"PRAGMA table_info({table})")
+        return {r["name"] for r in rows}
+    rows = await database.fetch_all(
+        """SELECT column_name FROM information_schema.columns
+           WHERE table_name = :table""", {"table": table})
+    return {r["column_name"] for r in rows}
+
+
+async def test_migrations_apply_once(database):
+    assert await run_migrations(database) == ALL_VERSIONS
+    assert await run_migrations(database) == []
+    assert "content_hash" in await _columns(database, "profile_files")
+
+
+async def test_postgres_scheme_takes_the_migration_lock(database):
+    if database.url.dialect == "sqlite":
+        pytest.skip("PostgreSQL only")
+    # postgres://..., as accepted by db.IS_POSTGRES
+    url = database.url.replace(dialect="postgres", driver="")
+    async with Database(url) as db:
+        assert dialect_name(db) == "postgresql"
+        statements = []
+        execute = db.execute
+
+        async def recording(query, values=None):
+            statements.append(str(query))
+            return await execute(query, values)
+
+        db.execute = recording
+        assert await run_migrations(db) == ALL_VERSIONS
+    assert "pg_advisory_xact_lock" in statements[0]
+
+
+async def test_upgrades_database_created_before_migrations(database):
+    # As left by METADATA.create_all before the migrations existed
+    await create_tables(database, *_baseline_tables)
+    await database.execute(profiles.insert().values(id="p1", name="p1"))
+    await database.execute(profile_files.insert().values(
+        id="f1", profile_id="p1", file_name="a.wav",
+        file_path="profiles/p1/audios/a.wav", file_type="audio_source"))
+    assert await run_migrations(database) == ALL_VERSIONS
+    row = await database.fetch_one(profile_files.select())
+    assert row.file_path == "profiles/p1/audios/a.wav"
+    assert row.content_hash is None
+
+
+async def test_crud(database):
+    await run_migrations(database)
+    await database.execute(profiles.insert().values(id="p1", name="p1"))
+    await database.execute(gpt_templates.insert().values(
+        id="g1", profile_id="p1", sys_msg="sys", prompt="prompt"))
+    await database.execute(profile_transcripts.insert().values(
+        id="t1", profile_id="p1", transcript="今日はいい天気ですね"))
+    await database.execute(profile_files.insert().values(
+        id="f1", profile_id="p1", file_name="a.wav",
+        file_path="profiles/p1/audios/a.wav", file_type="audio_source",
+        related_transcript_id="t1", content_hash="ab" * 32))
+    breakdown = {"sentence": "猫が好き", "focus": {"word": "猫"}}
+    await database.execute(clips.insert().values(
+        id="c1", profile_id="p1", clip_start_time=1.0, clip_end_time=2.5,
+        gpt_breakdown_response=breakdown,
+        video_clip_path="profiles/p1/clips/c1.mp4"))
+
+    clip = await database.fetch_one(clips.select())
+    assert clip.gpt_breakdown_response == breakdown
+    template = await database.fetch_one(gpt_templates.select().where(
+        gpt_templates.c.profile_id == "p1"))
+    assert template.prompt == "prompt"
+
+    await database.execute(profile_transcripts.update().where(
+        profile_transcripts.c.id == "t1").values(gpt_explanation="weather"))
+    transcript = await database.fetch_one(profile_transcripts.select())
+    assert transcript.gpt_explanation == "weather"
+
+    await database.execute(profile_files.delete().where(
+        profile_files.c.profile_id == "p1"))
+    assert await database.fetch_all(profile_files.select()) == []
+
+
+async def test_search_matches_wildcards_literally(database):
+    await run_migrations(database)
+    await database.execute(profiles.insert().values(id="p1", name="p1"))
+    for i, text in enumerate(["100% sure", "1000 sure"]):
+        await database.execute(profile_transcripts.insert().values(
+            id=f"t{i}", profile_id="p1", transcript=text))
+    total, results = await search_profile(database, "p1", "100%")
+    assert total == 1
+    assert results[0]["id"] == "t0"
+    total, _ = await search_profile(database, "p1", "sure")
+    assert total == 2
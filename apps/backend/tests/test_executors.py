@@ -0,0 +1,224 @@
+import hashlib
+import sys
+import types
+from contextlib import asynccontextmanager, contextmanager
+import pytest
+import modal_processing.executors as executors
+from processing.gpt_wrapper import GptModel
+from modal_processing.executors import (LocalExecutor,
+                                        ModalDeployedExecutor,
+                                        ModalEphemeralExecutor, get_executor)
+
+pytestmark = pytest.mark.anyio
+
+
+class NotFoundError(Exception):
+    pass
+
+
+USAGE = {"model": "gpt-4.1", "prompt_tokens": 1000,
+         "completion_tokens": 900, "cached_tokens": 0, "cost_usd": 0.0092,
+         "latency_ms": 2500.0, "finish_reason": "stop"}
+
+
+class FakeWorker:
+    """
+    WhisperWorker stand-in recording `.remote.aio` / `.remote_gen.aio`
+    calls as (runner, method, kwargs).
+    """
+    def __init__(self, runner, calls):
+        self.runner, self.calls = runner, calls
+        self.autoscaler = None
+
+    def __getattr__(self, method):
+        async def remote(**kwargs):
+            self.calls.append((self.runner, method, kwargs))
+            if method == "transcribe_srt":
+                return {"srt": f"{self.runner}:{method}",
+                        "gpt_usage": [USAGE]}
+            return f"{self.runner}:{method}"
+
+        async def remote_gen(**kwargs):
+            self.calls.append((self.runner, method, kwargs))
+            yield f"{self.runner}:{method}".encode()
+
+        return types.SimpleNamespace(
+            remote=types.SimpleNamespace(aio=remote),
+            remote_gen=types.SimpleNamespace(aio=remote_gen))
+
+    def update_autoscaler(self, min_containers):
+        self.autoscaler = min_containers
+
+
+@pytest.fixture
+def fake_modal(monkeypatch):
+    """
+    A `modal` module whose Cls.from_name finds a deployed worker unless
+    `deployed` is False and whose input volume records `uploads`, and an
+    ephemeral ModalApp recording app.run().
+    """
+    state = types.SimpleNamespace(deployed=True, lookups=[], runs=0,
+                                  calls=[], worker=None, uploads=[],
+                                  volume={})
+
+    class Volume:
+        @classmethod
+        def from_name(cls, name, create_if_missing=False):
+            assert name == executors.MODAL_INPUT_VOLUME
+            return cls()
+
+        @contextmanager
+        def batch_upload(self, force=False):
+            batch = []
+            yield types.SimpleNamespace(
+                put_file=lambda src, dst: batch.append((src, dst)))
+            for src, dst in batch:
+                if dst in state.volume and not force:
+                    raise FileExistsError(dst)
+                with open(src, "rb") as f:
+                    state.volume[dst] = f.read()
+                state.uploads.append(dst)
+
+    class Cls:
+        def __init__(self, app_name, class_name):
+            self.name = (app_name, class_name)
+
+        @classmethod
+        def from_name(cls, app_name, class_name):
+            state.lookups.append((app_name, class_name))
+            return cls(app_name, class_name)
+
+        def hydrate(self):
+            if not state.deployed:
+                raise NotFoundError(f"{self.name} not found")
+            return self
+
+        def __call__(self):
+            state.worker = FakeWorker("deployed", state.calls)
+            return state.worker
+
+    modal = types.ModuleType("modal")
+    modal.Cls = Cls
+    modal.Volume = Volume
+    modal.exception = types.SimpleNamespace(NotFoundError=NotFoundError)
+    monkeypatch.setitem(sys.modules, "modal", modal)
+
+    @asynccontextmanager
+    async def run():
+        state.runs += 1
+        yield
+
+    modal_app = types.SimpleNamespace(
+        app=types.SimpleNamespace(run=run),
+        WhisperWorker=lambda: FakeWorker("ephemeral", state.calls))
+    monkeypatch.setattr(ModalEphemeralExecutor, "modal_app", modal_app)
+    executors._input_volume.cache_clear()
+    yield state
+    executors._input_volume.cache_clear()
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    path = tmp_path / "clip.webm"
+    path.write_bytes(b"video")
+    # Inputs must be streamed from disk, never loaded whole
+    monkeypatch.setattr(executors.Path, "read_bytes", _no_read_bytes)
+    return path
+
+
+def _no_read_bytes(self):
+    raise AssertionError(f"read {self} into memory")
+
+
+def _key(path):
+    return f"{hashlib.sha256(b'video').hexdigest()}{path.suffix}"
+
+
+def _staged(path):
+    return f"{executors.INPUT_MOUNT}/{_key(path)}"
+
+
+async def _collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+async def test_auto_uses_the_deployed_worker(fake_modal, media,
+                                             monkeypatch):
+    monkeypatch.setattr(executors, "MODAL_MIN_CONTAINERS", "1")
+    executor = get_executor.__wrapped__("auto")
+    executor.warm_up()
+    assert await executor.transcribe_to_str(media) == \
+        "deployed:transcribe_str"
+    assert await _collect(executor.convert_to_mp4(media)) == \
+        [b"deployed:convert_to_mp4"]
+    # Looked up once, at warm-up
+    assert fake_modal.lookups == [(executors.MODAL_APP_NAME,
+                                   executors.WORKER_CLASS)]
+    assert fake_modal.worker.autoscaler == 1
+    assert fake_modal.runs == 0
+    # Put again on reuse, renewing the file's mtime against pruning
+    assert fake_modal.uploads == [f"/{_key(media)}"] * 2
+    assert list(fake_modal.volume) == [f"/{_key(media)}"]
+    assert [kwargs for *_, kwargs in fake_modal.calls] == \
+        [{"media_fp": _staged(media)}, {"video_fp": _staged(media)}]
+
+
+async def test_auto_falls_back_to_ephemeral(fake_modal, media,
+                                            monkeypatch):
+    usage = []
+    monkeypatch.setattr(GptModel, "usage_listeners", [usage.append])
+    fake_modal.deployed = False
+    executor = get_executor.__wrapped__("auto")
+    assert isinstance(executor.fallback, ModalEphemeralExecutor)
+    assert await executor.transcribe_to_srt(media, "key") == \
+        "ephemeral:transcribe_srt"
+    assert await _collect(executor.convert_to_mp4(media)) == \
+        [b"ephemeral:convert_to_mp4"]
+    # Not looked up again once known to be missing
+    assert len(fake_modal.lookups) == 1
+    assert fake_modal.runs == 2
+    assert fake_modal.calls == [
+        ("ephemeral", "transcribe_srt",
+         {"OPENAI_API_KEY": "key", "media_fp": _staged(media)}),
+        ("ephemeral", "convert_to_mp4", {"video_fp": _staged(media)})]
+    assert list(fake_modal.volume) == [f"/{_key(media)}"]
+    # The worker's GPT fix-up reaches this process's ledger
+    assert usage == [USAGE]
+
+
+async def test_deployed_without_fallback_raises(fake_modal, media):
+    fake_modal.deployed = False
+    executor = get_executor.__wrapped__("deployed")
+    assert executor.fallback is None
+    with pytest.raises(NotFoundError):
+        await executor.transcribe_to_str(media)
+
+
+def test_modes():
+    assert isinstance(get_executor.__wrapped__("local"), LocalExecutor)
+    assert isinstance(get_executor.__wrapped__("ephemeral"),
+                      ModalEphemeralExecutor)
+    assert isinstance(get_executor.__wrapped__("deployed"),
+                      ModalDeployedExecutor)
+    with pytest.raises(ValueError):
+        get_executor.__wrapped__("gpu")
+
+
+def test_executors_are_shared_per_mode():
+    assert get_executor("local") is get_executor("local")
+    assert get_executor("local") is not get_executor("ephemeral")
+
+
+async def test_local_runs_jobs_in_process(media):
+    class Jobs:
+        def transcribe_str(self, media_fp):
+            return {"path": media_fp}
+
+        def convert_to_mp4(self, video_fp):
+            with open(video_fp, "rb") as f:
+                yield from iter(lambda: f.read(2), b"")
+
+    executor = LocalExecutor(jobs=Jobs())
+    assert await executor.transcribe_to_str(media) == {"path": str(media)}
+    assert await _collect(executor.convert_to_mp4(media)) == \
+        [b"vi", b"de", b"o"]
@@ -0,0 +1,140 @@
+import datetime
+import threading
+import pytest
+from fastapi import HTTPException
+import utils.gpt_usage_utils as usage_module
+from db.migrations import run_migrations
+from db.Tables import gpt_budgets, gpt_usage, profiles
+from modal_processing.jobs import captured_usage
+from processing.gpt_wrapper import GptModel
+from profile_manager import current_profile_id
+from utils.gpt_usage_utils import (GptUsageLedger, budget_status,
+                                   enforce_gpt_budget)
+
+pytestmark = pytest.mark.anyio
+
+WINDOW = 3600
+
+
+@pytest.fixture
+async def ledger(database, monkeypatch):
+    """
+    A fresh ledger on the test database, with a $1 per hour default
+    budget.
+    """
+    await run_migrations(database)
+    for profile_id in ("p1", "p2"):
+        await database.execute(profiles.insert().values(id=profile_id,
+                                                        name=profile_id))
+
+    async def get_db():
+        return database
+
+    monkeypatch.setattr(usage_module, "get_db", get_db)
+    monkeypatch.setattr(usage_module, "execute_write", database.execute)
+    monkeypatch.setattr(usage_module, "GPT_BUDGET_USD", 1.0)
+    monkeypatch.setattr(usage_module, "GPT_BUDGET_WINDOW", WINDOW)
+    ledger = GptUsageLedger()
+    monkeypatch.setattr(usage_module, "gpt_usage_ledger", ledger)
+    return ledger
+
+
+def _record(ledger, profile_id, cost):
+    token = current_profile_id.set(profile_id)
+    try:
+        ledger.record({"model": "gpt-4.1", "prompt_tokens": 10,
+                       "completion_tokens": 5, "cached_tokens": 0,
+                       "cost_usd": cost, "latency_ms": 100.0,
+                       "finish_reason": "stop"})
+    finally:
+        current_profile_id.reset(token)
+
+
+async def _spent_at(database, profile_id, cost, seconds_ago):
+    await database.execute(gpt_usage.insert().values(
+        id=f"{profile_id}-{seconds_ago}", profile_id=profile_id,
+        route="/gpt/breakdown", model="gpt-4.1", prompt_tokens=10,
+        completion_tokens=5, cached_tokens=0, cost_usd=cost,
+        latency_ms=100.0, finish_reason="stop",
+        created_at=datetime.datetime.now() - datetime.timedelta(
+            seconds=seconds_ago)))
+
+
+async def test_pending_records_count_before_flush(ledger, database):
+    _record(ledger, "p1", 0.25)
+    _record(ledger, "p2", 0.5)
+    status = await budget_status("p1")
+    assert status["spent_usd"] == 0.25
+    assert status["remaining_usd"] == 0.75
+    assert status["retry_after_seconds"] is None
+    assert await ledger.flush() == 2
+    rows = await database.fetch_all(gpt_usage.select())
+    assert {(r.profile_id, r.route) for r in rows} == \
+        {("p1", "background"), ("p2", "background")}
+    assert (await budget_status("p1"))["spent_usd"] == 0.25
+
+
+async def test_exhausted_budget_is_rejected_until_window_frees(
+        ledger, database):
+    # The oldest request in the window leaves it in ~10 minutes
+    await _spent_at(database, "p1", 0.6, seconds_ago=WINDOW - 600)
+    await _spent_at(database, "p1", 0.3, seconds_ago=60)
+    # Outside the window, not counted
+    await _spent_at(database, "p1", 5.0, seconds_ago=WINDOW + 60)
+    assert await enforce_gpt_budget("p1") == "p1"
+    _record(ledger, "p1", 0.2)
+    with pytest.raises(HTTPException) as exc:
+        await enforce_gpt_budget("p1")
+    assert exc.value.status_code == 429
+    retry_after = int(exc.value.headers["Retry-After"])
+    assert 590 <= retry_after <= 600
+    # Other profiles are unaffected
+    assert await enforce_gpt_budget("p2") == "p2"
+
+
+async def test_profile_override_replaces_default(ledger, database):
+    _record(ledger, "p1", 2.0)
+    with pytest.raises(HTTPException):
+        await enforce_gpt_budget("p1")
+    await database.execute(gpt_budgets.insert().values(
+        profile_id="p1", budget_usd=5.0, window_seconds=60))
+    status = await budget_status("p1")
+    assert (status["budget_usd"], status["window_seconds"]) == (5.0, 60)
+    assert status["remaining_usd"] == 3.0
+    assert await enforce_gpt_budget("p1") == "p1"
+
+
+async def test_unlimited_budget_skips_the_ledger(ledger, database,
+                                                 monkeypatch):
+    await database.execute(gpt_budgets.insert().values(
+        profile_id="p1", budget_usd=0.0, window_seconds=WINDOW))
+    _record(ledger, "p1", 50.0)
+
+    async def spent(*args):
+        raise AssertionError("ledger queried for an unlimited budget")
+
+    monkeypatch.setattr(ledger, "spent", spent)
+    assert await enforce_gpt_budget("p1") == "p1"
+    # Requests without a profile are never limited
+    assert await enforce_gpt_budget(None) is None
+
+
+async def test_failed_flush_keeps_records(ledger, monkeypatch):
+    async def failing(query):
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(usage_module, "execute_write", failing)
+    _record(ledger, "p1", 0.1)
+    assert await ledger.flush() == 0
+    assert ledger.pending_cost("p1", datetime.datetime.min) == 0.1
+
+
+def test_worker_usage_is_captured_per_thread():
+    with captured_usage() as records:
+        GptModel.notify_usage("gpt-4.1", 10.0, "stop", cost_usd=0.1)
+        other = threading.Thread(target=GptModel.notify_usage,
+                                 args=("gpt-4.1", 10.0, "stop"))
+        other.start()
+        other.join()
+    GptModel.notify_usage("gpt-4.1", 10.0, "stop")
+    assert [r["cost_usd"] for r in records] == [0.1]
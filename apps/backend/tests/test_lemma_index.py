@@ -0,0 +1,126 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+import processing.lemma_index as lemma_module
+from db.migrations import run_migrations
+from db.Tables import clips, profile_transcripts, profiles
+from processing.lemma_index import LemmaIndexService
+from processing.text_processing import TokenizerService, shared_tokenizer
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeTokenizer:
+    """
+    Whitespace tokenizer; `surface:lemma` sets the lemma, `、` is
+    punctuation.
+    """
+    def tokenize(self, text):
+        tokens = []
+        for word in text.split():
+            surface, _, lemma = word.partition(":")
+            tokens.append({"surface": surface,
+                           "lemma": lemma or surface,
+                           "pos": "補助記号" if surface == "、" else "名詞"})
+        return tokens
+
+
+@pytest.fixture
+async def index(database, monkeypatch):
+    await run_migrations(database)
+    await database.execute(profiles.insert().values(id="p1", name="p1"))
+
+    async def get_db():
+        return database
+
+    monkeypatch.setattr(lemma_module, "get_db", get_db)
+    monkeypatch.setattr(lemma_module, "execute_write", database.execute)
+    return LemmaIndexService(tokenizer=FakeTokenizer())
+
+
+def test_count_lemmas_skips_punctuation():
+    service = LemmaIndexService(tokenizer=FakeTokenizer())
+    counts = service.count_lemmas("食べた:食べる 、 猫\n\n食べ:食べる")
+    assert counts == {"食べる": 2, "猫": 1}
+
+
+class ExclusiveTagger:
+    """
+    fugashi.Tagger stand-in recording the most callers it had at once.
+    """
+    def __init__(self):
+        self.active = self.most = 0
+
+    def __call__(self, sentence):
+        self.active += 1
+        self.most = max(self.most, self.active)
+        time.sleep(0.01)
+        words = [SimpleNamespace(surface=c, feature=SimpleNamespace(
+            lemma=c, kana=c, pos1="名詞")) for c in sentence]
+        self.active -= 1
+        return words
+
+
+async def test_tokenize_is_serialized_across_threads():
+    tokenizer = TokenizerService()
+    tokenizer._tagger = ExclusiveTagger()
+    service = LemmaIndexService(tokenizer=tokenizer)
+    counts = await asyncio.gather(*(asyncio.to_thread(
+        service.count_lemmas, "猫犬") for _ in range(8)))
+    assert all(c == {"猫": 1, "犬": 1} for c in counts)
+    assert tokenizer._tagger.most == 1
+
+
+def test_tokenizer_is_shared():
+    assert LemmaIndexService().tokenizer is shared_tokenizer()
+
+
+def test_srt_text_drops_timings():
+    content = ("1\n00:00:01,000 --> 00:00:02,000\n猫\n\n"
+               "2\n00:00:03,000 --> 00:00:04,000\n犬\n")
+    assert LemmaIndexService.srt_text(content) == "猫\n犬"
+
+
+async def test_index_and_query(index):
+    assert await index.index("p1", "clip", "c1", "猫 猫 犬") == 2
+    await index.index("p1", "transcript", "t1", "猫 鳥")
+    occurrences = await index.occurrences("p1", "猫")
+    assert [(o["source_type"], o["source_id"], o["occurrences"])
+            for o in occurrences] == [("clip", "c1", 2),
+                                      ("transcript", "t1", 1)]
+    frequencies = await index.frequencies("p1")
+    assert frequencies[0] == {"lemma": "猫", "occurrences": 3,
+                              "sources": 2}
+    assert {f["lemma"] for f in frequencies} == {"猫", "犬", "鳥"}
+    clip_only = await index.frequencies("p1", source_type="clip")
+    assert {f["lemma"] for f in clip_only} == {"猫", "犬"}
+
+
+async def test_reindex_replaces_and_remove_deletes(index):
+    await index.index("p1", "clip", "c1", "猫 犬")
+    await index.index("p1", "clip", "c1", "鳥")
+    assert await index.occurrences("p1", "猫") == []
+    assert len(await index.occurrences("p1", "鳥")) == 1
+    await index.remove("clip", "c1")
+    assert await index.frequencies("p1") == []
+
+
+async def test_unknown_source_type(index):
+    with pytest.raises(ValueError):
+        await index.index("p1", "video", "v1", "猫")
+
+
+async def test_rebuild(index, database):
+    await database.execute(clips.insert().values(
+        id="c1", profile_id="p1", clip_start_time=0.0, clip_end_time=1.0,
+        gpt_breakdown_response={"sentence": "猫 犬"},
+        video_clip_path="profiles/p1/clips/c1.mp4"))
+    await database.execute(profile_transcripts.insert().values(
+        id="t1", profile_id="p1", transcript="猫"))
+    await index.index("p1", "clip", "stale", "鳥")
+    srt_content = "1\n00:00:01,000 --> 00:00:02,000\n猫\n"
+    assert await index.rebuild("p1", {"f1": srt_content}) == 3
+    frequencies = {f["lemma"]: f["occurrences"]
+                   for f in await index.frequencies("p1")}
+    assert frequencies == {"猫": 3, "犬": 1}
@@ -0,0 +1,155 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+import utils.media_utils as media_utils
+from utils.media_utils import (IMMUTABLE_CACHE_CONTROL, ZEROCOPY_EXTENSION,
+                               MediaFileResponse, MediaFiles)
+
+pytestmark = pytest.mark.anyio
+
+CLIP = "/media/profiles/p1/clip.webm"
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    (tmp_path / "profiles" / "p1").mkdir(parents=True)
+    (tmp_path / "profiles" / "p1" / "clip.webm").write_bytes(DATA)
+    (tmp_path / "temp").mkdir()
+    (tmp_path / "temp" / "export.apkg").write_bytes(b"deck")
+    # Small reads, so responses span several body messages
+    monkeypatch.setattr(media_utils, "FIRST_CHUNK_SIZE", 100)
+    monkeypatch.setattr(MediaFileResponse, "chunk_size", 300)
+    return tmp_path
+
+
+@pytest.fixture
+def client(root):
+    app = Starlette(routes=[Mount("/media", MediaFiles(directory=root))])
+    return TestClient(app)
+
+
+def test_full_file(client):
+    response = client.get(CLIP)
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["content-length"] == str(len(DATA))
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    response = client.get("/media/temp/export.apkg")
+    assert response.content == b"deck"
+    assert response.headers["cache-control"] == "no-cache"
+
+
+@pytest.mark.parametrize("byte_range, start, end", [
+    ("bytes=10-509", 10, 510),
+    ("bytes=1000-", 1000, 1024),
+    # Suffix range: the last 300 bytes
+    ("bytes=-300", 724, 1024),
+    # Clamped to the file size
+    ("bytes=1020-5000", 1020, 1024),
+])
+def test_single_range(client, byte_range, start, end):
+    response = client.get(CLIP, headers={"Range": byte_range})
+    assert response.status_code == 206
+    assert response.content == DATA[start:end]
+    assert response.headers["content-range"] == \
+        f"bytes {start}-{end - 1}/{len(DATA)}"
+    assert response.headers["content-length"] == str(end - start)
+
+
+def test_multiple_ranges(client):
+    response = client.get(CLIP, headers={"Range": "bytes=0-1,10-11"})
+    assert response.status_code == 206
+    assert response.headers["content-range"].startswith(
+        "multipart/byteranges; boundary=")
+    assert DATA[0:2] in response.content and DATA[10:12] in response.content
+
+
+def test_unsatisfiable_range(client):
+    response = client.get(CLIP, headers={"Range": "bytes=2000-3000"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"*/{len(DATA)}"
+
+
+def test_if_none_match(client):
+    etag = client.get(CLIP).headers["etag"]
+    response = client.get(CLIP, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    response = client.get(CLIP, headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_range(client):
+    etag = client.get(CLIP).headers["etag"]
+    response = client.get(CLIP, headers={"Range": "bytes=0-9",
+                                         "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == DATA[:10]
+    # The file changed since: the whole file instead
+    response = client.get(CLIP, headers={"Range": "bytes=0-9",
+                                         "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_head(client):
+    response = client.head(CLIP)
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["content-length"] == str(len(DATA))
+    response = client.head(CLIP, headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == b""
+    assert response.headers["content-range"] == f"bytes 0-9/{len(DATA)}"
+
+
+async def _call(root, headers, extensions):
+    """
+    Serve the clip to a raw ASGI server with `extensions`, returning
+    the messages sent.
+    """
+    scope = {"type": "http", "method": "GET", "path": CLIP,
+             "root_path": "", "query_string": b"",
+             "headers": [(k.lower().encode(), v.encode())
+                         for k, v in headers.items()],
+             "extensions": extensions}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == ZEROCOPY_EXTENSION:
+            file = message.pop("file")
+            message["name"] = file.name
+            message["closed"] = file.closed
+        messages.append(message)
+
+    response = MediaFileResponse(root / "profiles" / "p1" / "clip.webm")
+    await response(scope, receive, send)
+    return messages
+
+
+async def test_zerocopy_hands_over_the_file(root):
+    start, *body = await _call(root, {"Range": "bytes=10-19"},
+                               {ZEROCOPY_EXTENSION: {}})
+    assert start["status"] == 206
+    assert body == [{"type": ZEROCOPY_EXTENSION,
+                     "name": str(root / "profiles" / "p1" / "clip.webm"),
+                     "closed": False, "offset": 10, "count": 10,
+                     "more_body": False}]
+    start, *body = await _call(root, {}, {ZEROCOPY_EXTENSION: {}})
+    assert (body[0]["offset"], body[0]["count"]) == (0, len(DATA))
+
+
+async def test_chunks_grow_after_the_first(root):
+    start, *body = await _call(root, {}, {})
+    assert start["status"] == 200
+    assert [len(m["body"]) for m in body] == [100, 300, 300, 300, 24]
+    assert [m["more_body"] for m in body] == [True] * 4 + [False]
+    assert b"".join(m["body"] for m in body) == DATA
@@ -0,0 +1,56 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import routers.media_router as media_module
+from routers.media_router import media_router
+
+CLIP = "/media/profiles/p1/clips/a b.webm"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    clip_dir = tmp_path / "media_files" / "profiles" / "p1" / "clips"
+    clip_dir.mkdir(parents=True)
+    (clip_dir / "a b.webm").write_bytes(b"clip")
+    monkeypatch.chdir(tmp_path)
+
+    async def profile_known(profile_id):
+        return profile_id in {"p1", "p2"}
+
+    monkeypatch.setattr(media_module, "profile_known", profile_known)
+    app = FastAPI()
+    app.include_router(media_router)
+    return TestClient(app)
+
+
+def test_owner_gets_accel_redirect(client):
+    for response in (client.get(CLIP, headers={"X-Profile-ID": "p1"}),
+                     client.get(CLIP, params={"profile_id": "p1"}),
+                     client.head(CLIP, params={"profile_id": "p1"})):
+        assert response.status_code == 200
+        assert response.headers["x-accel-redirect"] == \
+            "/protected_media/profiles/p1/clips/a%20b.webm"
+        # Never stored by shared caches, keyed only on the path
+        assert response.headers["cache-control"] == \
+            "private, max-age=31536000, immutable"
+
+
+def test_anonymous_request_is_rejected(client):
+    assert client.get(CLIP).status_code == 401
+    # Before revealing whether the file or profile exists
+    assert client.get("/media/profiles/p9/clips/x.webm").status_code == 401
+
+
+def test_other_profile_is_forbidden(client):
+    response = client.get(CLIP, headers={"X-Profile-ID": "p2"})
+    assert response.status_code == 403
+    assert "x-accel-redirect" not in response.headers
+
+
+def test_traversal_is_authorized_on_the_normalized_path(client):
+    response = client.get("/media/profiles/p2/../p1/clips/a b.webm",
+                          headers={"X-Profile-ID": "p2"})
+    assert response.status_code == 403
+    response = client.get("/media/profiles/p1/%2e%2e/%2e%2e/%2e%2e/x",
+                          headers={"X-Profile-ID": "p1"})
+    assert response.status_code == 404
@@ -0,0 +1,105 @@
+import os
+import pytest
+import processing.Processor as processor_module
+from modal_processing.executors import LocalExecutor
+from processing.gpt_wrapper import GptModel
+from processing.Processor import Processor
+
+pytestmark = pytest.mark.anyio
+
+
+class StubAudioTools:
+    def __init__(self, working_dir):
+        pass
+
+
+class StubJobs:
+    """
+    WorkerJobs stand-in: transcripts name the input it was given and the
+    "converted" video is the input, upper-cased, in 2-byte chunks.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def recipe(self, output):
+        self.calls.append(("recipe", output))
+        return f"{output}-cuda-large-v3-float16"
+
+    def transcribe_srt(self, OPENAI_API_KEY, media_fp):
+        self.calls.append(("transcribe_srt", OPENAI_API_KEY, media_fp))
+        # In process, the GPT fix-up notifies the listeners itself
+        GptModel.notify_usage("gpt-4.1", 100.0, "stop", cost_usd=0.01)
+        return {"srt": f"1\n00:00:00,000 --> 00:00:01,000\n{media_fp}\n",
+                "gpt_usage": [{"model": "gpt-4.1", "latency_ms": 100.0,
+                               "finish_reason": "stop", "cost_usd": 0.01}]}
+
+    def transcribe_str(self, media_fp):
+        self.calls.append(("transcribe_str", media_fp))
+        return {"text": media_fp}
+
+    def convert_to_mp4(self, video_fp):
+        self.calls.append(("convert_to_mp4", video_fp))
+        if video_fp.endswith(".bad"):
+            raise RuntimeError("Video conversion failed")
+        with open(video_fp, "rb") as f:
+            while chunk := f.read(2):
+                yield chunk.upper()
+
+
+@pytest.fixture
+def jobs():
+    return StubJobs()
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch, jobs):
+    # AudioTools needs FFmpeg, which the jobs here never call
+    monkeypatch.setattr(processor_module, "AudioTools", StubAudioTools)
+    return Processor(save_path=tmp_path, use_modal=True,
+                     executor=LocalExecutor(jobs=jobs),
+                     MODAL_TOKEN_ID="id", MODAL_TOKEN_SECRET="secret")
+
+
+@pytest.fixture
+def media(tmp_path):
+    path = tmp_path / "clip.webm"
+    path.write_bytes(b"video")
+    return path
+
+
+async def test_transcribe_to_srt(processor, jobs, media, monkeypatch):
+    usage = []
+    monkeypatch.setattr(GptModel, "usage_listeners", [usage.append])
+    srt = await processor.modal_transcribe_to_srt(media)
+    # Counted once, not passed on again
+    assert [u["cost_usd"] for u in usage] == [0.01]
+    assert srt.endswith(f"{media}\n")
+    assert jobs.calls == [("transcribe_srt", os.environ["OPENAI_API_KEY"],
+                           str(media))]
+
+
+async def test_transcribe_to_str(processor, jobs, media):
+    assert await processor.modal_transcribe_to_str(media) == \
+        {"text": str(media)}
+
+
+async def test_convert_to_mp4_streams_to_outpath(processor, media, tmp_path):
+    out = await processor.modal_convert_to_mp4(media, tmp_path / "out.mp4")
+    assert out == tmp_path / "out.mp4"
+    assert out.read_bytes() == b"VIDEO"
+
+
+async def test_failed_conversion_returns_none(processor, tmp_path):
+    bad = tmp_path / "clip.bad"
+    bad.write_bytes(b"video")
+    assert await processor.modal_convert_to_mp4(
+        bad, tmp_path / "out.mp4") is None
+
+
+async def test_recipe_is_asked_once(processor, jobs):
+    for _ in range(2):
+        assert await processor.modal_recipe("srt") == \
+            "srt-cuda-large-v3-float16"
+    assert await processor.modal_recipe("transcript") == \
+        "transcript-cuda-large-v3-float16"
+    assert jobs.calls == [("recipe", "srt"), ("recipe", "transcript")]
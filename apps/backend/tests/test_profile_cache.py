@@ -0,0 +1,85 @@
+import pytest
+import profile_manager
+from profile_manager import ProfileCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(profile_manager, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(profile_manager, "record_cache",
+                        lambda cache, hit: recorded.append((cache, hit)))
+    return recorded
+
+
+def test_entries_expire_after_ttl(clock, lookups):
+    cache = ProfileCache(ttl=10, max_size=10)
+    cache.add("p1")
+    clock.now += 9
+    assert "p1" in cache
+    clock.now += 2
+    assert "p1" not in cache
+    # Exported with the other caches' hit ratios
+    assert lookups == [("profile", True), ("profile", False)]
+
+
+def test_add_refreshes_ttl(clock):
+    cache = ProfileCache(ttl=10, max_size=10)
+    cache.add("p1")
+    clock.now += 8
+    cache.add("p1")
+    clock.now += 8
+    assert "p1" in cache
+
+
+def test_evicts_least_recently_added(clock):
+    cache = ProfileCache(ttl=10, max_size=2)
+    cache.add("p1")
+    cache.add("p2")
+    cache.add("p1")
+    cache.add("p3")
+    assert "p2" not in cache
+    assert "p1" in cache
+    assert "p3" in cache
+
+
+def test_discard_and_clear(clock):
+    cache = ProfileCache(ttl=10, max_size=10)
+    cache.add("p1")
+    cache.add("p2")
+    cache.discard("p1")
+    assert "p1" not in cache
+    cache.clear()
+    assert "p2" not in cache
+
+
+@pytest.mark.anyio
+async def test_known_profile_skips_database(monkeypatch, clock):
+    writes = []
+
+    async def execute_write(query):
+        writes.append(query)
+
+    monkeypatch.setattr(profile_manager, "profile_cache",
+                        ProfileCache(ttl=10, max_size=10))
+    monkeypatch.setattr(profile_manager, "execute_write", execute_write)
+    for _ in range(3):
+        assert await profile_manager._ensure_profile("p1")
+    assert len(writes) == 1
+    clock.now += 11
+    assert await profile_manager._ensure_profile("p1")
+    assert len(writes) == 2
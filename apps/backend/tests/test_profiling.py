@@ -0,0 +1,45 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils.profiling_utils import StackSampler
+
+
+def get(stop: threading.Event) -> None:
+    """
+    A busy function sharing its name with an idle one (Queue.get).
+    """
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def threads():
+    stop = threading.Event()
+    busy = threading.Thread(target=get, args=(stop,), name="busy")
+    idle = threading.Thread(target=stop.wait, name="idle")
+    pool = ThreadPoolExecutor(1, thread_name_prefix="pool")
+    pool.submit(lambda: None).result()
+    busy.start()
+    idle.start()
+    yield
+    stop.set()
+    busy.join()
+    idle.join()
+    pool.shutdown()
+
+
+def _threads(sampler):
+    return {stack.split(";")[0] for stack in sampler.counts}
+
+
+def test_idle_threads_are_skipped(threads):
+    sampler = StackSampler(interval=0.001).run(0.2)
+    assert sampler.samples > 0
+    assert "busy" in _threads(sampler)
+    assert "idle" not in _threads(sampler)
+    assert not any(name.startswith("pool") for name in _threads(sampler))
+
+
+def test_idle_threads_are_kept_on_request(threads):
+    sampler = StackSampler(interval=0.001, include_idle=True).run(0.2)
+    assert {"busy", "idle", "pool_0"} <= _threads(sampler)
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from utils.readiness_utils import Readiness
+
+pytestmark = pytest.mark.anyio
+
+
+def _flaky(failures: int):
+    calls = []
+
+    def warm_up():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise TimeoutError("model download timed out")
+    return warm_up, calls
+
+
+async def _wait_ready(readiness: Readiness, timeout: float = 2.0) -> None:
+    async def poll():
+        while not readiness.ready:
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def test_failed_warm_up_is_retried_until_ready():
+    readiness = Readiness(enabled=True, retry_delay=0.01,
+                          max_retry_delay=0.02)
+    warm_up, calls = _flaky(failures=2)
+    readiness.register("whisper", warm_up)
+    readiness.register("dict", lambda: None)
+    readiness.start()
+    try:
+        await _wait_ready(readiness)
+    finally:
+        await readiness.stop()
+    component = readiness.status()["components"]["whisper"]
+    assert len(calls) == 3
+    assert component["state"] == "ready"
+    assert component["attempts"] == 3
+    assert component["error"] is None
+
+
+async def test_not_ready_while_failing():
+    readiness = Readiness(enabled=True, retry_delay=60)
+    warm_up, _ = _flaky(failures=1)
+    readiness.register("modal", warm_up)
+    readiness.start()
+    try:
+        for _ in range(100):
+            if readiness.status()["components"]["modal"]["error"]:
+                break
+            await asyncio.sleep(0.005)
+        component = readiness.status()["components"]["modal"]
+        assert component["state"] == "failed"
+        assert "timed out" in component["error"]
+        assert not readiness.ready
+    finally:
+        # Cancels the pending retry
+        await readiness.stop()
+
+
+async def test_disabled_warm_up_is_ready_at_once():
+    readiness = Readiness(enabled=False)
+    readiness.register("whisper", lambda: None)
+    assert not readiness.ready
+    readiness.start()
+    assert readiness.ready
+    assert readiness.status()["components"]["whisper"]["state"] == \
+        "skipped"
@@ -0,0 +1,118 @@
+import pytest
+import utils.storage_utils as storage_utils
+from db.migrations import run_migrations
+from db.Tables import profile_files, profiles
+from utils.storage_utils import StorageJanitor
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def media(tmp_path, database, monkeypatch):
+    """
+    A media tree with one referenced file per profile.
+    """
+    await run_migrations(database)
+
+    async def get_db():
+        return database
+
+    monkeypatch.setattr(storage_utils, "get_db", get_db)
+    monkeypatch.setattr(storage_utils, "execute_write", database.execute)
+    # Everything on disk counts as old enough to reconcile
+    monkeypatch.setattr(storage_utils, "ORPHAN_GRACE", -60)
+    base = tmp_path / "media_files"
+    for profile_id in ("p1", "p2"):
+        folder = base / "profiles" / profile_id / "audios"
+        folder.mkdir(parents=True)
+        (folder / "kept.wav").write_bytes(b"audio")
+    return base
+
+
+async def _add_rows(database):
+    for profile_id in ("p1", "p2"):
+        await database.execute(profiles.insert().values(id=profile_id,
+                                                        name=profile_id))
+        await database.execute(profile_files.insert().values(
+            id=f"{profile_id}-kept", profile_id=profile_id,
+            file_name="kept.wav", file_type="audio_source",
+            file_path=f"profiles/{profile_id}/audios/kept.wav"))
+
+
+def _orphan(media):
+    path = media / "profiles" / "p1" / "audios" / "orphan.wav"
+    path.write_bytes(b"orphan")
+    return path
+
+
+async def test_report_mode_deletes_nothing(media, database):
+    await _add_rows(database)
+    orphan = _orphan(media)
+    result = await StorageJanitor(media).reconcile()
+    assert result["orphan_files"] == 1
+    assert result["orphan_bytes"] == len(b"orphan")
+    assert result["removed_files"] == 0
+    assert result["held"].startswith("report mode")
+    assert orphan.exists()
+
+
+async def test_empty_database_never_wipes_media(media, database):
+    janitor = StorageJanitor(media, reconcile_mode="delete")
+    result = await janitor.reconcile()
+    assert result["orphan_files"] == 2
+    assert result["held"] == "database has no profiles"
+    assert len(list(media.glob("profiles/*/audios/*"))) == 2
+
+
+async def test_implausible_orphan_ratio_is_held(media, database):
+    await _add_rows(database)
+    for i in range(3):
+        (media / "profiles" / "p2" / "audios" / f"{i}.wav").write_bytes(b"")
+    result = await StorageJanitor(media, reconcile_mode="delete",
+                                  max_orphan_ratio=0.5).reconcile()
+    assert result["orphan_files"] == 3
+    assert "unreferenced" in result["held"]
+    assert len(list(media.glob("profiles/p2/audios/*"))) == 4
+
+
+async def test_missing_media_volume_keeps_records(media, database):
+    await _add_rows(database)
+    for path in media.glob("profiles/*/audios/*"):
+        path.unlink()
+    result = await StorageJanitor(media,
+                                  reconcile_mode="delete").reconcile()
+    assert result["missing_files"] == 2
+    assert "have no file" in result["held"]
+    assert len(await database.fetch_all(profile_files.select())) == 2
+
+
+async def test_delete_mode_reconciles(media, database):
+    await _add_rows(database)
+    orphan = _orphan(media)
+    (media / "profiles" / "p2" / "audios" / "kept.wav").unlink()
+    result = await StorageJanitor(media,
+                                  reconcile_mode="delete").reconcile()
+    assert result["held"] is None
+    assert (result["removed_files"], result["dropped_rows"]) == (1, 1)
+    assert not orphan.exists()
+    rows = await database.fetch_all(profile_files.select())
+    assert [r.id for r in rows] == ["p1-kept"]
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        StorageJanitor(tmp_path, reconcile_mode="yes")
+
+
+async def test_backfill_hashes_deduplicates_existing_files(media, database):
+    await _add_rows(database)
+    janitor = StorageJanitor(media)
+    assert await janitor.backfill_hashes(limit=1) == 1
+    assert await janitor.backfill_hashes() == 1
+    assert await janitor.backfill_hashes() == 0
+    rows = await database.fetch_all(profile_files.select())
+    digests = {r.content_hash for r in rows}
+    assert len(digests) == 1
+    blob = janitor.blobs.path_for(digests.pop())
+    # Both profiles' identical files now share the blob
+    assert blob.stat().st_nlink == 3
@@ -0,0 +1,65 @@
+import threading
+import pytest
+import utils.system_info_utils as system_info
+from routers.health_router import gpu_check
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def slow_gpu(monkeypatch):
+    """
+    A GPU probe that blocks until `release` is set, counting `calls`.
+    """
+    state = {"calls": 0, "started": threading.Event(),
+             "release": threading.Event()}
+
+    def gpu_available():
+        state["calls"] += 1
+        state["started"].set()
+        assert state["release"].wait(5)
+        return {"available": True, "name": "Fake GPU", "count": 1}
+
+    monkeypatch.setattr(system_info, "gpu_available", gpu_available)
+    system_info._probe_hardware.cache_clear()
+    yield state
+    state["release"].set()
+    system_info._probe_hardware.cache_clear()
+
+
+def _probe_in_background():
+    thread = threading.Thread(target=system_info.hardware_snapshot)
+    thread.start()
+    return thread
+
+
+def test_concurrent_first_calls_probe_once(slow_gpu):
+    threads = [_probe_in_background() for _ in range(3)]
+    assert slow_gpu["started"].wait(5)
+    assert system_info.hardware_probing()
+    slow_gpu["release"].set()
+    for thread in threads:
+        thread.join(5)
+    assert slow_gpu["calls"] == 1
+    assert system_info.hardware_probed()
+    assert not system_info.hardware_probing()
+
+
+async def test_system_reports_probing_until_probed(slow_gpu):
+    warm_up = _probe_in_background()
+    assert slow_gpu["started"].wait(5)
+    info = await gpu_check()
+    assert info["hardware"] == "probing"
+    assert "ready" in info["dynamic"]
+    slow_gpu["release"].set()
+    warm_up.join(5)
+    info = await gpu_check()
+    assert "hardware" not in info
+    assert info["gpu_name"] == "Fake GPU"
+    assert slow_gpu["calls"] == 1
+
+
+async def test_system_probes_without_warm_up(slow_gpu):
+    slow_gpu["release"].set()
+    assert (await gpu_check())["gpu_available"] is True
+    assert slow_gpu["calls"] == 1
@@ -0,0 +1,39 @@
+import os
+import pytest
+from benchmarks.bench_utils import (baseline_path, compare_baseline,
+                                    load_baseline)
+from benchmarks.text_processing import corpus, headline, run
+
+# Takes about a minute for 300 lines, so only run when asked to
+pytestmark = pytest.mark.skipif(
+    not os.getenv("RUN_BENCHMARKS"),
+    reason="set RUN_BENCHMARKS=1 to run the benchmarks")
+
+# Looser than the benchmark's default, shared CI runners are noisy
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", 0.25))
+REPEATS = int(os.getenv("BENCH_REPEATS", 3))
+
+
+def test_text_processing_has_not_regressed():
+    pytest.importorskip("fugashi")
+    pytest.importorskip("jamdict")
+    params, has_baseline = {}, baseline_path("text_processing").exists()
+    if has_baseline:
+        params = load_baseline("text_processing").get("params", {})
+        if params.get("corpus"):
+            pytest.skip("the baseline was not recorded on the synthetic "
+                        "corpus")
+    lines = params.get("lines", 300)
+    result = run(corpus(lines), REPEATS)
+    assert result["lines"] == lines
+    assert result["word_lookup"]["calls"] == lines
+    metrics = headline(result)
+    assert all(value > 0 for value in metrics.values()), metrics
+    if not has_baseline:
+        pytest.skip(f"no baseline at {baseline_path('text_processing')}, "
+                    f"record one with `python -m benchmarks."
+                    f"text_processing --lines {lines} --save-baseline`")
+    report = compare_baseline("text_processing", metrics, TOLERANCE)
+    assert report
+    regressed = {k: v for k, v in report.items() if v["regressed"]}
+    assert not regressed, regressed
@@ -0,0 +1,114 @@
+import pytest
+from processing import whisper_config
+from processing.whisper_wrapper import FWhisperWrapper
+
+
+@pytest.fixture
+def hardware(monkeypatch):
+    """
+    Fake host: `cuda` GPUs, usable `cores` and the compute types
+    ctranslate2 reports.
+    """
+    host = {"cuda": 0, "cores": 8,
+            "types": {"cpu": {"int8", "int8_float32", "float32"},
+                      "cuda": {"float16", "int8_float16", "int8",
+                               "float32"}}}
+    monkeypatch.setattr(whisper_config, "cuda_device_count",
+                        lambda: host["cuda"])
+    monkeypatch.setattr(whisper_config, "supported_compute_types",
+                        lambda device: host["types"].get(device, set()))
+    monkeypatch.setattr(whisper_config, "available_cores",
+                        lambda: host["cores"])
+    for name, value in {"WHISPER_MODEL": "auto", "WHISPER_DEVICE": "auto",
+                        "WHISPER_COMPUTE_TYPE": "auto",
+                        "WHISPER_CPU_THREADS": 0,
+                        "WHISPER_NUM_WORKERS": 0}.items():
+        monkeypatch.setattr(whisper_config, name, value)
+    return host
+
+
+def test_recipe_follows_the_configuration(hardware):
+    cpu = FWhisperWrapper()
+    assert cpu.recipe("transcript") == "transcript-cpu-small-int8"
+    assert cpu.recipe("srt") == "srt-cpu-small-int8-gpt-4.1"
+    hardware["cuda"] = 1
+    gpu = FWhisperWrapper(gpt_version="gpt-4.1-mini")
+    assert gpu.recipe("srt") == "srt-cuda-large-v3-float16-gpt-4.1-mini"
+
+
+def test_recipe_is_a_safe_folder_name(hardware):
+    wrapper = FWhisperWrapper(model_name="/models/my whisper")
+    assert wrapper.recipe("transcript") == \
+        "transcript-cpu-_models_my_whisper-int8"
+
+
+def test_auto_device_follows_cuda(hardware):
+    config = whisper_config.resolve_whisper_config()
+    assert (config["device"], config["compute_type"], config["model"]) == \
+        ("cpu", "int8", "small")
+    assert config["auto"] == ["device", "compute_type", "model",
+                              "num_workers", "cpu_threads"]
+    hardware["cuda"] = 2
+    config = whisper_config.resolve_whisper_config()
+    assert (config["device"], config["compute_type"], config["model"]) == \
+        ("cuda", "float16", "large-v3")
+    assert (config["num_workers"], config["cpu_threads"]) == (1, 0)
+    assert config["cuda_devices"] == 2
+
+
+def test_unsupported_compute_type_is_replaced(hardware):
+    config = whisper_config.resolve_whisper_config(compute_type="float16")
+    assert config["compute_type"] == "int8"
+    assert "compute_type" in config["auto"]
+    # Unless nothing is known about the device
+    hardware["types"] = {}
+    config = whisper_config.resolve_whisper_config(compute_type="float16")
+    assert (config["compute_type"], config["auto"].count("compute_type")) \
+        == ("float16", 0)
+    config = whisper_config.resolve_whisper_config()
+    assert config["compute_type"] == "default"
+
+
+@pytest.mark.parametrize("cores, workers, threads",
+                         [(1, 1, 1), (2, 1, 2), (8, 2, 4), (32, 4, 8)])
+def test_threads_follow_the_cores(hardware, cores, workers, threads):
+    hardware["cores"] = cores
+    config = whisper_config.resolve_whisper_config()
+    assert (config["num_workers"], config["cpu_threads"]) == \
+        (workers, threads)
+    assert config["available_cores"] == cores
+
+
+def test_environment_and_arguments(hardware, monkeypatch):
+    for name, value in {"WHISPER_MODEL": "medium", "WHISPER_DEVICE": "cpu",
+                        "WHISPER_COMPUTE_TYPE": "float32",
+                        "WHISPER_NUM_WORKERS": 4}.items():
+        monkeypatch.setattr(whisper_config, name, value)
+    hardware["cuda"] = 1
+    config = whisper_config.resolve_whisper_config()
+    assert (config["model"], config["device"], config["compute_type"],
+            config["num_workers"], config["cpu_threads"]) == \
+        ("medium", "cpu", "float32", 4, 2)
+    assert config["auto"] == ["cpu_threads"]
+    # Arguments win over the environment
+    config = whisper_config.resolve_whisper_config(
+        model="tiny", device="cuda", compute_type="int8_float16",
+        cpu_threads=3, num_workers=2)
+    assert (config["model"], config["device"], config["compute_type"],
+            config["num_workers"], config["cpu_threads"]) == \
+        ("tiny", "cuda", "int8_float16", 2, 3)
+    assert config["auto"] == []
+
+
+@pytest.mark.parametrize("cpu_max, cores",
+                         [("max 100000", 8), ("200000 100000", 2),
+                          ("50000 100000", 1), (None, 8)])
+def test_available_cores_honours_the_cgroup_quota(tmp_path, monkeypatch,
+                                                  cpu_max, cores):
+    path = tmp_path / "cpu.max"
+    if cpu_max:
+        path.write_text(f"{cpu_max}\n")
+    monkeypatch.setattr(whisper_config.os, "sched_getaffinity",
+                        lambda pid: set(range(8)), raising=False)
+    monkeypatch.setattr(whisper_config, "Path", lambda _: path)
+    assert whisper_config.available_cores() == cores
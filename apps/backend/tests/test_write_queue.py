@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, select, func
+from sqlalchemy.schema import CreateTable
+from db.write_queue import WriteQueue
+
+pytestmark = pytest.mark.anyio
+
+items = Table("items", MetaData(),
+              Column("id", Integer, primary_key=True, autoincrement=False),
+              Column("value", String, nullable=False))
+
+
+@pytest.fixture
+async def queue(database):
+    await database.execute(CreateTable(items))
+    write_queue = WriteQueue(database, max_batch_delay=0.05)
+    await write_queue.start()
+    try:
+        yield write_queue
+    finally:
+        await write_queue.stop()
+
+
+async def _count(database) -> int:
+    return await database.fetch_val(select(func.count()).select_from(items))
+
+
+async def test_concurrent_writes_all_commit(database, queue):
+    await asyncio.gather(*(queue.execute(items.insert().values(
+        id=i, value=str(i))) for i in range(500)))
+    assert await _count(database) == 500
+    assert queue.qsize() == 0
+
+
+async def test_failing_write_only_rolls_back_itself(database, queue):
+    await queue.execute(items.insert().values(id=1, value="first"))
+    # Batched together: the duplicate fails inside its own savepoint
+    results = await asyncio.gather(
+        queue.execute(items.insert().values(id=2, value="before")),
+        queue.execute(items.insert().values(id=1, value="duplicate")),
+        queue.execute(items.insert().values(id=3, value="after")),
+        return_exceptions=True)
+    assert not isinstance(results[0], Exception)
+    assert isinstance(results[1], Exception)
+    assert not isinstance(results[2], Exception)
+    rows = await database.fetch_all(items.select().order_by(items.c.id))
+    assert [(r.id, r.value) for r in rows] == [(1, "first"),
+                                               (2, "before"),
+                                               (3, "after")]
+
+
+async def test_stop_flushes_pending_writes(database, queue):
+    pending = [asyncio.create_task(queue.execute(items.insert().values(
+        id=i, value="pending"))) for i in range(50)]
+    await asyncio.sleep(0)
+    await queue.stop()
+    await asyncio.gather(*pending)
+    assert await _count(database) == 50
+    assert not queue.running
+
+
+async def test_executes_directly_when_not_started(database):
+    await database.execute(CreateTable(items))
+    await WriteQueue(database).execute(items.insert().values(id=1,
+                                                             value="x"))
+    assert await _count(database) == 1
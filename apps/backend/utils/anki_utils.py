@@ -1,11 +1,43 @@
-import genanki
 import hashlib
-from typing import List, Optional
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import copy_context
+from typing import (AsyncIterator, Callable, Dict, Iterable, Iterator, List,
+                    Optional, Tuple)
 from pathlib import Path
 import logging
+from utils.metrics_utils import record_cache
 
 logger = logging.getLogger(__name__)
 
+# Bytes read from a media file per zip write when streaming a package
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Compact clip renditions for decks (see ClipCompactor)
+ANKI_COMPACT_CODEC = os.getenv("ANKI_COMPACT_CODEC", "h264")
+ANKI_COMPACT_HEIGHT = int(os.getenv("ANKI_COMPACT_HEIGHT", "360"))
+ANKI_COMPACT_WORKERS = int(os.getenv("ANKI_COMPACT_WORKERS",
+                                     str(os.cpu_count() or 2)))
+VIDEO_MIME_TYPES = {".webm": "video/webm",
+                    ".mp4": "video/mp4",
+                    ".m4v": "video/mp4",
+                    ".mov": "video/quicktime",
+                    ".mkv": "video/x-matroska",
+                    ".ogv": "video/ogg"}
+
+
+def video_mime_type(filename: str) -> str:
+    return VIDEO_MIME_TYPES.get(Path(filename).suffix.lower(), "video/webm")
+
+
 VIDEO_CSS = """
 @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+JP:wght@400;\
     700&display=swap');
@@ -79,6 +111,33 @@ MODEL_FIELDS = [
 MODEL_NAME = "Mirumoji-Anki-V1"
 
 
+class _ChunkSink:
+    """
+    Write-only, unseekable file object collecting zip output so it can
+    be yielded chunk by chunk. zipfile falls back to data descriptors
+    when the target can't seek.
+    """
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
 class AnkiExporter:
     """
     Helper class to export saved passages as Anki Cards.
@@ -89,7 +148,8 @@ class AnkiExporter:
                  model_fields: Optional[List] = MODEL_FIELDS,
                  css: Optional[str] = VIDEO_CSS,
                  card_template: Optional[List] = CARD_TEMPLATE):
-
+        # Imported here so the API starts without loading genanki
+        import genanki
         self.model_name = model_name
         self.model_id = __class__.id_from_string(model_name)
         self.css = css
@@ -106,7 +166,7 @@ class AnkiExporter:
         self.deck = genanki.Deck(self.deck_id, self.deck_name)
         self.media_files: List[str] = []
         self.video_tag = '<video controls><source src="{0}"\
-            type="video/webm"/></video>'
+            type="{1}"/></video>'
 
     @staticmethod
     def id_from_string(s: str):
@@ -121,16 +181,20 @@ class AnkiExporter:
                  meanings: str,
                  sentence: str,
                  explanation: str,
-                 tags: Optional[List[str]] = None
+                 tags: Optional[List[str]] = None,
+                 note_id: Optional[str] = None
                  ) -> None:
         """
         Add one note/card to the deck.
-        clip_path will be bundled as media
+        clip_path will be bundled as media. A stable `note_id` (e.g. the
+        clip ID) lets Anki update notes on re-import instead of
+        duplicating them.
         """
         filename = Path(clip_path).name
-        video = self.video_tag.format(filename)
+        video = self.video_tag.format(filename, video_mime_type(filename))
         self.media_files.append(clip_path)
 
+        import genanki
         note = genanki.Note(
             model=self.model,
             fields=[
@@ -140,17 +204,288 @@ class AnkiExporter:
                 sentence,
                 explanation],
             tags=tags or [],
+            guid=genanki.guid_for(note_id) if note_id else None,
         )
         self.deck.add_note(note)
 
+    def write_collection(self,
+                         db_path: str,
+                         timestamp: Optional[float] = None) -> None:
+        """
+        Write the Anki collection (notes, cards, models) as SQLite.
+        """
+        import genanki
+        timestamp = time.time() if timestamp is None else timestamp
+        conn = sqlite3.connect(db_path)
+        try:
+            genanki.Package(self.deck).write_to_db(
+                conn.cursor(), timestamp,
+                itertools.count(int(timestamp * 1000)))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def iter_package(self,
+                     chunk_size: int = STREAM_CHUNK_SIZE
+                     ) -> Iterator[bytes]:
+        """
+        Yield the .apkg as a zip stream. The collection is written
+        first, then media is appended one file at a time, stored
+        uncompressed (video doesn't deflate), so memory stays bounded
+        by `chunk_size` whatever the deck size.
+        """
+        fd, db_path = tempfile.mkstemp(suffix=".anki2")
+        os.close(fd)
+        try:
+            self.write_collection(db_path)
+            sink = _ChunkSink()
+            with zipfile.ZipFile(sink, "w") as zf:
+                zf.write(db_path, "collection.anki2",
+                         compress_type=zipfile.ZIP_DEFLATED)
+                # First bytes go out before any media is read
+                yield sink.drain()
+                media_json = {idx: os.path.basename(path)
+                              for idx, path in enumerate(self.media_files)}
+                zf.writestr("media", json.dumps(media_json))
+                for idx, path in enumerate(self.media_files):
+                    info = zipfile.ZipInfo.from_file(path, str(idx))
+                    info.compress_type = zipfile.ZIP_STORED
+                    with open(path, "rb") as src, \
+                            zf.open(info, "w") as dst:
+                        while chunk := src.read(chunk_size):
+                            dst.write(chunk)
+                            if data := sink.drain():
+                                yield data
+            yield sink.drain()
+        finally:
+            os.unlink(db_path)
+
     def export(self,
                output_path: str) -> None:
         """
         Write .apkg (deck + all media) to output_path.
         """
-        pkg = genanki.Package(self.deck,
-                              self.media_files)
-        pkg.write_to_file(output_path)
+        with open(output_path, "wb") as f:
+            for chunk in self.iter_package():
+                f.write(chunk)
         _notes = f"#Notes -> {len(self.deck.notes)};"
         _media = f"#Media -> {len(self.media_files)};"
         logger.info(f"Anki Package -> {output_path};{_notes}{_media}")
+
+
+def deck_version(clip_ids: Iterable[str], variant: str = "") -> str:
+    """
+    Version of a profile's clip set. Clips are immutable once saved,
+    so the set of IDs (plus the note model) identifies the deck.
+    `variant` (e.g. 'compact') prefixes the version so differently
+    rendered decks are cached side by side.
+    """
+    digest = hashlib.sha256(MODEL_NAME.encode())
+    for clip_id in sorted(clip_ids):
+        digest.update(b"\0" + clip_id.encode())
+    version = digest.hexdigest()[:16]
+    return f"{variant}-{version}" if variant else version
+
+
+class ClipCompactor:
+    """
+    Transcodes clips to small renditions for Anki decks, running one
+    ffmpeg process per clip in parallel. Renditions are cached per
+    clip (clips are immutable) so repeated exports reuse them.
+    """
+    EXTENSIONS = {"h264": ".mp4", "vp9": ".webm"}
+
+    def __init__(self,
+                 cache_dir: Path,
+                 codec: str = ANKI_COMPACT_CODEC,
+                 max_height: int = ANKI_COMPACT_HEIGHT,
+                 workers: int = ANKI_COMPACT_WORKERS):
+        if codec not in self.EXTENSIONS:
+            raise ValueError(f"Unsupported codec: {codec}")
+        self.cache_dir = Path(cache_dir)
+        self.codec = codec
+        self.max_height = max_height
+        self.workers = max(1, workers)
+
+    def path_for(self, clip_id: str) -> Path:
+        ext = self.EXTENSIONS[self.codec]
+        return self.cache_dir / f"{clip_id}_{self.codec}{self.max_height}{ext}"
+
+    def complete(self, clip_ids: Iterable[str]) -> bool:
+        """
+        Whether every clip has a rendition. A deck built while some are
+        missing bundled their originals (transcoding failed), so it must
+        not be reused: the next export retries them.
+        """
+        return all(self.path_for(clip_id).exists() for clip_id in clip_ids)
+
+    def _compact_one(self, tools, clip_id: str, src: str) -> str:
+        out = self.path_for(clip_id)
+        hit = out.exists()
+        record_cache("anki_compact_clip", hit)
+        if hit:
+            return str(out)
+        tmp = out.with_name(f".{uuid.uuid4().hex[:8]}{out.name}")
+        try:
+            res = tools.to_compact_clip(input_path=src,
+                                        output_path=str(tmp),
+                                        max_height=self.max_height,
+                                        codec=self.codec)
+            if res is None:
+                logger.warning(f"Compacting clip {clip_id} failed, "
+                               "bundling the original")
+                return src
+            os.replace(tmp, out)
+            return str(out)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    def compact(self, clips: List[Tuple[str, str]]) -> List[str]:
+        """
+        Map [(clip_id, clip_path)] to rendition paths, in order.
+        Clips that fail to transcode keep their original path.
+        """
+        # Imported lazily: only needed (and ffmpeg only required) here
+        from processing.audio_processing import AudioTools
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tools = AudioTools(working_dir=self.cache_dir)
+        # Each job is an ffmpeg subprocess, so threads are enough to
+        # keep every core busy
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # Pool threads don't inherit the caller's context; give each
+            # job a copy so its spans stay in the request's trace
+            futures = [pool.submit(copy_context().run, self._compact_one,
+                                   tools, *c) for c in clips]
+            return [f.result() for f in futures]
+
+
+def size_report(clip_paths: List[str], package_path: Path) -> Dict:
+    """
+    Size of the source clips vs. the package built from them.
+    """
+    clip_bytes = sum(os.path.getsize(p) for p in clip_paths
+                     if os.path.exists(p))
+    package_bytes = os.path.getsize(package_path)
+    saved = 1 - package_bytes / clip_bytes if clip_bytes else 0.0
+    return {"clip_bytes": clip_bytes,
+            "package_bytes": package_bytes,
+            "saved_ratio": round(saved, 4)}
+
+
+class AnkiPackageCache:
+    """
+    One .apkg per profile, keyed by clip-set version. Packages are
+    built off the event loop, reused while the clip set is unchanged
+    and older versions are deleted once a new one is written.
+    """
+    SUFFIX = "_saved_deck.apkg"
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = Path(base_dir)
+        # Per-profile build lock and the number of exports holding or
+        # waiting for it; dropped when that reaches zero
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    def profile_dir(self, profile_id: str) -> Path:
+        return self.base_dir / "profiles" / profile_id / "anki"
+
+    def path_for(self, profile_id: str, version: str) -> Path:
+        return self.profile_dir(profile_id) / f"{version}{self.SUFFIX}"
+
+    @classmethod
+    def _variant(cls, pkg: Path) -> str:
+        version = pkg.name[:-len(cls.SUFFIX)] if pkg.name.endswith(
+            cls.SUFFIX) else pkg.stem
+        variant, _, digest = version.rpartition("-")
+        # Legacy uuid-named packages count as the default variant
+        if len(digest) != 16 or "-" in variant:
+            return ""
+        return variant
+
+    def collect_stale(self, profile_id: str, keep: Path) -> int:
+        """
+        Delete every package of the profile's `keep` variant except
+        `keep` itself.
+        """
+        removed = 0
+        variant = self._variant(keep)
+        for pkg in self.profile_dir(profile_id).glob("*.apkg"):
+            if pkg.name == keep.name or self._variant(pkg) != variant:
+                continue
+            try:
+                pkg.unlink()
+                removed += 1
+            except OSError as e:
+                logger.error(f"Could not remove stale package {pkg}: {e}")
+        if removed:
+            logger.info(f"Removed {removed} stale Anki package(s) "
+                        f"for profile {profile_id}")
+        return removed
+
+    async def get_or_build(self,
+                           profile_id: str,
+                           version: str,
+                           build: Callable[[Path], None],
+                           reuse: bool = True) -> Tuple[Path, bool]:
+        """
+        Return (package path, cache hit). On a miss `build(path)` runs
+        in a worker thread; concurrent exports of one profile share it.
+        With `reuse=False` an existing package is rebuilt.
+        """
+        async with self._profile_lock(profile_id):
+            out = self.path_for(profile_id, version)
+            hit = reuse and out.exists()
+            record_cache("anki_package", hit)
+            if hit:
+                return out, True
+            out.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._tmp_path(out)
+            try:
+                await asyncio.to_thread(build, tmp)
+                os.replace(tmp, out)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+            await asyncio.to_thread(self.collect_stale, profile_id, out)
+            return out, False
+
+    @asynccontextmanager
+    async def _profile_lock(self, profile_id: str) -> AsyncIterator[None]:
+        lock, users = self._locks.get(profile_id, (asyncio.Lock(), 0))
+        self._locks[profile_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[profile_id]
+            if users > 1:
+                self._locks[profile_id] = (lock, users - 1)
+            else:
+                del self._locks[profile_id]
+
+    @staticmethod
+    def _tmp_path(out: Path) -> Path:
+        return out.with_name(f".{out.name}.{uuid.uuid4().hex[:8]}.tmp")
+
+    def tee(self,
+            profile_id: str,
+            version: str,
+            chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """
+        Pass a package stream through while saving it as the cached
+        package for `version`. An interrupted stream leaves no file.
+        """
+        out = self.path_for(profile_id, version)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._tmp_path(out)
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp, out)
+            self.collect_stale(profile_id, out)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
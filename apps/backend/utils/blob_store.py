@@ -0,0 +1,221 @@
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Optional
+from utils.metrics_utils import record_cache, timed_stage
+
+logger = logging.getLogger(__name__)
+
+BASE_MEDIA_DIR = Path("media_files")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@timed_stage("content_hash")
+def hash_file(path: Path) -> str:
+    """
+    SHA-256 hex digest of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed store under `media_files/blobs`, keyed by SHA-256.
+
+    Profile files are hard links to their blob, so identical uploads
+    share one copy on disk and the link count is the reference count:
+    a blob whose only remaining link is the store's own is unused.
+    Nothing is ever copied into or out of the store instead, since a
+    copy would not count as a reference; where hard links are not
+    supported files simply stay outside the store, undeduplicated.
+    Outputs derived from some content (converted video, transcripts,
+    ...) are recorded under `derived/<recipe>/` keyed by the input's
+    digest, so processing a duplicate upload can be skipped.
+    """
+    def __init__(self, base_dir: Path = BASE_MEDIA_DIR / "blobs"):
+        self.base_dir = Path(base_dir)
+        self.objects_dir = self.base_dir / "sha256"
+        self.derived_dir = self.base_dir / "derived"
+        self.tmp_dir = self.base_dir / "tmp"
+
+    def path_for(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: Optional[str]) -> bool:
+        return bool(digest) and self.path_for(digest).exists()
+
+    def link(self, digest: str, dest: Path) -> Path:
+        """
+        Materialize a blob at `dest` as a hard link, replacing any file
+        there. Raises OSError if the blob is gone or can't be linked.
+        """
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        blob = self.path_for(digest)
+        if dest.exists() and os.path.samefile(blob, dest):
+            return dest
+        # Swapped in atomically, so `dest` is never missing
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex[:8]}.tmp")
+        os.link(blob, tmp)
+        try:
+            os.replace(tmp, dest)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return dest
+
+    def ingest(self, src: Path, dest: Path) -> str:
+        """
+        Move `src` to `dest` and bring it into the store. Returns the
+        digest.
+        """
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(src), str(dest))
+        return self.adopt(dest)
+
+    def adopt(self, path: Path) -> str:
+        """
+        Bring a file that is already in place into the store, replacing
+        it with a link to an identical existing blob. Returns the
+        digest, also when the file could not be stored.
+        """
+        path = Path(path)
+        digest = hash_file(path)
+        blob = self.path_for(digest)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        # A second attempt if the blob is collected while linking to it
+        for _ in range(2):
+            try:
+                # New content: the file itself becomes the blob
+                os.link(path, blob)
+                os.chmod(blob, 0o444)
+                return digest
+            except FileExistsError:
+                pass
+            except OSError as e:
+                logger.warning(f"Hard link failed ({e}), {path} is not "
+                               "deduplicated")
+                return digest
+            try:
+                self.link(digest, path)
+                return digest
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Hard link failed ({e}), {path} is not "
+                               "deduplicated")
+                return digest
+        return digest
+
+    def release(self, digest: Optional[str]) -> bool:
+        """
+        Delete a blob once nothing links to it any more. Call after
+        removing a file that referenced it. Returns True if deleted.
+        """
+        if not digest:
+            return False
+        blob = self.path_for(digest)
+        try:
+            if blob.stat().st_nlink > 1:
+                return False
+            blob.unlink()
+        except FileNotFoundError:
+            return False
+        logger.info(f"Released blob {digest}")
+        return True
+
+    # --- Derived outputs ---
+    # Recorded as derived/<recipe>/<xx>/<source digest>--<output digest>,
+    # a hard link to the output blob.
+    def get_derived(self, digest: Optional[str], recipe: str
+                    ) -> Optional[str]:
+        """
+        Digest of the recorded output of `recipe` applied to content
+        `digest`, if any.
+        """
+        if not digest:
+            return None
+        folder = self.derived_dir / recipe / digest[:2]
+        for record in folder.glob(f"{digest}--*"):
+            out_digest = record.name.split("--", 1)[1]
+            if self.exists(out_digest):
+                record_cache(f"derived:{recipe}", True)
+                return out_digest
+        record_cache(f"derived:{recipe}", False)
+        return None
+
+    def put_derived(self, digest: str, recipe: str, output: Path) -> str:
+        """
+        Record `output` (a file that is already stored, e.g. adopted)
+        as the result of `recipe` on content `digest`. Returns the
+        output's digest.
+        """
+        out_digest = self.adopt(output)
+        record = (self.derived_dir / recipe / digest[:2] /
+                  f"{digest}--{out_digest}")
+        # Not stored when hard links are unavailable
+        if self.exists(out_digest) and not record.exists():
+            self.link(out_digest, record)
+        return out_digest
+
+    def read_derived_text(self, digest: Optional[str], recipe: str
+                          ) -> Optional[str]:
+        out_digest = self.get_derived(digest, recipe)
+        if not out_digest:
+            return None
+        return self.path_for(out_digest).read_text(encoding="utf-8")
+
+    def put_derived_text(self, digest: str, recipe: str, text: str) -> str:
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.tmp_dir / uuid.uuid4().hex
+        tmp.write_text(text, encoding="utf-8")
+        try:
+            return self.put_derived(digest, recipe, tmp)
+        finally:
+            tmp.unlink()
+
+    def prune_derived(self, max_age: float, now: float) -> int:
+        """
+        Forget derived records whose output was produced more than
+        `max_age` seconds ago. Returns the number removed.
+        """
+        removed = 0
+        if not self.derived_dir.exists():
+            return 0
+        for record in self.derived_dir.glob("*/*/*--*"):
+            try:
+                if now - record.stat().st_mtime > max_age:
+                    record.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def collect_garbage(self) -> int:
+        """
+        Delete blobs no profile file or derived record links to.
+        Returns the bytes freed.
+        """
+        freed = 0
+        if not self.objects_dir.exists():
+            return 0
+        for blob in self.objects_dir.glob("*/*/*"):
+            try:
+                st = blob.stat()
+                if st.st_nlink <= 1:
+                    blob.unlink()
+                    freed += st.st_size
+            except OSError:
+                continue
+        return freed
+
+
+blob_store = BlobStore()
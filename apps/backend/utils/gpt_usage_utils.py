@@ -0,0 +1,256 @@
+import asyncio
+import datetime
+import logging
+import os
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import func, select
+from db.db import get_db, execute_write
+from db.Tables import gpt_budgets, gpt_usage
+from processing.gpt_wrapper import GptModel
+from profile_manager import current_profile_id, get_profile_id_optional
+from utils.metrics_utils import current_route
+
+logger = logging.getLogger(__name__)
+
+# Seconds between ledger flushes
+GPT_USAGE_FLUSH_INTERVAL = float(os.getenv("GPT_USAGE_FLUSH_SECONDS", "2"))
+# Flush early once this many records are pending
+GPT_USAGE_BATCH_SIZE = int(os.getenv("GPT_USAGE_BATCH_SIZE", "100"))
+# Records kept in memory while the database is unavailable
+GPT_USAGE_MAX_PENDING = 10000
+# Default per-profile spend limit in USD per window, 0 disables budgets
+GPT_BUDGET_USD = float(os.getenv("GPT_BUDGET_USD", "0"))
+GPT_BUDGET_WINDOW = int(os.getenv("GPT_BUDGET_WINDOW_SECONDS",
+                                  str(30 * 86400)))
+GROUP_COLUMNS = {"model": gpt_usage.c.model,
+                 "route": gpt_usage.c.route,
+                 "day": func.date(gpt_usage.c.created_at)}
+
+
+class GptUsageLedger:
+    """
+    Records every GPT request (profile, route, model, tokens, cost,
+    latency) in the `gpt_usage` table.
+
+    `GptModel` calls `record` from whichever thread ran the request;
+    records are buffered and written by a background task in batched
+    inserts, so accounting never adds a database round trip to a GPT
+    call. Profile and route come from the request's context variables.
+    """
+    def __init__(self,
+                 flush_interval: float = GPT_USAGE_FLUSH_INTERVAL,
+                 batch_size: int = GPT_USAGE_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: List[Dict] = []
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, usage: Dict) -> None:
+        """
+        GptModel usage listener. Safe to call from any thread.
+        """
+        # Multi-row inserts skip the Python-side column defaults
+        row = dict(usage,
+                   id=str(uuid.uuid4()),
+                   profile_id=current_profile_id.get(),
+                   route=current_route(),
+                   created_at=datetime.datetime.now())
+        with self._lock:
+            if len(self._pending) >= GPT_USAGE_MAX_PENDING:
+                logger.error("GPT usage ledger full, dropping a record")
+                return
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+        if full and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending_cost(self, profile_id: str,
+                     since: datetime.datetime) -> float:
+        with self._lock:
+            return sum(r["cost_usd"] for r in self._pending
+                       if r["profile_id"] == profile_id
+                       and r["created_at"] >= since)
+
+    async def flush(self) -> int:
+        """
+        Write pending records in one insert. Returns the number written.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            await execute_write(gpt_usage.insert().values(batch))
+        except Exception as e:
+            logger.error(f"Writing {len(batch)} GPT usage records "
+                         f"failed: {e}")
+            with self._lock:
+                self._pending = (batch + self._pending
+                                 )[:GPT_USAGE_MAX_PENDING]
+            return 0
+        return len(batch)
+
+    async def _loop_forever(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        if self.record not in GptModel.usage_listeners:
+            GptModel.usage_listeners.append(self.record)
+        self._task = asyncio.create_task(self._loop_forever())
+
+    async def stop(self) -> None:
+        if self.record in GptModel.usage_listeners:
+            GptModel.usage_listeners.remove(self.record)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        await self.flush()
+
+    # --- Queries ---
+    async def aggregate(self,
+                        profile_id: str,
+                        since: datetime.datetime,
+                        group_by: Optional[str] = None) -> List[Dict]:
+        """
+        Totals of the profile's usage since `since`, optionally grouped
+        by model, route or day (most expensive group first).
+        """
+        await self.flush()
+        cost = func.sum(gpt_usage.c.cost_usd)
+        columns = [
+            func.count().label("requests"),
+            func.sum(gpt_usage.c.prompt_tokens).label("prompt_tokens"),
+            func.sum(gpt_usage.c.completion_tokens).label(
+                "completion_tokens"),
+            func.sum(gpt_usage.c.cached_tokens).label("cached_tokens"),
+            cost.label("cost_usd"),
+            func.avg(gpt_usage.c.latency_ms).label("avg_latency_ms"),
+        ]
+        query = select(*columns)
+        if group_by:
+            key = GROUP_COLUMNS[group_by]
+            query = select(key.label("key"), *columns).group_by(
+                key).order_by(cost.desc())
+        query = query.where(gpt_usage.c.profile_id == profile_id).where(
+            gpt_usage.c.created_at >= since)
+        db = await get_db()
+        rows = []
+        for r in await db.fetch_all(query):
+            rows.append({
+                "key": str(r["key"]) if group_by else None,
+                "requests": r["requests"] or 0,
+                "prompt_tokens": r["prompt_tokens"] or 0,
+                "completion_tokens": r["completion_tokens"] or 0,
+                "cached_tokens": r["cached_tokens"] or 0,
+                "cost_usd": round(r["cost_usd"] or 0.0, 6),
+                "avg_latency_ms": round(r["avg_latency_ms"] or 0.0, 1),
+            })
+        return rows
+
+    async def spent(self, profile_id: str,
+                    since: datetime.datetime
+                    ) -> Tuple[float, Optional[datetime.datetime]]:
+        """
+        USD spent by the profile since `since` (including records not
+        yet written) and the time of its oldest request in that window.
+        """
+        db = await get_db()
+        row = await db.fetch_one(
+            select(func.sum(gpt_usage.c.cost_usd).label("cost"),
+                   func.min(gpt_usage.c.created_at).label("first"))
+            .where(gpt_usage.c.profile_id == profile_id)
+            .where(gpt_usage.c.created_at >= since))
+        cost = (row["cost"] or 0.0) + self.pending_cost(profile_id, since)
+        first = row["first"]
+        if isinstance(first, str):
+            first = datetime.datetime.fromisoformat(first)
+        return cost, first
+
+
+gpt_usage_ledger = GptUsageLedger()
+
+
+async def get_budget(profile_id: str) -> Tuple[float, int]:
+    """
+    (budget in USD, window in seconds) for a profile: its override if
+    set, the GPT_BUDGET_USD / GPT_BUDGET_WINDOW_SECONDS defaults
+    otherwise. A budget of 0 means unlimited.
+    """
+    db = await get_db()
+    row = await db.fetch_one(gpt_budgets.select().where(
+        gpt_budgets.c.profile_id == profile_id))
+    if row is None:
+        return GPT_BUDGET_USD, GPT_BUDGET_WINDOW
+    return row.budget_usd, row.window_seconds
+
+
+async def budget_status(profile_id: str,
+                        limits: Optional[Tuple[float, int]] = None
+                        ) -> Dict:
+    """
+    The profile's budget, spend in the current window and, once used
+    up, seconds until requests are allowed again. `limits` is its
+    `get_budget` result if already known.
+    """
+    budget, window = limits or await get_budget(profile_id)
+    since = datetime.datetime.now() - datetime.timedelta(seconds=window)
+    spent, first = await gpt_usage_ledger.spent(profile_id, since)
+    retry_after = None
+    if budget and spent >= budget:
+        # Spend drops once the oldest request leaves the window
+        first = first or datetime.datetime.now()
+        reset = first + datetime.timedelta(seconds=window)
+        retry_after = max(1, int((reset - datetime.datetime.now())
+                                 .total_seconds()))
+    return {"budget_usd": budget or None,
+            "window_seconds": window,
+            "spent_usd": round(spent, 6),
+            "remaining_usd": (round(max(0.0, budget - spent), 6)
+                              if budget else None),
+            "retry_after_seconds": retry_after}
+
+
+async def enforce_gpt_budget(profile_id: Optional[str] = Depends(
+        get_profile_id_optional)) -> Optional[str]:
+    """
+    Dependency for routes that call GPT: rejects the request with 429
+    while the profile has used up its budget for the current window.
+    Requests without a profile cannot be attributed and are not limited.
+    """
+    if not profile_id:
+        return profile_id
+    limits = await get_budget(profile_id)
+    # Unlimited, skip summing the ledger on every GPT request
+    if not limits[0]:
+        return profile_id
+    budget = await budget_status(profile_id, limits)
+    if budget["retry_after_seconds"] is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=(f"GPT budget of ${budget['budget_usd']:.2f} per "
+                    f"{budget['window_seconds']}s used up "
+                    f"(${budget['spent_usd']:.2f} spent)."),
+            headers={"Retry-After": str(budget["retry_after_seconds"])})
+    return profile_id
@@ -0,0 +1,149 @@
+import os
+import logging
+from pathlib import Path, PurePosixPath
+from typing import Optional
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Read size when the server can't sendfile
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(1024 * 1024)))
+FIRST_CHUNK_SIZE = 64 * 1024
+# Files under these top-level directories are never rewritten in place
+# (uuid-named or content-addressed), so clients may cache them forever
+IMMUTABLE_DIRS = {"profiles", "blobs"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The same for authorized responses, which shared caches must not store
+PRIVATE_IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Everything else (temp exports, ...) must be revalidated
+DEFAULT_CACHE_CONTROL = "no-cache"
+ZEROCOPY_EXTENSION = "http.response.zerocopy"
+# Hand file delivery to nginx: the backend only authorizes the request
+MEDIA_ACCEL_REDIRECT = os.getenv("MEDIA_ACCEL_REDIRECT",
+                                 "false").lower() == "true"
+# nginx `internal` location aliased to the shared media_files volume
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/protected_media/")
+
+
+def cache_control_for(path: str, private: bool = False) -> str:
+    """
+    Cache-Control value for a path relative to the media root. With
+    `private`, only the requesting client may cache the response.
+    """
+    parts = PurePosixPath(path).parts
+    if parts and parts[0] in IMMUTABLE_DIRS:
+        return PRIVATE_IMMUTABLE_CACHE_CONTROL if private \
+            else IMMUTABLE_CACHE_CONTROL
+    return DEFAULT_CACHE_CONTROL
+
+
+class MediaFileResponse(FileResponse):
+    """
+    FileResponse that hands the file descriptor to the server when it
+    supports the ASGI zero-copy extension (sendfile), and otherwise
+    streams a small first chunk followed by larger chunks than
+    Starlette's 64KiB default.
+    Range, If-Range and multipart ranges are handled by FileResponse.
+    Overrides its private `_handle_*` methods (Starlette is pinned for
+    this), and never uses `http.response.pathsend`, which this Starlette
+    version does not send either.
+    """
+    chunk_size = MEDIA_CHUNK_SIZE
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        self.zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _send_file(self, send: Send, offset: int,
+                         count: int) -> None:
+        if self.zerocopy:
+            file = await anyio.to_thread.run_sync(open, self.path, "rb")
+            try:
+                await send({"type": ZEROCOPY_EXTENSION,
+                            "file": file,
+                            "offset": offset,
+                            "count": count,
+                            "more_body": False})
+            finally:
+                file.close()
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(offset)
+            # Small first read keeps time to first byte low
+            size = FIRST_CHUNK_SIZE
+            while True:
+                chunk = await file.read(min(size, count))
+                count -= len(chunk)
+                more_body = bool(chunk) and count > 0
+                await send({"type": "http.response.body",
+                            "body": chunk,
+                            "more_body": more_body})
+                if not more_body:
+                    break
+                size = self.chunk_size
+
+    async def _handle_simple(self, send: Send,
+                             send_header_only: bool) -> None:
+        if send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers})
+        await self._send_file(send, 0, int(self.headers["content-length"]))
+
+    async def _handle_single_range(self, send: Send, start: int, end: int,
+                                   file_size: int,
+                                   send_header_only: bool) -> None:
+        if send_header_only:
+            return await super()._handle_single_range(
+                send, start, end, file_size, send_header_only)
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start",
+                    "status": 206,
+                    "headers": self.raw_headers})
+        await self._send_file(send, start, end - start)
+
+
+class MediaFiles(StaticFiles):
+    """
+    StaticFiles for the `/media` mount: conditional GET (ETag /
+    Last-Modified → 304), byte ranges, per-directory Cache-Control and
+    zero-copy responses.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers.setdefault("cache-control",
+                                        cache_control_for(path))
+        return response
+
+    def file_response(self, full_path, stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        response = MediaFileResponse(full_path,
+                                     status_code=status_code,
+                                     stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def resolve_media_path(root: Path, path: str) -> Optional[Path]:
+    """
+    Resolve a path relative to the media root, returning None if it
+    escapes the root (traversal, absolute paths, symlinks out).
+    """
+    if "\x00" in path:
+        return None
+    root = root.resolve()
+    full = (root / path.lstrip("/")).resolve()
+    if full == root or root not in full.parents:
+        return None
+    return full
@@ -0,0 +1,293 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple
+from utils.tracing_utils import tracer
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST,
+                                   REGISTRY,
+                                   Counter,
+                                   Gauge,
+                                   Histogram,
+                                   generate_latest)
+    from prometheus_client.core import (CounterMetricFamily,
+                                        GaugeMetricFamily)
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    # The processing modules also run inside the Modal GPU image, which
+    # does not ship prometheus_client; metrics become no-ops there.
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger(__name__)
+
+# Wide enough for a dictionary lookup as well as a long transcription
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+                   600.0)
+RTF_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5,
+               2.0, 4.0)
+METRICS_PATH = "/metrics"
+
+# ASGI scope of the request being served, set by MetricsMiddleware.
+# Context variables are copied into asyncio.to_thread workers, so stages
+# timed in threads are still attributed to their route.
+_request_scope: ContextVar[Optional[dict]] = ContextVar(
+    "metrics_request_scope", default=None)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def __getattr__(self, name: str) -> Callable:
+        return lambda *args, **kwargs: None
+
+
+def _metric(cls_name: str, *args, **kwargs):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    cls = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+    return cls[cls_name](*args, **kwargs)
+
+
+HTTP_SECONDS = _metric(
+    "histogram", "mirumoji_http_request_duration_seconds",
+    "Time to serve a request, including streamed bodies",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS)
+HTTP_IN_PROGRESS = _metric(
+    "gauge", "mirumoji_http_requests_in_progress",
+    "Requests currently being served", ["method"])
+STAGE_SECONDS = _metric(
+    "histogram", "mirumoji_stage_duration_seconds",
+    "Time spent in a pipeline stage",
+    ["stage", "route", "model"], buckets=LATENCY_BUCKETS)
+STAGE_IN_PROGRESS = _metric(
+    "gauge", "mirumoji_stage_in_progress",
+    "Pipeline stages currently running", ["stage"])
+WHISPER_RTF = _metric(
+    "histogram", "mirumoji_whisper_realtime_factor",
+    "Whisper decode time divided by audio duration",
+    ["model", "device"], buckets=RTF_BUCKETS)
+WHISPER_AUDIO_SECONDS = _metric(
+    "counter", "mirumoji_whisper_audio_seconds",
+    "Seconds of audio transcribed", ["model", "device"])
+GPT_TOKENS = _metric(
+    "counter", "mirumoji_gpt_tokens",
+    "OpenAI tokens used", ["model", "route", "kind"])
+GPT_REQUESTS = _metric(
+    "counter", "mirumoji_gpt_requests",
+    "OpenAI requests by outcome", ["model", "route", "outcome"])
+DB_SECONDS = _metric(
+    "histogram", "mirumoji_db_query_duration_seconds",
+    "Database call latency; `queued_write` includes the write queue wait",
+    ["operation", "route"], buckets=LATENCY_BUCKETS)
+QUEUE_DEPTH = _metric(
+    "gauge", "mirumoji_queue_depth",
+    "Items waiting in an internal queue", ["queue"])
+
+
+def current_route() -> str:
+    """
+    Route template of the request being served, e.g.
+    `/profiles/clips/{clipId}`, or `background` outside requests.
+    """
+    scope = _request_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    if scope.get("path", "").startswith("/media/"):
+        return "/media"
+    # Unmatched paths are not used as labels to bound cardinality
+    return "unmatched"
+
+
+@contextmanager
+def observe_stage(stage: str, model: str = ""):
+    """
+    Time the enclosed block as pipeline `stage` of the current route,
+    and trace it as a span of the current request.
+    """
+    STAGE_IN_PROGRESS.labels(stage).inc()
+    t0 = time.perf_counter()
+    try:
+        with tracer.span(stage, model=model or None):
+            yield
+    finally:
+        STAGE_IN_PROGRESS.labels(stage).dec()
+        STAGE_SECONDS.labels(stage, current_route(), model).observe(
+            time.perf_counter() - t0)
+
+
+def timed_stage(stage: str) -> Callable:
+    """
+    Decorator form of `observe_stage`.
+    """
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with observe_stage(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_duration(stage: str, seconds: float, model: str = "") -> None:
+    """
+    Record a stage duration measured by the caller.
+    """
+    STAGE_SECONDS.labels(stage, current_route(), model).observe(seconds)
+
+
+def observe_whisper(model: str,
+                    device: str,
+                    decode_seconds: float,
+                    audio_seconds: float) -> None:
+    observe_duration("whisper_decode", decode_seconds, model)
+    if audio_seconds > 0:
+        WHISPER_RTF.labels(model, device).observe(
+            decode_seconds / audio_seconds)
+        WHISPER_AUDIO_SECONDS.labels(model, device).inc(audio_seconds)
+
+
+def observe_gpt(model: str,
+                outcome: str,
+                prompt_tokens: int = 0,
+                completion_tokens: int = 0) -> None:
+    route = current_route()
+    GPT_REQUESTS.labels(model, route, outcome).inc()
+    if prompt_tokens:
+        GPT_TOKENS.labels(model, route, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        GPT_TOKENS.labels(model, route, "completion").inc(completion_tokens)
+
+
+@contextmanager
+def observe_db(operation: str):
+    t0 = time.perf_counter()
+    try:
+        # Only as part of a request or job, not one trace per query
+        with tracer.span(f"db.{operation}", child_only=True,
+                         **{"db.operation": operation}):
+            yield
+    finally:
+        DB_SECONDS.labels(operation, current_route()).observe(
+            time.perf_counter() - t0)
+
+
+_queues: Dict[str, Callable[[], int]] = {}
+
+
+def register_queue(name: str, qsize: Callable[[], int]) -> None:
+    """
+    Export the current size of a queue, read at scrape time.
+    """
+    _queues[name] = qsize
+    QUEUE_DEPTH.labels(name).set_function(qsize)
+
+
+def queue_depths() -> Dict[str, int]:
+    """
+    Current size of every registered queue.
+    """
+    return {name: qsize() for name, qsize in _queues.items()}
+
+
+class CacheStats:
+    """
+    Hit / miss counts of the application caches plus `functools.lru_cache`
+    functions registered by name, exported with their hit ratio.
+    """
+    def __init__(self):
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._lru: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+
+    def record(self, cache: str, hit: bool) -> None:
+        key = (cache, "hit" if hit else "miss")
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def register_lru(self, cache: str, fn: Callable) -> None:
+        self._lru[cache] = fn
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        stats: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for (cache, result), n in self._counts.items():
+                stats.setdefault(cache, {"hit": 0, "miss": 0})[result] = n
+        for cache, fn in self._lru.items():
+            info = fn.cache_info()
+            stats[cache] = {"hit": info.hits, "miss": info.misses}
+        return stats
+
+    def collect(self):
+        requests = CounterMetricFamily(
+            "mirumoji_cache_requests", "Cache lookups by result",
+            labels=["cache", "result"])
+        ratio = GaugeMetricFamily(
+            "mirumoji_cache_hit_ratio", "Cache hits over lookups so far",
+            labels=["cache"])
+        for cache, counts in self.snapshot().items():
+            for result, n in counts.items():
+                requests.add_metric([cache, result], n)
+            total = counts["hit"] + counts["miss"]
+            if total:
+                ratio.add_metric([cache], counts["hit"] / total)
+        yield requests
+        yield ratio
+
+
+cache_stats = CacheStats()
+if PROMETHEUS_AVAILABLE:
+    REGISTRY.register(cache_stats)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    cache_stats.record(cache, hit)
+
+
+def render_metrics() -> bytes:
+    if not PROMETHEUS_AVAILABLE:
+        return b""
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request by route template and
+    making the request scope available to stage metrics.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+        token = _request_scope.set(scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        method = scope.get("method", "")
+        HTTP_IN_PROGRESS.labels(method).inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.labels(method).dec()
+            HTTP_SECONDS.labels(current_route(), method,
+                                str(status_code)).observe(
+                time.perf_counter() - t0)
+            _request_scope.reset(token)
@@ -0,0 +1,154 @@
+import asyncio.base_events
+import collections
+import concurrent.futures.thread
+import os
+import queue
+import selectors
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Upper bound for one profiling window
+PROFILE_MAX_SECONDS = float(os.getenv("ADMIN_PROFILE_MAX_SECONDS", "120"))
+# Leaf frames (file, function) of threads blocked waiting for work
+# rather than running. Matched with the file, so a hot function of ours
+# that happens to be called `get` or `wait` is still sampled.
+IDLE_FRAMES = frozenset({
+    (selectors.__file__, "select"),
+    (threading.__file__, "wait"),
+    (threading.__file__, "_wait_for_tstate_lock"),
+    (queue.__file__, "get"),
+    (concurrent.futures.thread.__file__, "_worker"),
+    (socket.__file__, "accept"),
+    (asyncio.base_events.__file__, "run_forever"),
+    (asyncio.base_events.__file__, "_run_once"),
+})
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({Path(code.co_filename).name})"
+
+
+class StackSampler:
+    """
+    Statistical profiler for the running process: a thread periodically
+    snapshots the Python stack of every other thread and counts
+    identical stacks. Output is in collapsed-stack format
+    (`thread;outer;...;inner count`), as read by flamegraph.pl,
+    speedscope and inferno.
+
+    Cheap enough to run against a live worker, but only Python frames
+    are seen: time inside C extensions (fugashi, SQLite, ffmpeg waits)
+    is attributed to the Python function that called them.
+    """
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.counts: collections.Counter = collections.Counter()
+        self.samples = 0
+
+    def _sample(self, own_id: int) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if not self.include_idle and (frame.f_code.co_filename,
+                                          frame.f_code.co_name) in IDLE_FRAMES:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, seconds: float) -> "StackSampler":
+        """
+        Sample for `seconds`, blocking the calling thread.
+        """
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self._sample(own_id)
+            time.sleep(self.interval)
+        return self
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n"
+                       for stack, count in self.counts.most_common())
+
+
+def allocation_diff(before: tracemalloc.Snapshot,
+                    after: tracemalloc.Snapshot,
+                    limit: int = 50) -> List[Dict]:
+    """
+    Source lines whose allocated memory grew the most between snapshots.
+    """
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, __file__)]
+    stats = after.filter_traces(filters).compare_to(
+        before.filter_traces(filters), "lineno")
+    return [{"location": f"{s.traceback[0].filename}:"
+                         f"{s.traceback[0].lineno}",
+             "size_diff_bytes": s.size_diff,
+             "size_bytes": s.size,
+             "count_diff": s.count_diff}
+            for s in stats[:limit] if s.size_diff]
+
+
+class Profiler:
+    """
+    Runs one profiling window at a time against this process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self,
+                seconds: float,
+                interval: float = 0.005,
+                include_idle: bool = False,
+                allocations: bool = False,
+                limit: int = 50) -> Optional[Dict]:
+        """
+        Sample stacks for `seconds` and, with `allocations`, diff
+        tracemalloc snapshots taken at both ends of the window.
+        Returns None if another window is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        started_tracing = False
+        try:
+            before = None
+            if allocations:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    started_tracing = True
+                before = tracemalloc.take_snapshot()
+            sampler = StackSampler(interval, include_idle).run(
+                min(seconds, PROFILE_MAX_SECONDS))
+            result = {"collapsed": sampler.collapsed(),
+                      "samples": sampler.samples,
+                      "allocations": None}
+            if before is not None:
+                result["allocations"] = allocation_diff(
+                    before, tracemalloc.take_snapshot(), limit)
+            return result
+        finally:
+            # Tracing slows every allocation, don't leave it on
+            if started_tracing:
+                tracemalloc.stop()
+            self._lock.release()
+
+
+profiler = Profiler()
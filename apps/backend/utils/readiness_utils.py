@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Set to false to serve immediately and let first requests load models
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+# Failed warm-ups are retried, the delay doubling up to the maximum
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY_SECONDS", "5"))
+WARMUP_RETRY_MAX_DELAY = float(os.getenv("WARMUP_RETRY_MAX_DELAY_SECONDS",
+                                         "300"))
+
+
+class Readiness:
+    """
+    Warms up registered components (models, dictionaries) in parallel
+    worker threads after startup, and tracks which are ready.
+
+    Modules register a warm-up callable for what they hold at import
+    time; `start` runs them all in the background, so the server answers
+    liveness probes straight away while readiness waits for warm-up.
+    A failed warm-up (e.g. a model download timing out) is retried with
+    exponential backoff until it succeeds.
+    """
+    def __init__(self,
+                 enabled: bool = WARMUP_ENABLED,
+                 retry_delay: float = WARMUP_RETRY_DELAY,
+                 max_retry_delay: float = WARMUP_RETRY_MAX_DELAY):
+        self.enabled = enabled
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._warm_ups: Dict[str, Callable[[], object]] = {}
+        self._status: Dict[str, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._started_at: Optional[float] = None
+
+    def register(self, name: str, warm_up: Callable[[], object]) -> None:
+        """
+        Register a blocking warm-up callable under a component name.
+        Registering a name again replaces it, so modules sharing an
+        instance can all register it.
+        """
+        self._warm_ups[name] = warm_up
+        self._status[name] = {"state": "pending", "seconds": None,
+                              "error": None, "attempts": 0}
+
+    async def _warm(self, name: str) -> None:
+        status = self._status[name]
+        delay = self.retry_delay
+        while True:
+            status["state"] = "warming"
+            status["attempts"] += 1
+            t0 = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._warm_ups[name])
+            except Exception as e:
+                status.update(state="failed", error=str(e),
+                              seconds=round(time.perf_counter() - t0, 3))
+                # Full traceback once, then one line per retry
+                log = logger.exception if status["attempts"] == 1 \
+                    else logger.warning
+                log(f"Warm-up of {name} failed (attempt "
+                    f"{status['attempts']}): {e}, retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            status.update(state="ready", error=None,
+                          seconds=round(time.perf_counter() - t0, 3))
+            logger.info(f"Warm-up of {name}: ready in "
+                        f"{status['seconds']}s")
+            return
+
+    async def _run(self) -> None:
+        await asyncio.gather(*(self._warm(name) for name in self._warm_ups))
+        logger.info(f"Warm-up finished in "
+                    f"{time.perf_counter() - self._started_at:.1f}s")
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter()
+        if not self.enabled:
+            for status in self._status.values():
+                status["state"] = "skipped"
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Threads already warming finish on their own
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self._started_at is not None and all(
+            s["state"] in ("ready", "skipped")
+            for s in self._status.values())
+
+    def status(self) -> Dict:
+        return {"ready": self.ready,
+                "uptime_seconds": round(time.perf_counter()
+                                        - self._started_at, 1)
+                if self._started_at is not None else None,
+                "components": {name: dict(s)
+                               for name, s in self._status.items()}}
+
+
+readiness = Readiness()
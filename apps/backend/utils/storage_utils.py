@@ -0,0 +1,461 @@
+import asyncio
+import datetime
+import logging
+import os
+import shutil
+import time
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, Optional, Set, Tuple
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import func, select
+from db.db import get_db, execute_write
+from db.Tables import clips, profile_files, profile_transcripts, profiles
+from profile_manager import ensure_profile_exists
+from utils.blob_store import BlobStore
+from utils.metrics_utils import record_cache
+
+logger = logging.getLogger(__name__)
+
+BASE_MEDIA_DIR = Path("media_files")
+# Seconds between janitor runs
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL_SECONDS", "900"))
+# Leftover per-request temp directories older than this are removed
+TEMP_MAX_AGE = float(os.getenv("TEMP_MAX_AGE_SECONDS", str(6 * 3600)))
+# Anki packages and compact renditions are caches, rebuilt on demand
+ANKI_CACHE_MAX_AGE = float(os.getenv("ANKI_CACHE_MAX_AGE_SECONDS",
+                                     str(7 * 86400)))
+# Derived outputs (converted video, transcripts) reused for duplicates
+DERIVED_MAX_AGE = float(os.getenv("DERIVED_MAX_AGE_SECONDS",
+                                  str(30 * 86400)))
+# Files / rows younger than this may belong to an in-flight request
+ORPHAN_GRACE = float(os.getenv("ORPHAN_GRACE_SECONDS", "3600"))
+# 'report' only logs what reconciling would delete, 'delete' deletes it
+JANITOR_RECONCILE = os.getenv("JANITOR_RECONCILE", "report").lower()
+# Reconciling deletes nothing when more than this fraction of the files
+# (or rows) would go, e.g. with an empty or wrong database, or media
+# volume not mounted
+JANITOR_MAX_ORPHAN_RATIO = float(os.getenv("JANITOR_MAX_ORPHAN_RATIO",
+                                           "0.5"))
+# Orphans listed individually in the reconcile log
+JANITOR_LOG_LIMIT = 50
+# Files stored before content hashing, hashed and deduplicated per run
+HASH_BACKFILL_BATCH = int(os.getenv("HASH_BACKFILL_BATCH", "200"))
+# Per-profile storage limit in bytes, 0 disables quotas
+PROFILE_QUOTA_BYTES = int(os.getenv("PROFILE_QUOTA_BYTES", "0"))
+# How long a computed profile usage is trusted
+USAGE_CACHE_TTL = float(os.getenv("USAGE_CACHE_TTL_SECONDS", "60"))
+
+TEMP_OPERATION_PREFIXES = ("gen_srt_", "convert_mp4_", "transcribe_audio_")
+PROFILE_SUBDIRS = ("audios", "converted", "clips", "subtitles")
+
+
+def dir_size(path: Path) -> int:
+    """
+    Total size of regular files below `path` (symlinks not followed).
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _age(path: Path, now: float) -> float:
+    """
+    Seconds since `path` last changed. ctime, not mtime: hard linking
+    a file to an old blob (BlobStore.link) keeps the blob's mtime but
+    updates the ctime, so a just-stored file never looks old.
+    """
+    try:
+        return now - path.lstat().st_ctime
+    except OSError:
+        return 0.0
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.lstat().st_size
+    except OSError:
+        return 0
+
+
+def _remove(path: Path) -> int:
+    """
+    Delete a file or directory tree, returning the bytes freed.
+    """
+    try:
+        if path.is_dir() and not path.is_symlink():
+            size = dir_size(path)
+            shutil.rmtree(path)
+        else:
+            size = path.lstat().st_size
+            path.unlink()
+        return size
+    except OSError as e:
+        logger.error(f"Janitor could not remove {path}: {e}")
+        return 0
+
+
+class StorageJanitor:
+    """
+    Periodic housekeeping of `media_files`: sweeps leftovers from temp,
+    reconciles `profile_files` rows with the files on disk, tracks
+    per-profile usage for quotas and reports disk-usage metrics.
+    """
+    def __init__(self,
+                 base_dir: Path = BASE_MEDIA_DIR,
+                 interval: float = JANITOR_INTERVAL,
+                 quota_bytes: int = PROFILE_QUOTA_BYTES,
+                 reconcile_mode: str = JANITOR_RECONCILE,
+                 max_orphan_ratio: float = JANITOR_MAX_ORPHAN_RATIO):
+        if reconcile_mode not in ("report", "delete"):
+            raise ValueError(f"Unknown JANITOR_RECONCILE: {reconcile_mode}")
+        self.base_dir = Path(base_dir)
+        self.profiles_dir = self.base_dir / "profiles"
+        self.temp_dir = self.base_dir / "temp"
+        self.blobs = BlobStore(self.base_dir / "blobs")
+        self.interval = interval
+        self.quota_bytes = quota_bytes
+        self.reconcile_mode = reconcile_mode
+        self.max_orphan_ratio = max_orphan_ratio
+        self.last_run: Dict = {}
+        self._usage: Dict[str, Tuple[int, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    # --- Temp sweep ---
+    def sweep_temp(self,
+                   known_profiles: Optional[Set[str]] = None,
+                   now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Remove abandoned request directories, expired Anki caches,
+        stray `nogpt.srt` files and temp data of unknown profiles.
+        """
+        now = time.time() if now is None else now
+        removed, freed = 0, 0
+        if not self.temp_dir.exists():
+            return {"removed": 0, "freed_bytes": 0}
+        for entry in self.temp_dir.iterdir():
+            if (entry.is_dir() and entry.name.startswith(
+                    TEMP_OPERATION_PREFIXES)
+                    and _age(entry, now) > TEMP_MAX_AGE):
+                freed += _remove(entry)
+                removed += 1
+        temp_profiles = self.temp_dir / "profiles"
+        if temp_profiles.exists():
+            for prof in temp_profiles.iterdir():
+                if known_profiles is not None and \
+                        prof.name not in known_profiles:
+                    freed += _remove(prof)
+                    removed += 1
+                    continue
+                anki_dir = prof / "anki"
+                for pkg in anki_dir.glob("*.apkg"):
+                    if _age(pkg, now) > ANKI_CACHE_MAX_AGE:
+                        freed += _remove(pkg)
+                        removed += 1
+                for tmp in anki_dir.glob("**/.*.tmp"):
+                    if _age(tmp, now) > TEMP_MAX_AGE:
+                        freed += _remove(tmp)
+                        removed += 1
+                for rendition in anki_dir.glob("media/*"):
+                    if rendition.is_file() and \
+                            _age(rendition, now) > ANKI_CACHE_MAX_AGE:
+                        freed += _remove(rendition)
+                        removed += 1
+        for nogpt in self.temp_dir.rglob("nogpt.srt"):
+            if _age(nogpt, now) > TEMP_MAX_AGE:
+                freed += _remove(nogpt)
+                removed += 1
+        return {"removed": removed, "freed_bytes": freed}
+
+    # --- Reconciliation ---
+    def _profile_files_on_disk(self, now: float) -> Dict[str, Path]:
+        """
+        Stored profile files older than the grace period, by relative
+        path.
+        """
+        found: Dict[str, Path] = {}
+        if not self.profiles_dir.exists():
+            return found
+        for prof in self.profiles_dir.iterdir():
+            for sub in PROFILE_SUBDIRS:
+                folder = prof / sub
+                if not folder.is_dir():
+                    continue
+                for f in folder.iterdir():
+                    if f.is_file() and _age(f, now) > ORPHAN_GRACE:
+                        rel = f.relative_to(self.base_dir).as_posix()
+                        found[rel] = f
+        return found
+
+    async def _drop_row(self, row) -> None:
+        """
+        Delete a profile_files row whose file is gone, along with the
+        records that only make sense with the file.
+        """
+        from processing.lemma_index import lemma_index
+        await execute_write(profile_files.delete().where(
+            profile_files.c.id == row.id))
+        if row.file_type == "video_clip":
+            db = await get_db()
+            clip_r = await db.fetch_one(clips.select().where(
+                clips.c.video_clip_path == row.file_path))
+            if clip_r:
+                await execute_write(clips.delete().where(
+                    clips.c.id == clip_r.id))
+                await lemma_index.safe_remove("clip", clip_r.id)
+        elif row.file_type == "audio_source":
+            await execute_write(profile_transcripts.update().where(
+                profile_transcripts.c.audio_file_path == row.file_path
+                ).values(audio_file_path=None))
+        elif row.file_type == "srt":
+            await lemma_index.safe_remove("srt", row.id)
+
+    def _hold_reason(self, n_profiles: int, n_rows: int, missing: int,
+                     n_files: int, orphans: int) -> Optional[str]:
+        """
+        Why reconciling must not delete anything this run, if it must
+        not: the database looks empty or unrelated to the media on disk.
+        """
+        if self.reconcile_mode != "delete":
+            return "report mode (JANITOR_RECONCILE=report)"
+        if not n_profiles:
+            return "database has no profiles"
+        if n_rows and missing / n_rows > self.max_orphan_ratio:
+            return (f"{missing} of {n_rows} records have no file, "
+                    "more than JANITOR_MAX_ORPHAN_RATIO")
+        if n_files and orphans / n_files > self.max_orphan_ratio:
+            return (f"{orphans} of {n_files} files are unreferenced, "
+                    "more than JANITOR_MAX_ORPHAN_RATIO")
+        return None
+
+    async def reconcile(self) -> Dict:
+        """
+        Find rows whose file is missing and files no row references.
+        Both sides skip anything younger than the grace period so
+        in-flight uploads are never touched.
+
+        Everything found is logged first. It is only deleted with
+        JANITOR_RECONCILE=delete and when the result looks plausible
+        (see _hold_reason), so an empty or wrong database can't wipe
+        the media library.
+        """
+        now = time.time()
+        cutoff = datetime.datetime.now() - datetime.timedelta(
+            seconds=ORPHAN_GRACE)
+        db = await get_db()
+        n_profiles = await db.fetch_val(
+            select(func.count()).select_from(profiles))
+        rows = await db.fetch_all(profile_files.select())
+        on_disk = await asyncio.to_thread(self._profile_files_on_disk, now)
+        referenced = {PurePosixPath(r.file_path).as_posix() for r in rows}
+        missing = []
+        for row in rows:
+            if row.created_at and row.created_at > cutoff:
+                continue
+            exists = await asyncio.to_thread(
+                (self.base_dir / row.file_path).exists)
+            if not exists:
+                missing.append(row)
+        orphans = [p for rel, p in on_disk.items() if rel not in referenced]
+        orphan_bytes = await asyncio.to_thread(
+            lambda: sum(_size(p) for p in orphans))
+        held = self._hold_reason(n_profiles, len(rows), len(missing),
+                                 len(on_disk), len(orphans))
+        for row in missing[:JANITOR_LOG_LIMIT]:
+            logger.warning(f"Janitor: file missing for record {row.id} "
+                           f"({row.file_path})")
+        if len(missing) > JANITOR_LOG_LIMIT:
+            logger.warning(f"Janitor: ... and "
+                           f"{len(missing) - JANITOR_LOG_LIMIT} more records")
+        for path in orphans[:JANITOR_LOG_LIMIT]:
+            logger.warning(f"Janitor: unreferenced file {path}")
+        if len(orphans) > JANITOR_LOG_LIMIT:
+            logger.warning(f"Janitor: ... and "
+                           f"{len(orphans) - JANITOR_LOG_LIMIT} more files")
+        result = {"mode": self.reconcile_mode,
+                  "missing_files": len(missing),
+                  "orphan_files": len(orphans),
+                  "orphan_bytes": orphan_bytes,
+                  "dropped_rows": 0,
+                  "removed_files": 0,
+                  "freed_bytes": 0,
+                  "held": held}
+        if not missing and not orphans:
+            return result
+        if held:
+            log = logger.info if self.reconcile_mode == "report" \
+                else logger.error
+            log(f"Janitor: keeping {len(missing)} record(s) without file "
+                f"and {len(orphans)} unreferenced file(s): {held}")
+            return result
+        for row in missing:
+            logger.warning(f"Janitor: dropping record {row.id}")
+            await self._drop_row(row)
+            result["dropped_rows"] += 1
+        for path in orphans:
+            logger.warning(f"Janitor: removing unreferenced file {path}")
+            result["freed_bytes"] += await asyncio.to_thread(_remove, path)
+            result["removed_files"] += 1
+        return result
+
+    # --- Blob store ---
+    async def backfill_hashes(self,
+                              limit: int = HASH_BACKFILL_BATCH) -> int:
+        """
+        Hash profile files saved before content hashing existed and
+        bring them into the blob store, so existing libraries are
+        deduplicated too. At most `limit` files per run, as hashing
+        reads them in full. Returns the number of files hashed.
+        """
+        db = await get_db()
+        rows = await db.fetch_all(
+            select(profile_files.c.id, profile_files.c.file_path).where(
+                profile_files.c.content_hash.is_(None)))
+        hashed = 0
+        for row in rows:
+            if hashed >= limit:
+                break
+            path = self.base_dir / row.file_path
+            if not await asyncio.to_thread(path.is_file):
+                # Reported by reconcile
+                continue
+            digest = await asyncio.to_thread(self.blobs.adopt, path)
+            await execute_write(profile_files.update().where(
+                profile_files.c.id == row.id).values(content_hash=digest))
+            hashed += 1
+        if hashed:
+            logger.info(f"Janitor: hashed {hashed} of {len(rows)} "
+                        "unhashed profile file(s)")
+        return hashed
+
+    def collect_blobs(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Forget expired derived outputs, then delete blobs nothing links
+        to any more.
+        """
+        now = time.time() if now is None else now
+        pruned = self.blobs.prune_derived(DERIVED_MAX_AGE, now)
+        return {"derived_pruned": pruned,
+                "freed_bytes": self.blobs.collect_garbage()}
+
+    # --- Usage / quotas ---
+    def profile_usage(self, profile_id: str,
+                      max_age: float = USAGE_CACHE_TTL) -> int:
+        """
+        Bytes stored for a profile (saved media plus its temp data).
+        """
+        cached = self._usage.get(profile_id)
+        hit = bool(cached) and time.monotonic() - cached[1] < max_age
+        if max_age:
+            record_cache("profile_usage", hit)
+        if hit:
+            return cached[0]
+        used = (dir_size(self.profiles_dir / profile_id) +
+                dir_size(self.temp_dir / "profiles" / profile_id))
+        self._usage[profile_id] = (used, time.monotonic())
+        return used
+
+    def _all_profile_usage(self, profile_ids: Iterable[str]) -> Dict:
+        return {pid: self.profile_usage(pid, max_age=0)
+                for pid in profile_ids}
+
+    def metrics(self) -> Dict:
+        """
+        Disk and media usage snapshot; walks the media tree.
+        """
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        disk = shutil.disk_usage(self.base_dir)
+        profile_ids = ([p.name for p in self.profiles_dir.iterdir()
+                        if p.is_dir()]
+                       if self.profiles_dir.exists() else [])
+        usage = self._all_profile_usage(profile_ids)
+        return {
+            "disk": {"total_bytes": disk.total,
+                     "used_bytes": disk.used,
+                     "free_bytes": disk.free},
+            "media": {"profiles_bytes": dir_size(self.profiles_dir),
+                      "temp_bytes": dir_size(self.temp_dir),
+                      "blobs_bytes": dir_size(self.blobs.objects_dir)},
+            "quota_bytes": self.quota_bytes or None,
+            "profiles": sorted(({"profile_id": pid, "bytes": used}
+                                for pid, used in usage.items()),
+                               key=lambda p: p["bytes"], reverse=True),
+            "janitor": self.last_run,
+        }
+
+    # --- Scheduling ---
+    async def run_once(self) -> Dict:
+        async with self._lock:
+            t0 = time.perf_counter()
+            db = await get_db()
+            known = {r.id for r in await db.fetch_all(profiles.select())}
+            # No profiles at all is more likely an empty database than
+            # no users: keep their temp data
+            swept = await asyncio.to_thread(self.sweep_temp, known or None)
+            reconciled = await self.reconcile()
+            hashed = await self.backfill_hashes()
+            blobs = await asyncio.to_thread(self.collect_blobs)
+            blobs["hashed_files"] = hashed
+            self._usage.clear()
+            self.last_run = {
+                "finished_at": datetime.datetime.now().isoformat(
+                    timespec="seconds"),
+                "duration_s": round(time.perf_counter() - t0, 3),
+                "temp": swept,
+                "reconcile": reconciled,
+                "blobs": blobs,
+            }
+            logger.info(f"Storage janitor run: {self.last_run}")
+            return self.last_run
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Storage janitor run failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+storage_janitor = StorageJanitor()
+
+
+async def enforce_quota(request: Request,
+                        profile_id: str = Depends(ensure_profile_exists)
+                        ) -> str:
+    """
+    Dependency for upload endpoints: rejects the request with 507 when
+    the profile is (or would be, by Content-Length) over its quota.
+    """
+    quota = storage_janitor.quota_bytes
+    if not quota:
+        return profile_id
+    used = await asyncio.to_thread(storage_janitor.profile_usage, profile_id)
+    incoming = int(request.headers.get("content-length") or 0)
+    if used + incoming > quota:
+        raise HTTPException(
+            status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+            detail=(f"Storage quota exceeded: {used} of {quota} bytes "
+                    "used. Delete saved files to free space."))
+    return profile_id
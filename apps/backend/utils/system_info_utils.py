@@ -2,8 +2,14 @@ from __future__ import annotations
 import os
 import platform
 import socket
+import threading
 import datetime
-from typing import Any, Dict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional
+from processing.whisper_config import available_cores
+from utils.metrics_utils import queue_depths
+from utils.readiness_utils import readiness
 
 
 def gpu_available() -> Dict[bool, str]:
@@ -16,24 +22,122 @@ def gpu_available() -> Dict[bool, str]:
             idx = torch.cuda.current_device()
             return {"available": True,
                     "name": torch.cuda.get_device_name(idx),
+                    "count": torch.cuda.device_count()
                     }
         else:
             return {'available': False,
-                    "name": ""}
-    except ImportError:
+                    "name": "",
+                    "count": 0}
+    except Exception:
+        # Not installed (CPU image) or a broken driver
         return {'available': False,
-                'name': ""}
+                'name': "",
+                "count": 0}
 
 
-def get_system_info() -> Dict[str, Any]:
-    info: Dict[str, Any] = {
-        "time": datetime.datetime.now().isoformat(timespec="seconds") + "Z",
+def _meminfo() -> Dict[str, int]:
+    """
+    /proc/meminfo in bytes (empty outside Linux).
+    """
+    try:
+        lines = Path("/proc/meminfo").read_text().splitlines()
+    except OSError:
+        return {}
+    info = {}
+    for line in lines:
+        key, value = line.split(":", 1)
+        info[key] = int(value.split()[0]) * 1024
+    return info
+
+
+def _cgroup_memory_limit() -> Optional[int]:
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        return None if limit == "max" else int(limit)
+    except (OSError, ValueError):
+        return None
+
+
+def _mb(n: Optional[int]) -> Optional[float]:
+    return round(n / 2**20, 1) if n is not None else None
+
+
+# lru_cache does not stop concurrent first calls from all probing
+_hardware_lock = threading.Lock()
+
+
+def hardware_snapshot() -> Dict[str, Any]:
+    """
+    Hardware inventory, probed once per process: the GPU probe imports
+    torch and initializes CUDA, far too slow for a polled endpoint.
+    Callers arriving during the probe wait for its result.
+    """
+    with _hardware_lock:
+        return _probe_hardware()
+
+
+@lru_cache(maxsize=1)
+def _probe_hardware() -> Dict[str, Any]:
+    gpu = gpu_available()
+    return {
         "hostname": socket.gethostname(),
         "platform": platform.platform(aliased=True, terse=True),
         "python": platform.python_version(),
         "cpu_cores": os.cpu_count(),
-        "gpu_available": gpu_available()['available'],
-        'gpu_name': gpu_available()["name"]
+        "available_cores": available_cores(),
+        "memory_total_mb": _mb(_meminfo().get("MemTotal")),
+        "memory_limit_mb": _mb(_cgroup_memory_limit()),
+        "gpu_available": gpu['available'],
+        'gpu_name': gpu["name"],
+        "gpu_count": gpu["count"],
+        "probed_at": datetime.datetime.now().isoformat(timespec="seconds")
+    }
+
+
+def hardware_probed() -> bool:
+    return _probe_hardware.cache_info().currsize > 0
+
+
+def hardware_probing() -> bool:
+    return _hardware_lock.locked() and not hardware_probed()
+
+
+def dynamic_info() -> Dict[str, Any]:
+    """
+    Current load, memory, internal queue depths and model readiness.
+    Only reads counters and /proc, cheap enough for every probe.
+    """
+    try:
+        load = [round(v, 2) for v in os.getloadavg()]
+    except OSError:
+        load = None
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+        rss = pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        rss = None
+    return {
+        "load_average": load,
+        "memory_available_mb": _mb(_meminfo().get("MemAvailable")),
+        "process_rss_mb": _mb(rss),
+        "queues": queue_depths(),
+        "ready": readiness.ready,
+        "models": {name: component["state"] for name, component
+                   in readiness.status()["components"].items()},
+    }
+
+
+def get_system_info() -> Dict[str, Any]:
+    """
+    The hardware inventory, or `"hardware": "probing"` until it is
+    known (never probes itself), plus the dynamic section.
+    """
+    hardware = _probe_hardware() if hardware_probed() \
+        else {"hardware": "probing"}
+    info: Dict[str, Any] = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds") + "Z",
+        **hardware,
+        "dynamic": dynamic_info()
     }
 
     return info
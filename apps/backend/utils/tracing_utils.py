@@ -0,0 +1,406 @@
+"""
+Minimal OpenTelemetry-compatible request tracing.
+
+Spans are kept in a context variable, so they nest across `await`s and
+into `asyncio.to_thread` workers (which copy the context), and the
+current span is passed to subprocesses through the `TRACEPARENT`
+environment variable. Finished spans are exported in batches as OTLP
+JSON, either appended to a JSON Lines file (one export request per
+line, the format of the collector's `otlpjsonfile` receiver) or POSTed
+to an OTLP/HTTP endpoint.
+
+Configuration:
+    TRACING_EXPORTER     none (default) | json | otlp
+    TRACE_FILE           JSON Lines file for `json` (data/traces.jsonl)
+    OTEL_EXPORTER_OTLP_ENDPOINT   collector URL for `otlp`
+                                  (http://localhost:4318)
+    OTEL_SERVICE_NAME    service.name resource attribute
+    TRACE_SAMPLE_RATIO   fraction of root spans recorded (1.0)
+
+Print a file's traces as trees with:
+    python -m utils.tracing_utils data/traces.jsonl
+"""
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACE_FILE = Path(os.getenv("TRACE_FILE", "data/traces.jsonl"))
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT",
+                          "http://localhost:4318").rstrip("/")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "mirumoji-backend")
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+# OTLP span kinds
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+
+
+class Span:
+    """
+    A timed operation within a trace.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str,
+                 parent_id: Optional[str] = None,
+                 kind: int = KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes or {})
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(k, v)
+                           for k, v in self.attributes.items()
+                           if v is not None],
+            "status": ({"code": 2, "message": self.error}
+                       if self.error else {"code": 1}),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """
+    (trace_id, parent span_id, sampled) from a W3C traceparent.
+    """
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class JsonFileExporter:
+    def __init__(self, path: Path = TRACE_FILE):
+        self.path = Path(path)
+
+    def export(self, payload: Dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+
+
+class OtlpHttpExporter:
+    def __init__(self, endpoint: str = OTLP_ENDPOINT, timeout: float = 5):
+        self.url = f"{endpoint}/v1/traces"
+        self.timeout = timeout
+
+    def export(self, payload: Dict) -> None:
+        req = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            resp.read()
+
+
+class Tracer:
+    """
+    Creates spans and exports finished ones from a background thread,
+    so recording a span never blocks on I/O.
+    """
+    def __init__(self,
+                 exporter=None,
+                 sample_ratio: float = TRACE_SAMPLE_RATIO,
+                 max_batch: int = 256,
+                 flush_interval: float = 2.0,
+                 max_queue: int = 8192):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(max_queue)
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._current: ContextVar[Optional[Span]] = ContextVar(
+            "current_span", default=None)
+        # Set for the rest of a trace that was not sampled
+        self._unsampled: ContextVar[bool] = ContextVar(
+            "trace_unsampled", default=False)
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def current_span(self) -> Optional[Span]:
+        return self._current.get()
+
+    def traceparent(self) -> Optional[str]:
+        span = self._current.get()
+        return span.traceparent if span else None
+
+    def subprocess_env(self, env: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Environment for a child process carrying the current span as
+        TRACEPARENT, or `env` unchanged outside a trace.
+        """
+        parent = self.traceparent()
+        if parent is None:
+            return env
+        env = dict(os.environ if env is None else env)
+        env["TRACEPARENT"] = parent
+        return env
+
+    @contextmanager
+    def span(self, name: str,
+             kind: int = KIND_INTERNAL,
+             traceparent: Optional[str] = None,
+             child_only: bool = False,
+             **attributes):
+        """
+        Record the enclosed block as a span, child of the current span.
+        A root span may continue a remote trace given its `traceparent`;
+        `child_only` spans are skipped outside a trace instead.
+        Yields the span, or None when tracing is off or not sampled.
+        """
+        if not self.enabled or self._unsampled.get():
+            yield None
+            return
+        parent = self._current.get()
+        if parent is None and child_only:
+            yield None
+            return
+        unsampled_token = None
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, kind,
+                        attributes)
+        else:
+            remote = parse_traceparent(traceparent)
+            if remote:
+                trace_id, parent_id, sampled = remote
+            else:
+                trace_id, parent_id = secrets.token_hex(16), None
+                sampled = random.random() < self.sample_ratio
+            if not sampled:
+                unsampled_token = self._unsampled.set(True)
+                try:
+                    yield None
+                finally:
+                    self._unsampled.reset(unsampled_token)
+                return
+            span = Span(name, trace_id, parent_id, kind, attributes)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            self._current.reset(token)
+            self._enqueue(span)
+
+    def record(self, name: str, start_ns: int,
+               error: Optional[str] = None, **attributes) -> None:
+        """
+        Record an already finished operation, started at `start_ns`
+        (time.time_ns()), as a child of the current span. For work that
+        cannot be enclosed in `span`, such as a generator consumed
+        from other threads.
+        """
+        if not self.enabled or self._unsampled.get():
+            return
+        parent = self._current.get()
+        if parent is None:
+            if random.random() >= self.sample_ratio:
+                return
+            span = Span(name, secrets.token_hex(16), None,
+                        attributes=attributes)
+        else:
+            span = Span(name, parent.trace_id, parent.span_id,
+                        attributes=attributes)
+        span.start_ns = start_ns
+        span.end_ns = time.time_ns()
+        span.error = error
+        self._enqueue(span)
+
+    # --- Export ---
+    def _enqueue(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            return
+        if self._queue.qsize() >= self.max_batch:
+            self._wakeup.set()
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(
+                        target=self._run, name="trace-exporter",
+                        daemon=True)
+                    self._worker.start()
+
+    def _export(self, batch: List[Span]) -> None:
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [
+                _otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "mirumoji"},
+                            "spans": [s.to_otlp() for s in batch]}],
+        }]}
+        try:
+            self.exporter.export(payload)
+        except Exception as e:
+            logger.warning(f"Dropped {len(batch)} spans, export failed: {e}")
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Export every span finished so far. Returns once they are
+        written, including a batch the background thread was exporting.
+        """
+        with self._export_lock:
+            while True:
+                batch: List[Span] = []
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                self._export(batch)
+
+
+def _exporter_from_env():
+    if TRACING_EXPORTER == "json":
+        return JsonFileExporter()
+    if TRACING_EXPORTER == "otlp":
+        return OtlpHttpExporter()
+    if TRACING_EXPORTER not in ("", "none"):
+        logger.warning(f"Unknown TRACING_EXPORTER '{TRACING_EXPORTER}', "
+                       "tracing disabled")
+    return None
+
+
+tracer = Tracer(_exporter_from_env())
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a server span per HTTP request, continuing
+    the caller's trace when a `traceparent` header is sent.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(b"traceparent", b"").decode("latin-1")
+        method = scope.get("method", "")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and span:
+                span.set_attribute("http.response.status_code",
+                                   message["status"])
+                if message["status"] >= 500:
+                    span.error = f"HTTP {message['status']}"
+            await send(message)
+
+        with tracer.span(f"{method} {scope['path']}", kind=KIND_SERVER,
+                         traceparent=incoming or None,
+                         **{"http.request.method": method,
+                            "url.path": scope["path"]}) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if span and route is not None and \
+                        getattr(route, "path", None):
+                    # Name by route template, as OpenTelemetry does
+                    span.name = f"{method} {route.path}"
+                    span.set_attribute("http.route", route.path)
+
+
+# --- Offline inspection ---
+def _print_trees(path: Path) -> None:
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for rs in json.loads(line).get("resourceSpans", []):
+                for ss in rs.get("scopeSpans", []):
+                    spans.extend(ss.get("spans", []))
+    children: Dict[Optional[str], List[Dict]] = {}
+    ids = {s["spanId"] for s in spans}
+    for s in spans:
+        parent = s.get("parentSpanId")
+        children.setdefault(parent if parent in ids else None,
+                            []).append(s)
+
+    def show(span: Dict, depth: int) -> None:
+        ms = (int(span["endTimeUnixNano"]) -
+              int(span["startTimeUnixNano"])) / 1e6
+        failed = " !" if span.get("status", {}).get("code") == 2 else ""
+        print(f"{'  ' * depth}{span['name']}  {ms:.1f} ms{failed}")
+        for child in sorted(children.get(span["spanId"], []),
+                            key=lambda c: int(c["startTimeUnixNano"])):
+            show(child, depth + 1)
+
+    for root in sorted(children.get(None, []),
+                       key=lambda c: int(c["startTimeUnixNano"])):
+        print(f"trace {root['traceId']}")
+        show(root, 1)
+
+
+if __name__ == "__main__":
+    _print_trees(Path(sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE))
@@ -19,7 +19,16 @@ export const getFileExtension = (filenameOrUrl: string | undefined) => {
 };
 
 export const formatStaticUrl = (API_BASE: string, url: string) => {
-    return `${API_BASE}${url}`;
+    // Media is authorized per profile, and <video> / <a> can't send the
+    // X-Profile-ID header
+    const profileId = localStorage.getItem("currentProfileId");
+    if (!profileId || !url.startsWith("/media/")) {
+        return `${API_BASE}${url}`;
+    }
+    const separator = url.includes("?") ? "&" : "?";
+    return `${API_BASE}${url}${separator}profile_id=${encodeURIComponent(
+        profileId
+    )}`;
 };
 
 export const truncateText = (text: string | undefined, maxLength = 50) => {